@@ -11,6 +11,7 @@ from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RL
 from reportlab.lib.enums import TA_JUSTIFY, TA_CENTER
 from reportlab.lib.colors import HexColor
 from dotenv import load_dotenv
+from content_archive import archive_document
 
 # Load environment variables
 load_dotenv()
@@ -274,6 +275,9 @@ def create_pdf_blog(blog_text, image_path, city, current_weather, monthly_data):
 
     # Build PDF
     doc.build(story)
+
+    # Archive the blog so past bulletins stay searchable
+    archive_document("blog", city, blog_text, title=title, file=filename)
     return filename
 
 
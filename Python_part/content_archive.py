@@ -0,0 +1,331 @@
+import os
+import re
+import json
+import math
+import uuid
+import heapq
+import threading
+from collections import Counter
+from datetime import datetime
+
+# Where generated blogs and podcast scripts are archived
+ARCHIVE_DIR = os.getenv("CONTENT_ARCHIVE_DIR", "content_archive")
+# Documents held in the delta segment before a background merge
+MERGE_THRESHOLD = int(os.getenv("CONTENT_ARCHIVE_MERGE_THRESHOLD", "50"))
+# Segments kept on disk before they are merged into one
+MAX_SEGMENTS = 8
+
+MANIFEST_FILE = "manifest.json"
+DELTA_FILE = "delta.jsonl"
+MERGING_FILE = "delta.merging.jsonl"
+
+STOP_WORDS = {
+    "the", "and", "for", "with", "that", "this", "are", "was", "from", "its", "our", "you",
+    "your", "will", "but", "not", "has", "have", "been", "into", "over", "than", "then",
+    "there", "their", "they", "what", "when", "which", "while", "today", "also", "just"
+}
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+
+def tokenize(text):
+    """Lowercase word tokens, without stop words"""
+    return [t for t in re.findall(r"[a-z0-9]+", text.lower()) if len(t) > 1 and t not in STOP_WORDS]
+
+
+def _write_json(path, data):
+    """Write JSON so readers never see a half-written file"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """
+    Inverted index over a fixed set of documents.
+
+    Postings map each term to [doc, term frequency] pairs. Segments only
+    store raw counts; BM25 IDF and average length are computed at query
+    time over all segments, so adding documents never refits anything.
+    """
+
+    def __init__(self, docs=None, lengths=None, postings=None):
+        self.docs = docs or []
+        self.lengths = lengths or []
+        self.postings = postings or {}
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc):
+        local_id = len(self.docs)
+        counts = Counter(tokenize(doc.get("title", "") + " " + doc["text"]))
+        self.docs.append(doc)
+        self.lengths.append(sum(counts.values()))
+        for term, tf in counts.items():
+            self.postings.setdefault(term, []).append([local_id, tf])
+
+    @classmethod
+    def from_documents(cls, docs):
+        segment = cls()
+        for doc in docs:
+            segment.add(doc)
+        return segment
+
+    def to_json(self):
+        return {"docs": self.docs, "lengths": self.lengths, "postings": self.postings}
+
+    @classmethod
+    def from_json(cls, data):
+        return cls(data["docs"], data["lengths"], data["postings"])
+
+
+class ContentArchive:
+    """
+    Append-only searchable archive of generated blogs and podcast scripts.
+
+    New documents are appended to a JSONL log and indexed into an in-memory
+    delta segment, so they are searchable immediately. Once the delta holds
+    MERGE_THRESHOLD documents a background thread writes it out as an
+    immutable segment, folding existing segments in when there are more
+    than MAX_SEGMENTS. Search ranks every segment with BM25.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR, merge_threshold=MERGE_THRESHOLD):
+        self.directory = directory
+        self.merge_threshold = merge_threshold
+        self.segments = []       # list of (filename, Segment)
+        self.merging = None      # delta being written out, still searched
+        self.delta = Segment()
+        self.next_segment = 1
+        self._lock = threading.Lock()
+        self._merge_thread = None
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _load(self):
+        manifest_path = self._path(MANIFEST_FILE)
+        if os.path.exists(manifest_path):
+            with open(manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            self.next_segment = manifest["next_segment"]
+            for name in manifest["segments"]:
+                with open(self._path(name), "r", encoding="utf-8") as f:
+                    self.segments.append((name, Segment.from_json(json.load(f))))
+
+        # Replay logs not yet in a segment; a merge interrupted after writing
+        # its segment leaves documents that are already indexed
+        indexed = {doc["id"] for _, segment in self.segments for doc in segment.docs}
+        for name in (MERGING_FILE, DELTA_FILE):
+            if not os.path.exists(self._path(name)):
+                continue
+            with open(self._path(name), "r", encoding="utf-8") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    try:
+                        doc = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line after a crash
+                    if doc["id"] not in indexed:
+                        self.delta.add(doc)
+                        indexed.add(doc["id"])
+
+        if os.path.exists(self._path(MERGING_FILE)):
+            # Carry the replayed documents into the current log before dropping the old one
+            self._rewrite_delta_log()
+            os.remove(self._path(MERGING_FILE))
+
+    def _rewrite_delta_log(self):
+        """Replace the delta log with the documents now in the delta"""
+        tmp_path = self._path(DELTA_FILE) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for doc in self.delta.docs:
+                f.write(json.dumps(doc) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self._path(DELTA_FILE))
+
+    def __len__(self):
+        with self._lock:
+            return self._count()
+
+    def _count(self):
+        merging = len(self.merging) if self.merging is not None else 0
+        return sum(len(segment) for _, segment in self.segments) + merging + len(self.delta)
+
+    def add(self, kind, city, text, title="", file=None):
+        """Archive one document; it is searchable as soon as this returns"""
+        doc = {
+            "id": uuid.uuid4().hex,
+            "kind": kind,
+            "city": city,
+            "title": title,
+            "text": text,
+            "file": file,
+            "created_at": datetime.now().isoformat(timespec="seconds")
+        }
+        with self._lock:
+            with open(self._path(DELTA_FILE), "a", encoding="utf-8") as f:
+                f.write(json.dumps(doc) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            self.delta.add(doc)
+            should_merge = len(self.delta) >= self.merge_threshold and self.merging is None
+        if should_merge:
+            self.merge_in_background()
+        return doc["id"]
+
+    def merge_in_background(self):
+        """Write the delta out as a segment in a background thread"""
+        with self._lock:
+            if self.merging is not None or not len(self.delta):
+                return None
+            # Freeze the delta; new documents go to a fresh log and delta
+            self.merging, self.delta = self.delta, Segment()
+            os.replace(self._path(DELTA_FILE), self._path(MERGING_FILE))
+            self._merge_thread = threading.Thread(target=self._merge, name="archive-merge", daemon=True)
+            self._merge_thread.start()
+            return self._merge_thread
+
+    def _merge(self):
+        try:
+            with self._lock:
+                segments = list(self.segments)
+            docs = list(self.merging.docs)
+            merged = []
+            if len(segments) + 1 > MAX_SEGMENTS:
+                # Fold every existing segment in with the delta
+                merged = segments
+                docs = [doc for _, segment in segments for doc in segment.docs] + docs
+            segment = Segment.from_documents(docs)
+
+            with self._lock:
+                name = f"segment_{self.next_segment:06d}.json"
+                self.next_segment += 1
+            _write_json(self._path(name), segment.to_json())
+
+            with self._lock:
+                merged_names = {old_name for old_name, _ in merged}
+                self.segments = [entry for entry in self.segments if entry[0] not in merged_names]
+                self.segments.append((name, segment))
+                _write_json(self._path(MANIFEST_FILE), {
+                    "segments": [segment_name for segment_name, _ in self.segments],
+                    "next_segment": self.next_segment
+                })
+                self.merging = None
+                os.remove(self._path(MERGING_FILE))
+            for old_name in merged_names:
+                os.remove(self._path(old_name))
+            print(f"🗂️ Archive merged {len(segment)} documents into {name}")
+        except Exception as e:
+            print(f"⚠️ Archive merge failed: {e}")
+            self._restore_merging()
+
+    def _restore_merging(self):
+        """Put the documents of a failed merge back in front of the delta so a later merge retries them"""
+        with self._lock:
+            if self.merging is None:
+                return  # the segment was already published
+            self.delta = Segment.from_documents(list(self.merging.docs) + list(self.delta.docs))
+            self.merging = None
+            try:
+                self._rewrite_delta_log()
+                os.remove(self._path(MERGING_FILE))
+            except OSError as e:
+                # Both logs are replayed on the next start
+                print(f"⚠️ Could not fold the merge log back into the delta log: {e}")
+
+    def search(self, query, k=10, city=None, kind=None):
+        """BM25 search over every archived document, newest segments included"""
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+        with self._lock:
+            segments = [segment for _, segment in self.segments]
+            if self.merging is not None:
+                segments.append(self.merging)
+            segments.append(self.delta)
+            # The delta grows in place; only read what exists now
+            sizes = [len(segment) for segment in segments]
+
+        total_docs = sum(sizes)
+        if not total_docs:
+            return []
+        avg_length = sum(sum(segment.lengths[:size]) for segment, size in zip(segments, sizes)) / total_docs
+
+        df = Counter()
+        for segment, size in zip(segments, sizes):
+            for term in terms:
+                df[term] += sum(1 for doc_id, _ in segment.postings.get(term, ()) if doc_id < size)
+
+        scored = []
+        for segment, size in zip(segments, sizes):
+            scores = Counter()
+            for term in terms:
+                if not df[term]:
+                    continue
+                idf = math.log(1 + (total_docs - df[term] + 0.5) / (df[term] + 0.5))
+                for doc_id, tf in segment.postings.get(term, ()):
+                    if doc_id >= size:
+                        break
+                    norm = K1 * (1 - B + B * segment.lengths[doc_id] / max(avg_length, 1))
+                    scores[doc_id] += idf * tf * (K1 + 1) / (tf + norm)
+            for doc_id, score in scores.items():
+                doc = segment.docs[doc_id]
+                if city and doc["city"].lower() != city.lower():
+                    continue
+                if kind and doc["kind"] != kind:
+                    continue
+                scored.append((score, doc["created_at"], doc))
+
+        results = []
+        for score, _, doc in heapq.nlargest(k, scored, key=lambda item: (item[0], item[1])):
+            results.append({
+                "id": doc["id"],
+                "kind": doc["kind"],
+                "city": doc["city"],
+                "title": doc["title"],
+                "file": doc["file"],
+                "created_at": doc["created_at"],
+                "score": round(score, 4),
+                "snippet": doc["text"][:300]
+            })
+        return results
+
+    def stats(self):
+        with self._lock:
+            return {
+                "documents": self._count(),
+                "segments": len(self.segments),
+                "delta_documents": len(self.delta),
+                "merging": self.merging is not None
+            }
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """The process-wide archive, opened on first use"""
+    global _archive
+    with _archive_lock:
+        if _archive is None:
+            _archive = ContentArchive()
+        return _archive
+
+
+def archive_document(kind, city, text, title="", file=None):
+    """Archive generated content; failures are reported but never raised"""
+    try:
+        return get_archive().add(kind, city, text, title=title, file=file)
+    except Exception as e:
+        print(f"⚠️ Could not archive {kind} for {city}: {e}")
+        return None
@@ -3,6 +3,7 @@ import random
 import os
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
+from content_archive import archive_document
 
 # Load environment variables
 load_dotenv()
@@ -165,6 +166,9 @@ Generate the podcast script now:"""
         raise RuntimeError("Groq LLaMA request failed")
 
     script = response.json()['choices'][0]['message']['content'].strip()
+
+    # Archive the script so past bulletins stay searchable
+    archive_document("podcast", city, script, title=f"{city} weather podcast, {datetime.now().strftime('%B %d, %Y')}")
     return script
 
 
@@ -14,6 +14,7 @@ from blog_gen2 import (
     generate_image, create_pdf_blog
 )
 from podcast import generate_climate_podcast, generate_weather_script_with_llama, generate_tts
+from content_archive import get_archive
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for React Native
@@ -36,7 +37,8 @@ def home():
             "weather_blog": "/api/weather_blog",
             "tsunami": "/api/tsunami",
             "podcast": "/api/podcast",
-            "weather": "/api/weather"
+            "weather": "/api/weather",
+            "archive_search": "/api/archive/search"
         }
     })
 
@@ -180,6 +182,33 @@ def weather_data():
         print(f"❌ Weather data error: {e}")
         return jsonify({"error": str(e)}), 500
 
+# ==================== ARCHIVE SEARCH ENDPOINT ====================
+@app.route("/api/archive/search", methods=["GET"])
+def archive_search():
+    try:
+        query = request.args.get('q', '').strip()
+        if not query:
+            return jsonify({"error": "No search query provided"}), 400
+
+        city = request.args.get('city')
+        kind = request.args.get('kind')  # "blog" or "podcast"
+        limit = min(int(request.args.get('limit', 10)), 50)
+        print(f"🔎 Searching archive for '{query}'...")
+
+        archive = get_archive()
+        results = archive.search(query, k=limit, city=city, kind=kind)
+
+        return jsonify({
+            "query": query,
+            "results": results,
+            "archive": archive.stats(),
+            "timestamp": datetime.now().isoformat()
+        })
+
+    except Exception as e:
+        print(f"❌ Archive search error: {e}")
+        return jsonify({"error": str(e)}), 500
+
 # ==================== STATIC FILES ====================
 @app.route("/static/<filename>")
 def static_files(filename):
@@ -208,6 +237,7 @@ if __name__ == "__main__":
     print("   • Podcast: http://172.17.132.1:5000/api/podcast")
     print("   • Weather Data: http://172.17.132.1:5000/api/weather")
     print("   • Cities List: http://172.17.132.1:5000/api/cities")
+    print("   • Archive Search: http://172.17.132.1:5000/api/archive/search?q=rain")
     print("=" * 60)
     
     app.run(host="0.0.0.0", port=5000, debug=True)
\ No newline at end of file
@@ -0,0 +1,234 @@
+"""
+Anytime Search for Environmental Law RAG System
+Block-at-a-time scoring with score cutoffs, block-max pruning and a time budget
+"""
+
+import os
+import math
+import time
+import logging
+from typing import Optional, Callable
+from pathlib import Path
+
+import numpy as np
+
+from lazy_imports import lazy_import
+
+sparse = lazy_import("scipy.sparse")
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+BLOCKS_FILENAME = "anytime_blocks.npz"
+
+# Rows per scoring block; small enough that one block fits a tight budget
+DEFAULT_BLOCK_SIZE = 1024
+
+
+class BlockMaxIndex:
+    """
+    Per-block maximum weight of every feature in a TF-IDF matrix.
+
+    The rows are split into consecutive blocks of block_size chunks. For a
+    query with non-negative weights, block_max[b, terms] @ weights bounds
+    the score of every chunk in block b, so blocks can be visited in order
+    of impact and skipped once they cannot beat the current results.
+
+    The maxima are kept sparse (blocks x features, CSC so a query reads only
+    its own columns): a block holds a small part of the vocabulary, and a
+    dense table over 2^20 hashed features would not fit in memory.
+    """
+
+    def __init__(self, block_size: int, block_max, num_rows: int):
+        self.block_size = block_size
+        self.block_max = block_max
+        self.num_rows = num_rows
+
+    @property
+    def num_blocks(self) -> int:
+        return self.block_max.shape[0]
+
+    @classmethod
+    def build(cls, matrix, block_size: int = DEFAULT_BLOCK_SIZE) -> "BlockMaxIndex":
+        """Block maxima of a dense or sparse matrix, one block of rows in memory at a time."""
+        num_rows, num_features = matrix.shape
+        rows = []
+        for start in range(0, num_rows, block_size):
+            block = matrix[start:start + block_size]
+            if hasattr(block, 'tocsr'):
+                rows.append(sparse.csr_matrix(block.max(axis=0), dtype=np.float32))
+            else:
+                rows.append(sparse.csr_matrix(np.asarray(block).max(axis=0, keepdims=True), dtype=np.float32))
+        if rows:
+            block_max = sparse.vstack(rows, format="csc")
+        else:
+            block_max = sparse.csc_matrix((0, num_features), dtype=np.float32)
+        return cls(block_size, block_max, num_rows)
+
+    def matches(self, matrix) -> bool:
+        """Whether this index was built for a matrix of this shape."""
+        return (self.num_rows == matrix.shape[0]
+                and self.block_max.shape == (math.ceil(self.num_rows / self.block_size), matrix.shape[1]))
+
+    def upper_bounds(self, query_vector) -> np.ndarray:
+        """Highest score any chunk of each block can reach for a (1, n_features) sparse query."""
+        return self.block_max[:, query_vector.indices] @ query_vector.data
+
+    def save(self, directory: Path):
+        """Write the maxima to a temporary file and rename it, so readers never see a partial file."""
+        path = Path(directory) / BLOCKS_FILENAME
+        tmp_path = path.with_name(path.name + ".tmp")
+        with open(tmp_path, 'wb') as f:
+            np.savez(
+                f,
+                block_size=self.block_size,
+                num_rows=self.num_rows,
+                shape=np.array(self.block_max.shape),
+                data=self.block_max.data,
+                indices=self.block_max.indices,
+                indptr=self.block_max.indptr
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["BlockMaxIndex"]:
+        path = Path(directory) / BLOCKS_FILENAME
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if 'indptr' not in data:
+                # Dense maxima from before they were stored sparse; rebuilt by the caller
+                return None
+            block_max = sparse.csc_matrix((data['data'], data['indices'], data['indptr']),
+                                          shape=tuple(data['shape']))
+            return cls(int(data['block_size']), block_max, int(data['num_rows']))
+
+    @classmethod
+    def load_or_build(cls, directory: Path, matrix, save: bool = True) -> "BlockMaxIndex":
+        """
+        Saved block maxima for this matrix, or built if missing or stale.
+
+        Builds write the maxima with the index; this fallback covers older
+        indexes and only saves when the directory may be written (save=False
+        for a published snapshot).
+        """
+        index = cls.load(directory)
+        if index is not None and index.matches(matrix):
+            return index
+        index = cls.build(matrix)
+        logger.info(f"Built block-max index with {index.num_blocks} blocks of {index.block_size} chunks")
+        if save:
+            try:
+                index.save(directory)
+            except OSError as e:
+                logger.warning(f"Could not save block-max index: {e}")
+        return index
+
+    @staticmethod
+    def remove(directory: Path):
+        """Delete saved block maxima, e.g. when the TF-IDF matrix is rebuilt."""
+        (Path(directory) / BLOCKS_FILENAME).unlink(missing_ok=True)
+
+
+class AnytimeResult:
+    """Best chunks found by an anytime search."""
+
+    def __init__(self, indices: np.ndarray, scores: np.ndarray, truncated: bool,
+                 blocks_scored: int, blocks_total: int, rows_scored: int):
+        self.indices = indices
+        self.scores = scores
+        self.truncated = truncated
+        self.blocks_scored = blocks_scored
+        self.blocks_total = blocks_total
+        self.rows_scored = rows_scored
+
+
+def matrix_block_scorer(matrix, query_vector) -> Callable[[int, int], np.ndarray]:
+    """Scores of rows [start, end) of a row-normalized TF-IDF matrix, dense or sparse."""
+    if hasattr(matrix, 'tocsr'):
+        column = query_vector.T
+        return lambda start, end: (matrix[start:end] @ column).toarray().ravel()
+    # Only the query's columns of the block are read, as in a full search
+    return lambda start, end: np.asarray(matrix[start:end, query_vector.indices] @ query_vector.data).ravel()
+
+
+def anytime_search(score_block: Callable[[int, int], np.ndarray],
+                   num_rows: int,
+                   k: int,
+                   block_size: int = DEFAULT_BLOCK_SIZE,
+                   upper_bounds: Optional[np.ndarray] = None,
+                   min_score: Optional[float] = None,
+                   deadline_ms: Optional[float] = None,
+                   allowed: Optional[np.ndarray] = None) -> AnytimeResult:
+    """
+    Top-k search that scores one block of rows at a time.
+
+    Blocks are visited in descending order of their upper bound when bounds
+    are given (impact order), otherwise in row order. The search stops
+    early, with exact results, once the next block's bound is below
+    min_score or cannot beat the k-th best score. It stops with truncated
+    results when deadline_ms runs out; at least one block is always scored.
+
+    Args:
+        score_block: Scores of rows [start, end)
+        num_rows: Number of rows (chunks)
+        k: Number of results
+        block_size: Rows per block; must match the blocks the bounds were computed for
+        upper_bounds: Per-block score bounds, e.g. from BlockMaxIndex.upper_bounds()
+        min_score: Drop results scoring below this
+        deadline_ms: Time budget for scoring
+        allowed: Boolean mask of rows that may be returned
+    """
+    started = time.perf_counter()
+    deadline = started + deadline_ms / 1000.0 if deadline_ms is not None else None
+    floor = -np.inf if min_score is None else min_score
+
+    num_blocks = math.ceil(num_rows / block_size)
+    order = np.argsort(-upper_bounds, kind="stable") if upper_bounds is not None else range(num_blocks)
+
+    best_indices = np.zeros(0, dtype=np.int64)
+    best_scores = np.zeros(0, dtype=np.float64)
+    kth_best = -np.inf
+    truncated = False
+    blocks_scored = 0
+    rows_scored = 0
+
+    for block in order:
+        if upper_bounds is not None:
+            bound = upper_bounds[block]
+            # Bounds only decrease from here, so no later block can contribute
+            if bound < floor or (len(best_scores) == k and bound <= kth_best):
+                break
+        if deadline is not None and blocks_scored > 0 and time.perf_counter() >= deadline:
+            truncated = True
+            break
+
+        start = int(block) * block_size
+        end = min(num_rows, start + block_size)
+        scores = np.asarray(score_block(start, end), dtype=np.float64).ravel()
+        blocks_scored += 1
+        rows_scored += end - start
+
+        keep = scores >= floor
+        if allowed is not None:
+            keep &= allowed[start:end]
+        rows = np.flatnonzero(keep)
+        if not len(rows):
+            continue
+
+        candidate_indices = np.concatenate([best_indices, rows + start])
+        candidate_scores = np.concatenate([best_scores, scores[rows]])
+        if len(candidate_scores) > k:
+            top = np.argpartition(-candidate_scores, k - 1)[:k]
+            candidate_indices, candidate_scores = candidate_indices[top], candidate_scores[top]
+        best_indices, best_scores = candidate_indices, candidate_scores
+        if len(best_scores) == k:
+            kth_best = best_scores.min()
+
+    # Best first, ties by position as a full argsort would break them
+    ranking = np.lexsort((best_indices, -best_scores))
+    if truncated:
+        logger.info(f"Search budget of {deadline_ms} ms ran out after {blocks_scored}/{num_blocks} blocks")
+    return AnytimeResult(best_indices[ranking], best_scores[ranking], truncated,
+                         blocks_scored, num_blocks, rows_scored)
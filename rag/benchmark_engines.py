@@ -0,0 +1,355 @@
+"""
+Engine Benchmarks for Environmental Law RAG System
+Compares retrieval accuracy and latency of alternative index paths
+"""
+
+import sys
+import json
+import time
+import logging
+import argparse
+from typing import List, Dict, Any, Optional, Callable
+from pathlib import Path
+
+import numpy as np
+
+# Add the rag directory to Python path
+sys.path.append(str(Path(__file__).parent))
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_QUERIES = [
+    "What are the penalties for air pollution violations?",
+    "What is the Water Prevention and Control of Pollution Act about?",
+    "What are the requirements for e-waste management?",
+    "What is the Forest Conservation Act about?",
+    "Who can issue directions for closure of an industry?",
+    "consent to establish or operate an industrial plant",
+    "powers of the Central Pollution Control Board",
+    "diversion of forest land for non-forest purposes",
+    "extended producer responsibility for producers of electrical equipment",
+    "sampling of effluents and procedure for analysis",
+    "environmental impact assessment of new projects",
+    "offences by companies and government departments",
+]
+
+
+def load_queries(path: Optional[Path]) -> List[Dict[str, Any]]:
+    """
+    Benchmark queries as {'question', 'relevant_sources'} records.
+
+    The file holds one JSON string or {"question": ..., "relevant_sources": [...]}
+    object per line; without a file the built-in queries are used unlabeled.
+    """
+    if path is None:
+        return [{"question": question, "relevant_sources": []} for question in DEFAULT_QUERIES]
+
+    queries = []
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            queries.append({"question": record["question"], "relevant_sources": record.get("relevant_sources", [])})
+    return queries
+
+
+def latency_summary(latencies_ms: List[float]) -> Dict[str, float]:
+    values = np.array(latencies_ms)
+    return {
+        "mean_ms": round(float(values.mean()), 3),
+        "p50_ms": round(float(np.percentile(values, 50)), 3),
+        "p95_ms": round(float(np.percentile(values, 95)), 3),
+    }
+
+
+def time_calls(function: Callable[[str], Any], queries: List[Dict[str, Any]], repeat: int = 5):
+    """
+    Run function on every question `repeat` times after one warm-up pass.
+
+    Returns:
+        (results of the last pass, per-call latencies in milliseconds)
+    """
+    results = [function(query["question"]) for query in queries]
+    latencies = []
+    for _ in range(repeat):
+        for i, query in enumerate(queries):
+            started = time.perf_counter()
+            results[i] = function(query["question"])
+            latencies.append((time.perf_counter() - started) * 1000)
+    return results, latencies
+
+
+def result_ids(documents: List[Dict[str, Any]]) -> List[str]:
+    return [doc.get("metadata", {}).get("chunk_id", doc.get("source")) for doc in documents]
+
+
+def agreement(reference: List[List[str]], candidate: List[List[str]]) -> float:
+    """Mean fraction of the reference top-k that the candidate also returns."""
+    overlaps = [len(set(ref) & set(cand)) / len(ref) for ref, cand in zip(reference, candidate) if ref]
+    return round(float(np.mean(overlaps)), 3) if overlaps else 0.0
+
+
+def source_hit_rate(queries: List[Dict[str, Any]], results: List[List[Dict[str, Any]]]) -> Optional[float]:
+    """Fraction of labeled queries with a relevant source among the results."""
+    hits = [
+        any(doc.get("source") in query["relevant_sources"] for doc in documents)
+        for query, documents in zip(queries, results)
+        if query["relevant_sources"]
+    ]
+    return round(float(np.mean(hits)), 3) if hits else None
+
+
+def benchmark_lsa(persist_directory: str,
+                  queries: List[Dict[str, Any]],
+                  k: int = 5,
+                  dimensions: Optional[int] = None,
+                  repeat: int = 5) -> Dict[str, Any]:
+    """
+    Compare the sparse TF-IDF path with the dense LSA path of the improved engine.
+
+    Uses the saved LSA index, or fits one in memory (dimensions) if there is
+    none. Accuracy is the overlap of each path's top k with the sparse top k,
+    plus the source hit rate on labeled queries.
+    """
+    from rag_improved import ImprovedEnvironmentalLawRAG
+    from lsa_index import LSAIndex, DEFAULT_DIMENSIONS
+
+    rag = ImprovedEnvironmentalLawRAG(persist_directory=persist_directory)
+    if not rag.load_existing_vectorstore():
+        raise RuntimeError(f"No index found in {persist_directory}")
+
+    lsa = rag.lsa_index
+    if lsa is None or (dimensions and dimensions != lsa.dimensions):
+        lsa = LSAIndex.build(rag.tfidf_matrix, dimensions=dimensions or DEFAULT_DIMENSIONS)
+
+    def search(question: str):
+        return rag.search_similar_documents(question, k=k)
+
+    def sparse_scores(question: str):
+        query_vector = rag.vectorizer.transform([question])
+        if hasattr(rag.tfidf_matrix, 'tocsr'):
+            return (rag.tfidf_matrix @ query_vector.T).toarray().ravel()
+        return np.asarray(rag.tfidf_matrix[:, query_vector.indices] @ query_vector.data).ravel()
+
+    def lsa_scores(question: str):
+        return lsa.scores(rag.vectorizer.transform([question]))
+
+    report = {"chunks": len(rag.document_texts), "k": k, "queries": len(queries), "paths": {}}
+    rag.lsa_index = None
+    sparse_results, sparse_latencies = time_calls(search, queries, repeat)
+    _, sparse_scoring = time_calls(sparse_scores, queries, repeat)
+    rag.lsa_index = lsa
+    lsa_results, lsa_latencies = time_calls(search, queries, repeat)
+    _, lsa_scoring = time_calls(lsa_scores, queries, repeat)
+
+    reference = [result_ids(documents) for documents in sparse_results]
+    matrix = rag.tfidf_matrix
+    if hasattr(matrix, 'tocsr'):
+        matrix_bytes = matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes
+    else:
+        matrix_bytes = matrix.nbytes
+    for name, results, latencies, scoring, nbytes in [
+        ("sparse", sparse_results, sparse_latencies, sparse_scoring, matrix_bytes),
+        (f"lsa-{lsa.dimensions}", lsa_results, lsa_latencies, lsa_scoring, lsa.nbytes()),
+    ]:
+        report["paths"][name] = {
+            "search": latency_summary(latencies),
+            "scoring": latency_summary(scoring),
+            "agreement_with_sparse": agreement(reference, [result_ids(documents) for documents in results]),
+            "source_hit_rate": source_hit_rate(queries, results),
+            "index_megabytes": round(nbytes / 1e6, 2),
+        }
+    return report
+
+
+def benchmark_fts(persist_directory: str,
+                  fts_directory: str,
+                  queries: List[Dict[str, Any]],
+                  k: int = 5,
+                  repeat: int = 5) -> Dict[str, Any]:
+    """
+    Compare the improved engine's TF-IDF search with the SQLite FTS5 engine.
+
+    The FTS5 index is built from the improved index's chunks.json if
+    fts_directory has none, so both engines search the same chunks.
+    Accuracy is the overlap with the TF-IDF top k, plus the source hit rate
+    on labeled queries.
+    """
+    from rag_improved import ImprovedEnvironmentalLawRAG
+    from rag_fts import FTSEnvironmentalLawRAG
+    from corpus_stats import directory_size
+
+    rag = ImprovedEnvironmentalLawRAG(persist_directory=persist_directory)
+    if not rag.load_existing_vectorstore():
+        raise RuntimeError(f"No index found in {persist_directory}")
+
+    fts = FTSEnvironmentalLawRAG(persist_directory=fts_directory)
+    if not fts.load_existing_vectorstore():
+        with open(Path(persist_directory) / "chunks.json", 'r') as f:
+            fts.create_vectorstore(json.load(f))
+        if not fts.load_existing_vectorstore():
+            raise RuntimeError(f"Could not build an FTS5 index in {fts_directory}")
+
+    tfidf_results, tfidf_latencies = time_calls(lambda question: rag.search_similar_documents(question, k=k),
+                                                queries, repeat)
+    fts_results, fts_latencies = time_calls(lambda question: fts.search_similar_documents(question, k=k),
+                                            queries, repeat)
+
+    reference = [result_ids(documents) for documents in tfidf_results]
+    report = {"chunks": len(rag.document_texts), "k": k, "queries": len(queries), "paths": {}}
+    for name, results, latencies, nbytes in [
+        ("tfidf", tfidf_results, tfidf_latencies, directory_size(Path(persist_directory))),
+        ("fts5", fts_results, fts_latencies, fts.database_path.stat().st_size),
+    ]:
+        report["paths"][name] = {
+            "search": latency_summary(latencies),
+            "agreement_with_sparse": agreement(reference, [result_ids(documents) for documents in results]),
+            "source_hit_rate": source_hit_rate(queries, results),
+            "index_megabytes": round(nbytes / 1e6, 2),
+        }
+    return report
+
+
+def benchmark_tokenizer(persist_directory: str,
+                        queries: List[Dict[str, Any]],
+                        max_chunks: Optional[int] = None,
+                        repeat: int = 3) -> Dict[str, Any]:
+    """
+    Microbenchmark of scikit-learn's word analyzer against LegalTokenizer.
+
+    Both analyzers tokenize the indexed chunks (unigrams and bigrams, English
+    stop words removed), then a TfidfVectorizer is fitted with each and used
+    to vectorize the queries, as the build and query paths do.
+    """
+    from sklearn.feature_extraction.text import TfidfVectorizer
+    from legal_tokenizer import LegalTokenizer, tfidf_vectorizer_params
+
+    chunks_file = Path(persist_directory) / "chunks.json"
+    if not chunks_file.exists():
+        raise RuntimeError(f"No chunks.json found in {persist_directory}")
+    with open(chunks_file, 'r') as f:
+        texts = [chunk['content'] for chunk in json.load(f)][:max_chunks]
+
+    candidates = {
+        "sklearn": (
+            TfidfVectorizer(stop_words='english', ngram_range=(1, 2)).build_analyzer(),
+            dict(max_features=5000, stop_words='english', ngram_range=(1, 2), min_df=2, max_df=0.8)
+        ),
+        "legal": (LegalTokenizer(ngram_range=(1, 2)), tfidf_vectorizer_params()),
+    }
+
+    report = {"chunks": len(texts), "queries": len(queries), "analyzers": {}}
+    for name, (analyze, params) in candidates.items():
+        seconds = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            tokens = sum(1 for text in texts for _ in analyze(text))
+            seconds.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        vectorizer = TfidfVectorizer(**params)
+        vectorizer.fit(texts)
+        fit_seconds = time.perf_counter() - started
+
+        _, query_latencies = time_calls(lambda question: vectorizer.transform([question]), queries, repeat)
+        report["analyzers"][name] = {
+            "tokens": tokens,
+            "tokenize_seconds": round(min(seconds), 4),
+            "tokens_per_second": round(tokens / min(seconds)) if min(seconds) > 0 else 0,
+            "fit_seconds": round(fit_seconds, 3),
+            "query": latency_summary(query_latencies),
+            "features": len(vectorizer.vocabulary_),
+        }
+
+    baseline = report["analyzers"]["sklearn"]["tokenize_seconds"]
+    legal = report["analyzers"]["legal"]["tokenize_seconds"]
+    report["speedup"] = round(baseline / legal, 2) if legal > 0 else None
+    return report
+
+
+def print_tokenizer_report(report: Dict[str, Any]):
+    print(f"{report['chunks']} chunks, {report['queries']} queries")
+    print(f"{'analyzer':<10}{'tokens':>10}{'tokenize':>11}{'tokens/s':>12}{'fit':>9}{'query p50':>12}{'features':>10}")
+    for name, row in report["analyzers"].items():
+        print(f"{name:<10}{row['tokens']:>10}{row['tokenize_seconds']:>10.3f}s{row['tokens_per_second']:>12}"
+              f"{row['fit_seconds']:>8.2f}s{row['query']['p50_ms']:>10.3f}ms{row['features']:>10}")
+    print(f"Tokenization speedup: {report['speedup']}x")
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"{report['queries']} queries, k={report['k']}, {report.get('chunks', '?')} chunks")
+    print(f"{'path':<16}{'search p50':>12}{'search p95':>12}{'scoring p50':>13}"
+          f"{'agreement':>11}{'hit rate':>10}{'index MB':>10}")
+    for name, row in report["paths"].items():
+        hit_rate = "-" if row["source_hit_rate"] is None else f"{row['source_hit_rate']:.3f}"
+        scoring = f"{row['scoring']['p50_ms']:>11.3f}ms" if "scoring" in row else f"{'-':>13}"
+        print(f"{name:<16}{row['search']['p50_ms']:>10.2f}ms{row['search']['p95_ms']:>10.2f}ms"
+              f"{scoring}{row['agreement_with_sparse']:>11.3f}"
+              f"{hit_rate:>10}{row['index_megabytes']:>10.2f}")
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Benchmark alternative retrieval paths")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    lsa_parser = subparsers.add_parser("lsa", help="Sparse TF-IDF vs dense LSA on the improved engine")
+    lsa_parser.add_argument("--persist-directory", default="rag/chroma_db")
+    lsa_parser.add_argument("--queries", type=Path, default=None,
+                            help="JSONL with questions and optional relevant_sources")
+    lsa_parser.add_argument("--dimensions", type=int, default=None,
+                            help="Fit an LSA index of this size instead of the saved one")
+    lsa_parser.add_argument("-k", type=int, default=5)
+    lsa_parser.add_argument("--repeat", type=int, default=5)
+    lsa_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    fts_parser = subparsers.add_parser("fts", help="Improved engine TF-IDF vs SQLite FTS5 engine")
+    fts_parser.add_argument("--persist-directory", default="rag/chroma_db")
+    fts_parser.add_argument("--fts-directory", default="rag/fts_db",
+                            help="FTS5 index; built from the improved index's chunks if missing")
+    fts_parser.add_argument("--queries", type=Path, default=None,
+                            help="JSONL with questions and optional relevant_sources")
+    fts_parser.add_argument("-k", type=int, default=5)
+    fts_parser.add_argument("--repeat", type=int, default=5)
+    fts_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    tokenizer_parser = subparsers.add_parser("tokenizer", help="scikit-learn analyzer vs LegalTokenizer")
+    tokenizer_parser.add_argument("--persist-directory", default="rag/chroma_db")
+    tokenizer_parser.add_argument("--queries", type=Path, default=None, help="JSONL with questions")
+    tokenizer_parser.add_argument("--max-chunks", type=int, default=None, help="Tokenize only the first N chunks")
+    tokenizer_parser.add_argument("--repeat", type=int, default=3)
+    tokenizer_parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+
+    args = parser.parse_args()
+
+    try:
+        if args.command == "lsa":
+            report = benchmark_lsa(args.persist_directory, load_queries(args.queries),
+                                   k=args.k, dimensions=args.dimensions, repeat=args.repeat)
+            printer = print_report
+        elif args.command == "fts":
+            report = benchmark_fts(args.persist_directory, args.fts_directory, load_queries(args.queries),
+                                   k=args.k, repeat=args.repeat)
+            printer = print_report
+        elif args.command == "tokenizer":
+            report = benchmark_tokenizer(args.persist_directory, load_queries(args.queries),
+                                         max_chunks=args.max_chunks, repeat=args.repeat)
+            printer = print_tokenizer_report
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        printer(report)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
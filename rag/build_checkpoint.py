@@ -0,0 +1,172 @@
+"""
+Build Checkpoints for Environmental Law RAG System
+Records completed build stages and batches so an interrupted index build can resume
+"""
+
+import os
+import json
+import hashlib
+import pickle
+import shutil
+import logging
+from typing import List, Dict, Any, Optional, Set
+from pathlib import Path
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIRNAME = "build_checkpoint"
+
+
+def _atomic_write(path: Path, data: bytes):
+    """Write a file so that readers never observe a partial write."""
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+class BuildCheckpoint:
+    """
+    Checkpoint store for one index build.
+
+    Stages used by the RAG classes, in order:
+        extraction    - one record per processed PDF
+        chunking      - the full chunk list
+        vectorization - fitted TF-IDF state, or one record per embedded batch
+        persistence   - index written to its final location
+
+    Chunking is recorded with corpus_version(), and vectorization with the
+    chunking parameters, so a PDF that was added or changed since
+    invalidates both.
+
+    The checkpoint lives in a subdirectory of the persist directory and is
+    removed with clear() once the build has finished.
+    """
+
+    def __init__(self, persist_directory: Path):
+        """
+        Args:
+            persist_directory: Index directory the build writes to
+        """
+        self.directory = Path(persist_directory) / CHECKPOINT_DIRNAME
+        self.state_file = self.directory / "state.json"
+        self.state = self._load_state()
+        # Fingerprints of the PDFs extracted (or reused) in this run
+        self.sources: Dict[str, Dict[str, Any]] = {}
+
+    def _load_state(self) -> Dict[str, Any]:
+        if self.state_file.exists():
+            try:
+                with open(self.state_file, "r") as f:
+                    return json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Ignoring unreadable build checkpoint: {e}")
+        return {"stages": {}, "batches": {}}
+
+    def _save_state(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.state_file, json.dumps(self.state).encode("utf-8"))
+
+    def in_progress(self) -> bool:
+        """True if a previous build left checkpoints behind."""
+        return self.directory.exists() and any(self.directory.iterdir())
+
+    # Stage tracking
+
+    def is_complete(self, stage: str, **params) -> bool:
+        """True if the stage finished with the same parameters."""
+        record = self.state["stages"].get(stage)
+        return record is not None and record.get("params", {}) == params
+
+    def stage_params(self, stage: str) -> Optional[Dict[str, Any]]:
+        """Parameters a completed stage was recorded with, for keying the stages built on it."""
+        record = self.state["stages"].get(stage)
+        return record.get("params", {}) if record is not None else None
+
+    def mark_complete(self, stage: str, **params):
+        self.state["stages"][stage] = {"params": params}
+        self._save_state()
+        logger.info(f"Checkpoint: stage '{stage}' complete")
+
+    # Batch tracking
+
+    def completed_batches(self, stage: str, **params) -> Set[int]:
+        """Batches finished with the same parameters; none if they changed."""
+        record = self.state["batches"].get(stage)
+        if not isinstance(record, dict) or record.get("params", {}) != params:
+            return set()
+        return set(record["done"])
+
+    def mark_batch(self, stage: str, batch_index: int, **params):
+        record = self.state["batches"].get(stage)
+        if not isinstance(record, dict) or record.get("params", {}) != params:
+            record = self.state["batches"][stage] = {"params": params, "done": []}
+        if batch_index not in record["done"]:
+            record["done"].append(batch_index)
+        self._save_state()
+
+    # Stage artifacts
+
+    def save_json(self, name: str, obj: Any):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.directory / f"{name}.json", json.dumps(obj).encode("utf-8"))
+
+    def load_json(self, name: str) -> Any:
+        with open(self.directory / f"{name}.json", "r") as f:
+            return json.load(f)
+
+    def save_pickle(self, name: str, obj: Any):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        _atomic_write(self.directory / f"{name}.pkl", pickle.dumps(obj))
+
+    def load_pickle(self, name: str) -> Any:
+        with open(self.directory / f"{name}.pkl", "rb") as f:
+            return pickle.load(f)
+
+    # Per-PDF extraction records
+
+    @staticmethod
+    def _fingerprint(pdf_file: Path) -> Dict[str, Any]:
+        stat = pdf_file.stat()
+        return {"size": stat.st_size, "mtime": stat.st_mtime}
+
+    def _extraction_path(self, pdf_file: Path) -> Path:
+        return self.directory / "extracted" / f"{pdf_file.name}.json"
+
+    def record_extraction(self, pdf_file: Path, document: Dict[str, Any]):
+        """Store the extracted text of one PDF."""
+        path = self._extraction_path(pdf_file)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        record = {"fingerprint": self._fingerprint(pdf_file), "document": document}
+        _atomic_write(path, json.dumps(record).encode("utf-8"))
+        self.sources[pdf_file.name] = record["fingerprint"]
+
+    def get_extraction(self, pdf_file: Path) -> Optional[Dict[str, Any]]:
+        """Return the stored extraction for a PDF unless the file changed since."""
+        path = self._extraction_path(pdf_file)
+        if not path.exists():
+            return None
+        try:
+            with open(path, "r") as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record.get("fingerprint") != self._fingerprint(pdf_file):
+            return None
+        self.sources[pdf_file.name] = record["fingerprint"]
+        return record["document"]
+
+    def corpus_version(self) -> str:
+        """Digest of the fingerprints of every PDF extracted in this run."""
+        encoded = json.dumps(sorted(self.sources.items())).encode("utf-8")
+        return hashlib.sha1(encoded).hexdigest()
+
+    def clear(self):
+        """Remove all checkpoints after a successful build."""
+        if self.directory.exists():
+            shutil.rmtree(self.directory)
+        self.state = {"stages": {}, "batches": {}}
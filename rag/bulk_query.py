@@ -0,0 +1,241 @@
+"""
+Bulk Query CLI for Environmental Law RAG System
+Answers questions from a JSONL file in parallel and writes results as JSONL
+"""
+
+import os
+import sys
+import json
+import time
+import logging
+import argparse
+import multiprocessing
+from typing import List, Dict, Any, Optional, Iterator, Tuple
+from pathlib import Path
+
+# Add the rag directory to Python path
+sys.path.append(str(Path(__file__).parent))
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+ENGINES = {
+    "improved": ("rag_improved", "ImprovedEnvironmentalLawRAG"),
+    "ultra_simple": ("rag_ultra_simple", "UltraSimpleEnvironmentalLawRAG"),
+}
+
+# Set in each worker process by _init_worker
+_worker_rag = None
+_worker_options: Dict[str, Any] = {}
+
+
+def _init_worker(engine: str, persist_directory: str, options: Dict[str, Any]):
+    """Load the index once per worker; the TF-IDF matrix is memory-mapped and shared."""
+    global _worker_rag, _worker_options
+    _worker_options = options
+    if _worker_rag is not None:
+        # Inherited from the parent through fork
+        return
+    module_name, class_name = ENGINES[engine]
+    module = __import__(module_name)
+    rag = getattr(module, class_name)(persist_directory=persist_directory)
+    if not rag.load_existing_vectorstore(mmap_mode="r"):
+        raise RuntimeError(f"No index found in {persist_directory}")
+    _worker_rag = rag
+
+
+def _compact_sources(documents: List[Dict[str, Any]], include_content: bool) -> List[Dict[str, Any]]:
+    sources = []
+    for doc in documents:
+        source = {
+            "source": doc.get("source", "Unknown"),
+            "chunk_id": doc.get("metadata", {}).get("chunk_id"),
+            "score": float(doc.get("similarity_score", 0.0))
+        }
+        if include_content:
+            source["content"] = doc.get("content", "")
+        sources.append(source)
+    return sources
+
+
+def _answer(task: Tuple[int, Optional[Dict[str, Any]], Optional[str]]) -> Dict[str, Any]:
+    """Answer one input record in a worker process."""
+    line_number, record, parse_error = task
+    output = {"line": line_number}
+    if parse_error is not None:
+        output["error"] = parse_error
+        return output
+
+    output["id"] = record.get("id", line_number)
+    question = record.get("question", "")
+    output["question"] = question
+    if not question:
+        output["error"] = "No question provided"
+        return output
+
+    k = record.get("k", _worker_options["k"])
+    try:
+        k = int(k)
+    except (TypeError, ValueError):
+        k = 0
+    if k < 1:
+        output["error"] = f"Invalid k: {record.get('k')!r}"
+        return output
+
+    started = time.perf_counter()
+    try:
+        result = _worker_rag.query(question, k=k)
+    except Exception as e:
+        # One bad record must not abort the whole run
+        result = {"error": f"Query failed: {e}"}
+    output["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+
+    if "error" in result:
+        output["error"] = result["error"]
+    else:
+        output["answer"] = result["answer"]
+        output["sources"] = _compact_sources(result["source_documents"], _worker_options["include_content"])
+    return output
+
+
+def read_tasks(input_path: Path, skip: int) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """
+    Input records as (line number, record, parse error).
+
+    Lines may hold {"question": ..., "id": ..., "k": ...} objects or bare JSON
+    strings. Every non-blank line yields exactly one task, so output line N
+    always answers input record N.
+    """
+    with open(input_path, 'r', encoding='utf-8') as f:
+        record_number = 0
+        for line in f:
+            if not line.strip():
+                continue
+            if record_number >= skip:
+                try:
+                    record = json.loads(line)
+                    if isinstance(record, str):
+                        record = {"question": record}
+                    if not isinstance(record, dict):
+                        raise ValueError("expected an object or a string")
+                    yield record_number, record, None
+                except ValueError as e:
+                    yield record_number, None, f"Invalid input line: {e}"
+            record_number += 1
+
+
+def completed_records(output_path: Path) -> int:
+    """
+    Number of complete records already in the output file.
+
+    A trailing line cut off by an interrupted run is removed so the file can
+    be appended to.
+    """
+    if not output_path.exists():
+        return 0
+
+    with open(output_path, 'rb+') as f:
+        data = f.read()
+        complete_end = data.rfind(b"\n") + 1
+        if complete_end < len(data):
+            logger.info("Removing incomplete last line from previous run")
+            f.truncate(complete_end)
+    return data[:complete_end].count(b"\n")
+
+
+def run(input_path: Path,
+        output_path: Path,
+        engine: str = "improved",
+        persist_directory: str = "rag/chroma_db",
+        workers: Optional[int] = None,
+        k: int = 5,
+        include_content: bool = False,
+        chunksize: int = 8,
+        report_every: float = 10.0) -> Dict[str, Any]:
+    """
+    Answer every question in input_path and write results to output_path.
+
+    Results are written in input order as soon as they are ready. If the
+    output file already holds results from an interrupted run, those records
+    are skipped and the rest are appended.
+
+    Returns:
+        Summary with counts, elapsed time and throughput
+    """
+    workers = workers or os.cpu_count() or 1
+    done = completed_records(output_path)
+    if done:
+        logger.info(f"Resuming after {done} completed records")
+
+    options = {"k": k, "include_content": include_content}
+    context = multiprocessing.get_context("fork" if sys.platform.startswith("linux") else "spawn")
+
+    # Load in the parent first: fails fast without an index, runs one-time index
+    # upgrades before any worker starts, and forked workers inherit the engine
+    _init_worker(engine, persist_directory, options)
+
+    processed = 0
+    errors = 0
+    started = time.perf_counter()
+    last_report = started
+    with context.Pool(workers, initializer=_init_worker,
+                      initargs=(engine, persist_directory, options)) as pool, \
+            open(output_path, 'a', encoding='utf-8') as out:
+        # imap keeps input order while the pool works ahead on later records
+        for output in pool.imap(_answer, read_tasks(input_path, done), chunksize=chunksize):
+            out.write(json.dumps(output, ensure_ascii=False) + "\n")
+            out.flush()
+            processed += 1
+            errors += "error" in output
+
+            now = time.perf_counter()
+            if now - last_report >= report_every:
+                logger.info(f"{done + processed} records done, {processed / (now - started):.1f} questions/s")
+                last_report = now
+
+    elapsed = time.perf_counter() - started
+    return {
+        "processed": processed,
+        "skipped": done,
+        "errors": errors,
+        "workers": workers,
+        "elapsed_seconds": round(elapsed, 2),
+        "questions_per_second": round(processed / elapsed, 2) if elapsed > 0 else 0.0
+    }
+
+
+def main():
+    """Command-line entry point"""
+    parser = argparse.ArgumentParser(description="Answer questions from a JSONL file in parallel")
+    parser.add_argument("input", help="JSONL file with one question per line")
+    parser.add_argument("output", help="JSONL file for the answers (appended to when resuming)")
+    parser.add_argument("--engine", choices=sorted(ENGINES), default="improved")
+    parser.add_argument("--persist-directory", default="rag/chroma_db")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("-k", type=int, default=5, help="Source chunks per question")
+    parser.add_argument("--include-content", action="store_true", help="Include source chunk text in the output")
+    parser.add_argument("--chunksize", type=int, default=8, help="Questions handed to a worker at a time")
+    args = parser.parse_args()
+
+    try:
+        summary = run(
+            Path(args.input), Path(args.output),
+            engine=args.engine,
+            persist_directory=args.persist_directory,
+            workers=args.workers,
+            k=args.k,
+            include_content=args.include_content,
+            chunksize=args.chunksize
+        )
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        return 1
+    print(f"✅ Answered {summary['processed']} questions ({summary['errors']} errors, "
+          f"{summary['skipped']} already done) in {summary['elapsed_seconds']}s "
+          f"with {summary['workers']} workers: {summary['questions_per_second']} questions/s")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
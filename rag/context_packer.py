@@ -0,0 +1,130 @@
+"""
+Context Packing for Environmental Law RAG System
+Selects the most relevant sentences of retrieved chunks up to a token budget
+"""
+
+import re
+import math
+import logging
+from typing import List, Dict, Any, Optional, Callable, Tuple
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.;:?!])\s+|\n{2,}")
+_PAGE_MARKER = re.compile(r"^-+\s*Page\s+\d+\s*-+$", re.IGNORECASE)
+
+# Sentences this similar (word 3-gram Jaccard) to an already packed one are
+# treated as overlap, e.g. the shared region of neighbouring chunks
+DUPLICATE_THRESHOLD = 0.6
+
+
+def approximate_token_count(text: str) -> int:
+    """Rough subword token count when no tokenizer is available."""
+    return int(len(_WORD_PATTERN.findall(text)) * 1.3) + 1
+
+
+def _shingles(words: List[str]) -> set:
+    if len(words) < 3:
+        return {tuple(words)}
+    return {tuple(words[i:i + 3]) for i in range(len(words) - 2)}
+
+
+def pack_context(question: str,
+                 documents: List[Dict[str, Any]],
+                 token_budget: int = 256,
+                 count_tokens: Optional[Callable[[str], int]] = None) -> Tuple[str, List[Dict[str, Any]]]:
+    """
+    Build a prompt context from retrieved chunks within a token budget.
+
+    Sentences are scored by the IDF-weighted query terms they contain, with a
+    small bonus for chunks the retriever ranked higher. The best sentences
+    are taken greedily until the budget is spent, skipping near-duplicates.
+    Picked sentences are emitted grouped by chunk, in original order, under
+    a numbered citation header.
+
+    Args:
+        question: The user's question
+        documents: Retrieved chunks, best first, with 'content' and 'metadata'
+        token_budget: Maximum tokens of packed context
+        count_tokens: Token counter, e.g. the LLM tokenizer's; approximated if omitted
+
+    Returns:
+        (context text, citations) where each citation has 'ref', 'source' and 'chunk_id'
+    """
+    count_tokens = count_tokens or approximate_token_count
+
+    # Split chunks into candidate sentences
+    sentences = []
+    for doc_rank, doc in enumerate(documents):
+        for position, sentence in enumerate(_SENTENCE_BOUNDARY.split(doc['content'])):
+            sentence = " ".join(sentence.split())
+            if len(sentence) < 20 or _PAGE_MARKER.match(sentence):
+                continue
+            words = _WORD_PATTERN.findall(sentence.lower())
+            sentences.append({
+                'doc_rank': doc_rank,
+                'position': position,
+                'text': sentence,
+                'words': words
+            })
+
+    if not sentences:
+        return "", []
+
+    # IDF of each question term across the candidate sentences
+    terms = set(_WORD_PATTERN.findall(question.lower()))
+    document_frequency = {term: 0 for term in terms}
+    for sentence in sentences:
+        for term in terms.intersection(sentence['words']):
+            document_frequency[term] += 1
+    idf = {
+        term: math.log((1 + len(sentences)) / (1 + df)) + 1.0
+        for term, df in document_frequency.items() if df > 0
+    }
+
+    for sentence in sentences:
+        matched = idf.keys() & set(sentence['words'])
+        sentence['score'] = sum(idf[term] for term in matched) + 0.5 / (1 + sentence['doc_rank'])
+
+    # Greedy selection under the budget
+    selected = []
+    selected_shingles = []
+    used_tokens = 0
+    for sentence in sorted(sentences, key=lambda s: (-s['score'], s['doc_rank'], s['position'])):
+        tokens = count_tokens(sentence['text'])
+        if used_tokens + tokens > token_budget:
+            continue
+
+        shingles = _shingles(sentence['words'])
+        if any(len(shingles & other) / max(1, len(shingles | other)) >= DUPLICATE_THRESHOLD
+               for other in selected_shingles):
+            continue
+
+        selected.append(sentence)
+        selected_shingles.append(shingles)
+        used_tokens += tokens
+
+    # Emit grouped by chunk, keeping the original sentence order
+    selected.sort(key=lambda s: (s['doc_rank'], s['position']))
+    blocks = []
+    citations = []
+    current_rank = None
+    for sentence in selected:
+        if sentence['doc_rank'] != current_rank:
+            current_rank = sentence['doc_rank']
+            doc = documents[current_rank]
+            ref = len(citations) + 1
+            citations.append({
+                'ref': ref,
+                'source': doc.get('source', doc['metadata'].get('source', 'Unknown')),
+                'chunk_id': doc['metadata'].get('chunk_id')
+            })
+            blocks.append([f"[{ref}] {citations[-1]['source']}"])
+        blocks[-1].append(sentence['text'])
+
+    context = "\n\n".join("\n".join(block) for block in blocks)
+    logger.debug(f"Packed {len(selected)} of {len(sentences)} sentences into ~{used_tokens} tokens")
+    return context, citations
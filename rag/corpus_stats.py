@@ -0,0 +1,148 @@
+"""
+Corpus Statistics for Environmental Law RAG System
+Incrementally maintained chunk/document/token counts persisted alongside the index
+"""
+
+import os
+import re
+import json
+import logging
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterable
+from pathlib import Path
+
+from build_checkpoint import CHECKPOINT_DIRNAME
+from index_snapshots import SNAPSHOTS_DIRNAME, CURRENT_FILENAME
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STATS_FILENAME = "corpus_stats.json"
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+
+
+def count_tokens(text: str) -> int:
+    """Count word tokens in a piece of text."""
+    return sum(1 for _ in _TOKEN_PATTERN.finditer(text))
+
+
+def directory_size(path: Path, exclude: Iterable[str] = ()) -> int:
+    """Total size in bytes of all files under a directory, skipping excluded file and directory names."""
+    excluded = set(exclude)
+    total = 0
+    for root, dirs, files in os.walk(path):
+        dirs[:] = [name for name in dirs if name not in excluded]
+        for name in files:
+            if name in excluded:
+                continue
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                continue
+    return total
+
+
+class CorpusStatistics:
+    """
+    Running statistics about an index.
+
+    Counts are updated as chunks are added during a build and written next to
+    the index, so serving them never requires scanning the stored chunks.
+    """
+
+    def __init__(self):
+        self.total_chunks = 0
+        self.total_tokens = 0
+        self.chunks_per_source: Dict[str, int] = {}
+        self.index_size_bytes = 0
+        self.updated_at: Optional[str] = None
+        self._summary: Optional[Dict[str, Any]] = None
+
+    def add_chunk(self, metadata: Dict[str, Any], content: Optional[str] = None):
+        """Account for one stored chunk."""
+        source = metadata.get("source", "Unknown")
+        self.chunks_per_source[source] = self.chunks_per_source.get(source, 0) + 1
+        self.total_chunks += 1
+        if content:
+            self.total_tokens += count_tokens(content)
+        self._summary = None
+
+    def add_chunks(self, chunks: List[Dict[str, Any]]):
+        """Account for a batch of chunks in the usual {'content', 'metadata'} form."""
+        for chunk in chunks:
+            self.add_chunk(chunk["metadata"], chunk.get("content"))
+
+    def refresh_index_size(self, persist_directory: Path):
+        """Measure the on-disk size of the index."""
+        self.index_size_bytes = directory_size(
+            Path(persist_directory),
+            exclude=[STATS_FILENAME, CHECKPOINT_DIRNAME, SNAPSHOTS_DIRNAME, CURRENT_FILENAME]
+        )
+        self._summary = None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Statistics in the shape returned by get_document_statistics()."""
+        if self._summary is None:
+            self._summary = {
+                "total_chunks": self.total_chunks,
+                "unique_documents": len(self.chunks_per_source),
+                "sources": list(self.chunks_per_source),
+                "chunks_per_source": dict(self.chunks_per_source),
+                "total_tokens": self.total_tokens,
+                "index_size_bytes": self.index_size_bytes,
+                "updated_at": self.updated_at
+            }
+        return self._summary
+
+    def save(self, persist_directory: Path):
+        """Persist the statistics next to the index (atomic replace)."""
+        persist_directory = Path(persist_directory)
+        self.refresh_index_size(persist_directory)
+        self.updated_at = datetime.now().isoformat(timespec="seconds")
+        self._summary = None
+
+        stats_file = persist_directory / STATS_FILENAME
+        tmp_file = stats_file.with_suffix(".json.tmp")
+        with open(tmp_file, "w") as f:
+            json.dump({
+                "total_chunks": self.total_chunks,
+                "total_tokens": self.total_tokens,
+                "chunks_per_source": self.chunks_per_source,
+                "index_size_bytes": self.index_size_bytes,
+                "updated_at": self.updated_at
+            }, f)
+        os.replace(tmp_file, stats_file)
+
+    @classmethod
+    def load(cls, persist_directory: Path) -> Optional["CorpusStatistics"]:
+        """Load persisted statistics, or None if there are none."""
+        stats_file = Path(persist_directory) / STATS_FILENAME
+        if not stats_file.exists():
+            return None
+
+        try:
+            with open(stats_file, "r") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable corpus statistics: {e}")
+            return None
+
+        stats = cls()
+        stats.total_chunks = data.get("total_chunks", 0)
+        stats.total_tokens = data.get("total_tokens", 0)
+        stats.chunks_per_source = data.get("chunks_per_source", {})
+        stats.index_size_bytes = data.get("index_size_bytes", 0)
+        stats.updated_at = data.get("updated_at")
+        return stats
+
+    @classmethod
+    def from_records(cls,
+                     metadatas: List[Dict[str, Any]],
+                     texts: Optional[List[str]] = None) -> "CorpusStatistics":
+        """Rebuild statistics from stored records (used once for indexes built before stats existed)."""
+        stats = cls()
+        for i, metadata in enumerate(metadatas):
+            stats.add_chunk(metadata or {}, texts[i] if texts else None)
+        return stats
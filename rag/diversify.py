@@ -0,0 +1,128 @@
+"""
+Result Selection for Environmental Law RAG System
+Final ordering of retrieved candidates: optional re-ranking and MMR diversification
+"""
+
+import logging
+from typing import List, Dict, Any, Optional, Callable, Union
+
+import numpy as np
+
+from slow_query_log import stage
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# How many candidates per requested result MMR chooses from
+MMR_CANDIDATE_FACTOR = 4
+
+
+def candidate_count(k: int, reranker=None, diversity: float = 0.0) -> int:
+    """Number of first-stage candidates an engine should retrieve."""
+    fetch_k = k
+    if reranker is not None:
+        fetch_k = max(fetch_k, reranker.candidates)
+    if diversity > 0:
+        fetch_k = max(fetch_k, k * MMR_CANDIDATE_FACTOR)
+    return fetch_k
+
+
+def cosine_similarity_matrix(vectors) -> np.ndarray:
+    """Pairwise cosine similarities between candidate vectors (dense or sparse rows)."""
+    if hasattr(vectors, "toarray"):
+        vectors = vectors.toarray()
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    unit = vectors / np.maximum(norms, 1e-12)
+    return unit @ unit.T
+
+
+def mmr_select(relevance: np.ndarray, similarity: np.ndarray, k: int, diversity: float) -> List[int]:
+    """
+    Maximal marginal relevance selection.
+
+    Each step picks the candidate maximizing
+        (1 - diversity) * relevance - diversity * max similarity to already selected,
+    with the max-similarity vector updated in one vectorized operation per pick.
+
+    Args:
+        relevance: Relevance of each candidate, scaled to [0, 1]
+        similarity: Candidate-by-candidate similarity matrix
+        k: Number of candidates to select
+        diversity: 0 returns plain relevance order, 1 maximizes novelty
+
+    Returns:
+        Indices of the selected candidates, in selection order
+    """
+    n = len(relevance)
+    k = min(k, n)
+    weighted_relevance = (1.0 - diversity) * relevance
+    max_similarity = np.zeros(n)
+    available = np.ones(n, dtype=bool)
+    selected = []
+
+    for _ in range(k):
+        scores = np.where(available, weighted_relevance - diversity * max_similarity, -np.inf)
+        pick = int(np.argmax(scores))
+        selected.append(pick)
+        available[pick] = False
+        np.maximum(max_similarity, similarity[pick], out=max_similarity)
+
+    return selected
+
+
+def _scale(scores: np.ndarray) -> np.ndarray:
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-12:
+        return np.ones_like(scores)
+    return (scores - low) / (high - low)
+
+
+def select_results(query: str,
+                   documents: List[Dict[str, Any]],
+                   k: int,
+                   reranker=None,
+                   diversity: float = 0.0,
+                   vectors: Optional[Union[np.ndarray, Callable[[], Any]]] = None,
+                   higher_is_better: bool = True) -> List[Dict[str, Any]]:
+    """
+    Pick the final k results from first-stage candidates.
+
+    Args:
+        query: The search query
+        documents: Candidates in first-stage order, carrying 'similarity_score'
+        k: Number of results to return
+        reranker: Optional TwoStageReranker
+        diversity: MMR trade-off in [0, 1]; 0 disables diversification
+        vectors: Candidate vectors aligned with documents, or a callable
+            producing them (only evaluated when diversifying)
+        higher_is_better: False when 'similarity_score' is a distance
+
+    Returns:
+        Selected documents, best first
+    """
+    if not documents:
+        return documents
+
+    if reranker is not None:
+        with stage("rerank"):
+            relevance = reranker.rank(query, documents, higher_is_better=higher_is_better)
+        documents = [dict(doc, rerank_score=float(score)) for doc, score in zip(documents, relevance)]
+    else:
+        relevance = np.array([float(doc.get('similarity_score', 0.0)) for doc in documents])
+        if not higher_is_better:
+            relevance = -relevance
+
+    if diversity > 0 and vectors is not None and len(documents) > 1:
+        try:
+            with stage("mmr"):
+                candidate_vectors = vectors() if callable(vectors) else vectors
+                order = mmr_select(_scale(relevance), cosine_similarity_matrix(candidate_vectors), k, diversity)
+        except Exception as e:
+            logger.warning(f"Diversification failed, falling back to relevance order: {e}")
+            order = np.argsort(-relevance, kind="stable")[:k]
+    else:
+        order = np.argsort(-relevance, kind="stable")[:k]
+
+    return [documents[i] for i in order]
@@ -0,0 +1,290 @@
+"""
+Shared Embedding Server for Environmental Law RAG System
+Owns a single SentenceTransformer instance and serves embeddings over a Unix socket
+"""
+
+import os
+import json
+import queue
+import socket
+import struct
+import logging
+import argparse
+import threading
+import socketserver
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/rag_embeddings.sock"
+
+# Every message is a 4-byte big-endian length followed by the payload
+_LENGTH = struct.Struct(">I")
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytes:
+    """Read exactly `size` bytes from the socket."""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], size - received)
+        if n == 0:
+            raise ConnectionError("Embedding socket closed mid-message")
+        received += n
+    return bytes(buffer)
+
+
+def _send_message(sock: socket.socket, payload: bytes):
+    sock.sendall(_LENGTH.pack(len(payload)) + payload)
+
+
+def _recv_message(sock: socket.socket) -> bytes:
+    (size,) = _LENGTH.unpack(_recv_exact(sock, _LENGTH.size))
+    return _recv_exact(sock, size)
+
+
+class _PendingRequest:
+    """A client request waiting for its slice of a shared batch."""
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.result: Optional[np.ndarray] = None
+        self.error: Optional[str] = None
+        self.done = threading.Event()
+
+
+class EmbeddingBatcher:
+    """
+    Collects encode requests from all connected clients and runs them through
+    the model together, so that concurrent workers share one forward pass.
+    """
+
+    def __init__(self, model, max_batch_size: int = 64, max_wait_ms: float = 5.0):
+        """
+        Args:
+            model: Object with a SentenceTransformer-compatible encode() method
+            max_batch_size: Maximum number of texts per forward pass
+            max_wait_ms: How long to wait for more requests before encoding
+        """
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: "queue.Queue[_PendingRequest]" = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        """Encode texts, blocking until the batch containing them is done."""
+        request = _PendingRequest(texts)
+        self._queue.put(request)
+        request.done.wait()
+        if request.error is not None:
+            raise RuntimeError(request.error)
+        return request.result
+
+    def _collect(self) -> List[_PendingRequest]:
+        """Block for one request, then gather more until the batch is full or the wait expires."""
+        batch = [self._queue.get()]
+        size = len(batch[0].texts)
+        while size < self.max_batch_size:
+            try:
+                request = self._queue.get(timeout=self.max_wait)
+            except queue.Empty:
+                break
+            batch.append(request)
+            size += len(request.texts)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            texts = [text for request in batch for text in request.texts]
+            try:
+                vectors = np.asarray(
+                    self.model.encode(texts, batch_size=self.max_batch_size, convert_to_numpy=True),
+                    dtype=np.float32
+                )
+                offset = 0
+                for request in batch:
+                    request.result = vectors[offset:offset + len(request.texts)]
+                    offset += len(request.texts)
+            except Exception as e:
+                logger.error(f"Error encoding batch of {len(texts)} texts: {e}")
+                for request in batch:
+                    request.error = str(e)
+            finally:
+                for request in batch:
+                    request.done.set()
+
+
+class _EmbeddingRequestHandler(socketserver.BaseRequestHandler):
+    """Serves one client connection; a connection may send many requests."""
+
+    def handle(self):
+        server: "EmbeddingServer" = self.server
+        while True:
+            try:
+                request = json.loads(_recv_message(self.request))
+            except (ConnectionError, OSError):
+                return
+            except ValueError as e:
+                # Malformed JSON; the framing is intact, so report it and keep serving
+                _send_message(self.request, json.dumps({"error": f"Invalid request: {e}"}).encode("utf-8"))
+                continue
+
+            try:
+                if request.get("op") == "info":
+                    header = {"model": server.model_name, "dim": server.dimension}
+                    _send_message(self.request, json.dumps(header).encode("utf-8"))
+                    continue
+
+                vectors = server.batcher.encode(request.get("texts", []))
+                header = {"rows": int(vectors.shape[0]), "dim": int(vectors.shape[1]) if vectors.ndim == 2 else 0}
+                _send_message(self.request, json.dumps(header).encode("utf-8"))
+                _send_message(self.request, np.ascontiguousarray(vectors, dtype=np.float32).tobytes())
+            except (ConnectionError, OSError):
+                return
+            except Exception as e:
+                _send_message(self.request, json.dumps({"error": str(e)}).encode("utf-8"))
+
+
+class EmbeddingServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Unix socket server holding the only copy of the embedding model."""
+
+    daemon_threads = True
+
+    def __init__(self,
+                 socket_path: str = DEFAULT_SOCKET_PATH,
+                 model_name: str = "all-MiniLM-L6-v2",
+                 max_batch_size: int = 64,
+                 max_wait_ms: float = 5.0):
+        """
+        Load the model and bind the socket.
+
+        Args:
+            socket_path: Filesystem path of the Unix socket
+            model_name: SentenceTransformer model to serve
+            max_batch_size: Maximum texts per forward pass
+            max_wait_ms: Batching window for requests from different clients
+        """
+        from sentence_transformers import SentenceTransformer
+
+        self.socket_path = socket_path
+        self.model_name = model_name
+        model = SentenceTransformer(model_name)
+        self.dimension = int(model.get_sentence_embedding_dimension())
+        self.batcher = EmbeddingBatcher(model, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms)
+
+        # Remove a stale socket left behind by a previous run
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        super().__init__(socket_path, _EmbeddingRequestHandler)
+        logger.info(f"Embedding server for '{model_name}' listening on {socket_path}")
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+
+class EmbeddingClient:
+    """
+    Client for EmbeddingServer.
+
+    Implements SentenceTransformer.encode() as well as the LangChain
+    embed_documents()/embed_query() interface, so it can stand in for either
+    model type in the RAG classes' setup_embeddings().
+    """
+
+    def __init__(self, socket_path: str = DEFAULT_SOCKET_PATH, expected_model: Optional[str] = None):
+        """
+        Args:
+            socket_path: Path of the embedding server's Unix socket
+            expected_model: Model name the caller was configured with, checked against the server
+        """
+        self.socket_path = socket_path
+        self._local = threading.local()
+
+        info, _ = self._request({"op": "info"})
+        self.model_name = info["model"]
+        self.dimension = info["dim"]
+
+        if expected_model and expected_model != self.model_name:
+            logger.warning(f"Embedding server serves '{self.model_name}', expected '{expected_model}'")
+
+    def _connection(self) -> socket.socket:
+        """One connection per thread; Flask serves requests from several threads."""
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(self.socket_path)
+            self._local.sock = sock
+        return sock
+
+    def _request(self, payload: Dict[str, Any], with_body: bool = False) -> Tuple[Dict[str, Any], Optional[bytes]]:
+        """Send a request and read its header, and the binary body that follows it when with_body is set."""
+        sock = self._connection()
+        try:
+            _send_message(sock, json.dumps(payload).encode("utf-8"))
+            header = json.loads(_recv_message(sock))
+            # Errors are sent without a body
+            body = _recv_message(sock) if with_body and "error" not in header else None
+        except (ConnectionError, OSError, ValueError):
+            # Drop the broken or out-of-sync connection so the next call reconnects
+            self._local.sock = None
+            sock.close()
+            raise
+        if "error" in header:
+            raise RuntimeError(f"Embedding server error: {header['error']}")
+        return header, body
+
+    def encode(self, texts, batch_size: Optional[int] = None, **kwargs) -> np.ndarray:
+        """Encode texts into a float32 array of shape (len(texts), dim)."""
+        if isinstance(texts, str):
+            texts = [texts]
+        texts = list(texts)
+        if not texts:
+            return np.zeros((0, self.dimension), dtype=np.float32)
+
+        header, body = self._request({"op": "encode", "texts": texts}, with_body=True)
+        return np.frombuffer(body, dtype=np.float32).reshape(header["rows"], header["dim"])
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.encode(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.encode([text])[0].tolist()
+
+
+def main():
+    """Run the embedding server until interrupted"""
+    parser = argparse.ArgumentParser(description="Shared embedding model server for the RAG system")
+    parser.add_argument("--socket", default=os.environ.get("RAG_EMBEDDING_SOCKET", DEFAULT_SOCKET_PATH),
+                        help="Unix socket path to listen on")
+    parser.add_argument("--model", default="all-MiniLM-L6-v2", help="SentenceTransformer model name")
+    parser.add_argument("--max-batch", type=int, default=64, help="Maximum texts per forward pass")
+    parser.add_argument("--max-wait-ms", type=float, default=5.0, help="Batching window in milliseconds")
+    args = parser.parse_args()
+
+    server = EmbeddingServer(
+        socket_path=args.socket,
+        model_name=args.model,
+        max_batch_size=args.max_batch,
+        max_wait_ms=args.max_wait_ms
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nShutting down embedding server")
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
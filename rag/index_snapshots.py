@@ -0,0 +1,321 @@
+"""
+Index Snapshots for Environmental Law RAG System
+Versioned, immutable index directories with background hot reload for the web interfaces
+"""
+
+import os
+import sys
+import shutil
+import logging
+import argparse
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import List, Any, Optional, Callable, Set
+from pathlib import Path
+
+from build_checkpoint import CHECKPOINT_DIRNAME
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SNAPSHOTS_DIRNAME = "snapshots"
+CURRENT_FILENAME = "CURRENT"
+# Marker files "<version>.<pid>" for snapshots a serving process has loaded
+PINS_DIRNAME = ".pins"
+
+
+def snapshots_directory(root: Path) -> Path:
+    return Path(root) / SNAPSHOTS_DIRNAME
+
+
+def current_version(root: Path) -> Optional[str]:
+    """Name of the published snapshot, or None if nothing was published."""
+    try:
+        return (Path(root) / CURRENT_FILENAME).read_text().strip() or None
+    except OSError:
+        return None
+
+
+def current_snapshot(root: Path) -> Optional[Path]:
+    version = current_version(root)
+    return snapshots_directory(root) / version if version else None
+
+
+def list_snapshots(root: Path) -> List[str]:
+    directory = snapshots_directory(root)
+    if not directory.exists():
+        return []
+    return sorted(p.name for p in directory.iterdir() if p.is_dir() and not p.name.startswith("."))
+
+
+def publish_snapshot(root: Path, source: Optional[Path] = None) -> str:
+    """
+    Copy a freshly built index into a new immutable snapshot and make it current.
+
+    The copy is assembled in a hidden staging directory and renamed into
+    place, then CURRENT is replaced atomically, so a watcher never sees a
+    partially written snapshot.
+
+    Args:
+        root: Index root holding snapshots/ and CURRENT (the persist directory)
+        source: Built index to publish; defaults to the files directly in root
+
+    Returns:
+        The new snapshot version
+    """
+    root = Path(root)
+    source = Path(source) if source else root
+    version = datetime.now().strftime("%Y%m%d-%H%M%S-%f")
+
+    directory = snapshots_directory(root)
+    directory.mkdir(parents=True, exist_ok=True)
+    staging = directory / f".staging-{version}"
+
+    skip = {SNAPSHOTS_DIRNAME, CURRENT_FILENAME, CHECKPOINT_DIRNAME}
+    staging.mkdir()
+    for item in source.iterdir():
+        if item.name in skip or item.name.endswith(".tmp"):
+            continue
+        if item.is_dir():
+            shutil.copytree(item, staging / item.name)
+        else:
+            shutil.copy2(item, staging / item.name)
+    os.rename(staging, directory / version)
+
+    pointer = root / CURRENT_FILENAME
+    tmp_pointer = root / (CURRENT_FILENAME + ".tmp")
+    tmp_pointer.write_text(version)
+    os.replace(tmp_pointer, pointer)
+
+    logger.info(f"Published index snapshot {version}")
+    return version
+
+
+def _pin_path(root: Path, version: str) -> Path:
+    return snapshots_directory(root) / PINS_DIRNAME / f"{version}.{os.getpid()}"
+
+
+def _process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def pinned_versions(root: Path) -> Set[str]:
+    """Snapshots loaded by a running process; pins left by dead processes are removed."""
+    directory = snapshots_directory(root) / PINS_DIRNAME
+    if not directory.exists():
+        return set()
+    pinned = set()
+    for pin in directory.iterdir():
+        version, _, pid = pin.name.rpartition(".")
+        if pid.isdigit() and _process_alive(int(pid)):
+            pinned.add(version)
+        else:
+            pin.unlink(missing_ok=True)
+    return pinned
+
+
+def prune_snapshots(root: Path, keep: int = 3) -> List[str]:
+    """Delete all but the newest `keep` snapshots, never the current one or one still being served."""
+    current = current_version(root)
+    pinned = pinned_versions(root)
+    versions = list_snapshots(root)
+    removed = []
+    for version in versions[:-keep] if keep > 0 else versions:
+        if version == current or version in pinned:
+            continue
+        shutil.rmtree(snapshots_directory(root) / version, ignore_errors=True)
+        removed.append(version)
+    return removed
+
+
+class _LoadedSnapshot:
+    """An engine loaded from one snapshot, with a count of in-flight requests using it."""
+
+    def __init__(self, version: Optional[str], engine: Any):
+        self.version = version
+        self.engine = engine
+        self.readers = 0
+        self.retired = False
+
+
+class SnapshotManager:
+    """
+    Serves requests from the current snapshot and swaps in new ones without downtime.
+
+    A watcher thread polls CURRENT; when a new version appears it loads (and
+    optionally warms up) the engine in the background, then swaps the
+    reference under a short lock. Requests hold the snapshot they started
+    with through acquire(); a replaced snapshot is released when its last
+    in-flight request finishes. A version that fails to load is not
+    retried until CURRENT names a different one.
+
+    While a snapshot is loaded its version is pinned with a marker file, so
+    prune_snapshots() in another process leaves it alone until it is released.
+    """
+
+    def __init__(self,
+                 root: Path,
+                 loader: Callable[[Path], Any],
+                 poll_interval: float = 5.0,
+                 warmup: Optional[Callable[[Any], None]] = None):
+        """
+        Args:
+            root: Index root holding snapshots/ and CURRENT
+            loader: Builds a ready-to-serve engine from a snapshot directory (None on failure)
+            poll_interval: Seconds between checks for a new snapshot
+            warmup: Optional callable run on a new engine before it takes traffic
+        """
+        self.root = Path(root)
+        self.loader = loader
+        self.poll_interval = poll_interval
+        self.warmup = warmup
+
+        self._lock = threading.Lock()
+        self._current: Optional[_LoadedSnapshot] = None
+        # Last version that failed to load; not retried until CURRENT names another
+        self._failed_version: Optional[str] = None
+        self._stop = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+
+    @property
+    def version(self) -> Optional[str]:
+        return self._current.version if self._current else None
+
+    def load_current(self) -> bool:
+        """Load the published snapshot synchronously; used at startup."""
+        return self._load(current_version(self.root))
+
+    def start(self):
+        """Start watching for new snapshots."""
+        if self._watcher is None:
+            self._watcher = threading.Thread(target=self._watch, name="snapshot-watcher", daemon=True)
+            self._watcher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @contextmanager
+    def acquire(self):
+        """Pin the current engine for the duration of one request."""
+        with self._lock:
+            snapshot = self._current
+            if snapshot is None:
+                raise RuntimeError("No index snapshot loaded")
+            snapshot.readers += 1
+        try:
+            yield snapshot.engine
+        finally:
+            with self._lock:
+                snapshot.readers -= 1
+                release = snapshot.retired and snapshot.readers == 0
+            if release:
+                self._release(snapshot)
+
+    def _load(self, version: Optional[str]) -> bool:
+        if version is None:
+            return False
+
+        logger.info(f"Loading index snapshot {version}")
+        self._pin(version)
+        try:
+            engine = self.loader(snapshots_directory(self.root) / version)
+        except Exception:
+            self._unpin(version)
+            raise
+        if engine is None:
+            logger.error(f"Snapshot {version} could not be loaded; keeping {self.version}")
+            self._unpin(version)
+            self._failed_version = version
+            return False
+        self._failed_version = None
+
+        if self.warmup is not None:
+            try:
+                self.warmup(engine)
+            except Exception as e:
+                logger.warning(f"Warm-up of snapshot {version} failed: {e}")
+
+        # Swap: new requests see the new engine immediately
+        with self._lock:
+            previous = self._current
+            self._current = _LoadedSnapshot(version, engine)
+            if previous is not None:
+                previous.retired = True
+                release = previous.readers == 0
+        if previous is not None and release:
+            self._release(previous)
+
+        logger.info(f"Now serving index snapshot {version}")
+        return True
+
+    def _release(self, snapshot: _LoadedSnapshot):
+        close = getattr(snapshot.engine, "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception as e:
+                logger.warning(f"Error closing snapshot {snapshot.version}: {e}")
+        snapshot.engine = None
+        if snapshot.version is not None:
+            self._unpin(snapshot.version)
+        logger.info(f"Released index snapshot {snapshot.version}")
+
+    def _pin(self, version: str):
+        try:
+            path = _pin_path(self.root, version)
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.touch()
+        except OSError as e:
+            logger.warning(f"Could not pin snapshot {version}: {e}")
+
+    def _unpin(self, version: str):
+        # Another load of the same version in this process may still hold it
+        with self._lock:
+            if self._current is not None and self._current.version == version:
+                return
+        _pin_path(self.root, version).unlink(missing_ok=True)
+
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            version = current_version(self.root)
+            if not version or version == self.version or version == self._failed_version:
+                continue
+            try:
+                self._load(version)
+            except Exception as e:
+                logger.error(f"Error loading snapshot {version}: {e}")
+                self._failed_version = version
+
+
+def main():
+    """Command-line management of index snapshots"""
+    parser = argparse.ArgumentParser(description="Manage versioned index snapshots")
+    parser.add_argument("command", choices=["publish", "list", "prune"])
+    parser.add_argument("root", nargs="?", default="rag/chroma_db",
+                        help="Index root (the engine's persist directory)")
+    parser.add_argument("--source", help="Built index directory to publish (defaults to root)")
+    parser.add_argument("--keep", type=int, default=3, help="Snapshots to keep when pruning")
+    args = parser.parse_args()
+
+    if args.command == "publish":
+        version = publish_snapshot(Path(args.root), Path(args.source) if args.source else None)
+        print(f"✅ Published snapshot {version}")
+    elif args.command == "list":
+        current = current_version(Path(args.root))
+        for version in list_snapshots(Path(args.root)):
+            print(f"{'*' if version == current else ' '} {version}")
+    elif args.command == "prune":
+        removed = prune_snapshots(Path(args.root), keep=args.keep)
+        print(f"🗑️ Removed {len(removed)} snapshot(s)")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
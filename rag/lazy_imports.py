@@ -0,0 +1,156 @@
+"""
+Lazy Imports for Environmental Law RAG System
+Defers heavy third-party imports to first use and reports module import times
+"""
+
+import os
+import re
+import sys
+import time
+import logging
+import argparse
+import importlib
+import subprocess
+import threading
+from typing import List, Dict, Any, Optional, Tuple
+from pathlib import Path
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Modules reported by default: the engines, web interfaces and setup scripts
+DEFAULT_REPORT_MODULES = [
+    "rag", "rag_simple", "rag_improved", "rag_ultra_simple",
+    "web_interface", "web_interface_simple", "web_interface_ultra_simple",
+    "setup_rag", "setup_rag_simple", "setup_rag_improved", "setup_rag_ultra_simple",
+]
+
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    started = time.perf_counter()
+                    self._module = importlib.import_module(self._name)
+                    logger.debug(f"Imported {self._name} on first use in {time.perf_counter() - started:.2f}s")
+        return self._module
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._load(), attribute)
+
+    def __repr__(self) -> str:
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module '{self._name}' ({state})>"
+
+
+class LazyAttribute:
+    """Stands in for a class or function of a lazily imported module."""
+
+    def __init__(self, module: LazyModule, attribute: str):
+        self._module = module
+        self._attribute = attribute
+
+    def _resolve(self):
+        return getattr(self._module._load(), self._attribute)
+
+    def __call__(self, *args, **kwargs):
+        return self._resolve()(*args, **kwargs)
+
+    def __getattr__(self, attribute: str):
+        return getattr(self._resolve(), attribute)
+
+    def __repr__(self) -> str:
+        return f"<lazy {self._module._name}.{self._attribute}>"
+
+
+_modules: Dict[str, LazyModule] = {}
+
+
+def lazy_import(module_name: str, attribute: Optional[str] = None):
+    """
+    Lazy replacement for `import module_name` or `from module_name import attribute`.
+
+    The module is imported the first time the returned object is used, e.g.
+        PyPDF2 = lazy_import("PyPDF2")
+        Chroma = lazy_import("langchain.vectorstores", "Chroma")
+    """
+    module = _modules.setdefault(module_name, LazyModule(module_name))
+    return LazyAttribute(module, attribute) if attribute else module
+
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+
+def measure_import(module_name: str, top: int = 10) -> Dict[str, Any]:
+    """
+    Import a module in a fresh interpreter with -X importtime.
+
+    Returns:
+        {'module', 'seconds', 'slowest': [(cumulative seconds, module), ...], 'error'}
+    """
+    rag_directory = str(Path(__file__).parent)
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [rag_directory, env.get("PYTHONPATH")]))
+
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module_name}"],
+        capture_output=True, text=True, env=env, cwd=rag_directory
+    )
+
+    # Children are printed before their parent, so the direct dependencies of
+    # the measured module are the depth-1 lines just before its own line
+    timings: List[Tuple[float, str]] = []
+    children: List[Tuple[float, str]] = []
+    total = 0.0
+    for line in process.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if not match:
+            continue
+        cumulative = int(match.group(2)) / 1e6
+        name = match.group(4)
+        depth = (len(match.group(3)) - 1) // 2
+        if depth == 1:
+            children.append((cumulative, name))
+        elif depth == 0:
+            if name == module_name:
+                total = cumulative
+                timings = children
+            children = []
+
+    timings.sort(reverse=True)
+    error = None
+    if process.returncode != 0:
+        error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "import failed"
+    return {"module": module_name, "seconds": total, "slowest": timings[:top], "error": error}
+
+
+def main():
+    """Report how long the RAG modules take to import"""
+    parser = argparse.ArgumentParser(description="Import-time report for the RAG modules")
+    parser.add_argument("command", choices=["report"])
+    parser.add_argument("modules", nargs="*", help="Modules to measure (default: engines, web apps, setup scripts)")
+    parser.add_argument("--top", type=int, default=5, help="Slowest dependencies to list per module")
+    args = parser.parse_args()
+
+    for module_name in args.modules or DEFAULT_REPORT_MODULES:
+        result = measure_import(module_name, top=args.top)
+        if result["error"]:
+            print(f"❌ {module_name}: {result['error']}")
+            continue
+        print(f"{module_name}: {result['seconds']:.3f}s")
+        for seconds, name in result["slowest"]:
+            print(f"    {seconds:.3f}s  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Legal Text Tokenizer for Environmental Law RAG System
+Precompiled analyzer shared by TF-IDF indexing and query vectorization
+"""
+
+import re
+import logging
+from itertools import chain, islice
+from typing import List, Iterable, Iterator, Tuple, Union
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Order matters: the first alternative that matches at a position wins, and
+# words come first because they are by far the most common tokens
+_TOKEN_PATTERN = re.compile(
+    # Words of two or more characters starting with a letter
+    r"[^\W\d_]\w+"
+    # Amounts with digit grouping, kept whole: 10,000 and 1,00,000
+    r"|\d+(?:,\d+)+"
+    # Legal numbering: 5, 15A, 2.1.3, 21(1)(iv), 3(2)(b)
+    r"|\d+[a-z]?(?:\.\d+[a-z]?)*(?:\([0-9a-z]{1,5}\))*"
+)
+
+
+def _english_stop_words() -> frozenset:
+    # scikit-learn's list, so stop word handling matches the previous analyzer
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return frozenset(ENGLISH_STOP_WORDS)
+
+
+class LegalTokenizer:
+    """
+    Analyzer for statutes and rules, usable as TfidfVectorizer(analyzer=...).
+
+    Text is lowercased and split with one precompiled pattern that keeps
+    section and clause references such as 21(1)(iv), 2.1.3 and 15A (and
+    single-digit section numbers) as tokens, which the default \\w\\w+ pattern
+    breaks apart or drops. Stop words are removed with a frozenset lookup
+    before n-grams are formed, as scikit-learn does, and n-grams are
+    produced lazily from the token list without building intermediate lists.
+    """
+
+    def __init__(self,
+                 ngram_range: Tuple[int, int] = (1, 2),
+                 stop_words: Union[str, Iterable[str], None] = 'english'):
+        """
+        Args:
+            ngram_range: Smallest and largest n-gram size
+            stop_words: 'english' for scikit-learn's list, an iterable of words, or None
+        """
+        self.ngram_range = tuple(ngram_range)
+        if stop_words == 'english':
+            self.stop_words = _english_stop_words()
+        else:
+            self.stop_words = frozenset(stop_words or ())
+
+    def tokens(self, text: str) -> List[str]:
+        """Unigram tokens with stop words removed."""
+        stop_words = self.stop_words
+        return [token for token in _TOKEN_PATTERN.findall(text.lower()) if token not in stop_words]
+
+    def __call__(self, text: str) -> Iterator[str]:
+        tokens = self.tokens(text)
+        min_n, max_n = self.ngram_range
+        if (min_n, max_n) == (1, 2):
+            # The engines' setting: unigrams, then bigrams joined straight from a zip
+            return chain(tokens, map(" ".join, zip(tokens, islice(tokens, 1, None))))
+        ngrams = []
+        for n in range(min_n, max_n + 1):
+            if n == 1:
+                ngrams.append(tokens)
+            else:
+                ngrams.append(map(" ".join, zip(*(islice(tokens, i, None) for i in range(n)))))
+        return chain.from_iterable(ngrams)
+
+    def __repr__(self) -> str:
+        return f"LegalTokenizer(ngram_range={self.ngram_range}, stop_words={len(self.stop_words)} words)"
+
+
+def tfidf_vectorizer_params(ngram_range: Tuple[int, int] = (1, 2)) -> dict:
+    """Keyword arguments for the engines' TfidfVectorizer, tokenized with LegalTokenizer."""
+    return dict(
+        analyzer=LegalTokenizer(ngram_range=ngram_range),
+        max_features=5000,
+        min_df=2,
+        max_df=0.8
+    )
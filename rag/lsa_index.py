@@ -0,0 +1,107 @@
+"""
+LSA Dense Index for Environmental Law RAG System
+Truncated-SVD projection of the TF-IDF matrix scored with one matrix-vector product
+"""
+
+import time
+import logging
+from typing import Optional
+from pathlib import Path
+
+import numpy as np
+
+from lazy_imports import lazy_import
+
+TruncatedSVD = lazy_import("sklearn.decomposition", "TruncatedSVD")
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+VECTORS_FILENAME = "lsa_vectors.npy"
+PROJECTION_FILENAME = "lsa_projection.npy"
+
+DEFAULT_DIMENSIONS = 256
+
+
+class LSAIndex:
+    """
+    Latent semantic index over the TF-IDF rows.
+
+    Chunks are stored as an (n_chunks, dimensions) C-contiguous float32
+    array of unit vectors. A query's TF-IDF vector is projected with the
+    (n_features, dimensions) SVD basis and normalized, so cosine scores for
+    every chunk come from a single BLAS matrix-vector product.
+    """
+
+    def __init__(self, vectors: np.ndarray, projection: np.ndarray):
+        self.vectors = vectors
+        self.projection = projection
+
+    @property
+    def dimensions(self) -> int:
+        return self.vectors.shape[1]
+
+    @property
+    def num_features(self) -> int:
+        return self.projection.shape[0]
+
+    def __len__(self) -> int:
+        return self.vectors.shape[0]
+
+    @classmethod
+    def build(cls, tfidf_matrix, dimensions: int = DEFAULT_DIMENSIONS, random_state: int = 42) -> "LSAIndex":
+        """
+        Fit a truncated SVD of the TF-IDF matrix.
+
+        Args:
+            tfidf_matrix: (n_chunks, n_features) TF-IDF matrix, sparse or dense
+            dimensions: Number of latent dimensions (capped by the matrix shape)
+        """
+        started = time.perf_counter()
+        dimensions = max(1, min(dimensions, tfidf_matrix.shape[0] - 1, tfidf_matrix.shape[1] - 1))
+        svd = TruncatedSVD(n_components=dimensions, algorithm="randomized", random_state=random_state)
+        reduced = svd.fit_transform(tfidf_matrix)
+
+        vectors = np.ascontiguousarray(_unit_rows(reduced), dtype=np.float32)
+        projection = np.ascontiguousarray(svd.components_.T, dtype=np.float32)
+        logger.info(f"Built {dimensions}-dimensional LSA index for {len(vectors)} chunks "
+                    f"in {time.perf_counter() - started:.2f}s "
+                    f"(explained variance {svd.explained_variance_ratio_.sum():.1%})")
+        return cls(vectors, projection)
+
+    def project(self, query_vector) -> np.ndarray:
+        """Unit-length LSA vector of a (1, n_features) TF-IDF query vector."""
+        query = np.asarray(query_vector @ self.projection, dtype=np.float32).ravel()
+        norm = np.linalg.norm(query)
+        return query / norm if norm > 0 else query
+
+    def scores(self, query_vector) -> np.ndarray:
+        """Cosine similarity of the query to every chunk."""
+        return self.vectors @ self.project(query_vector)
+
+    def save(self, directory: Path):
+        np.save(Path(directory) / VECTORS_FILENAME, self.vectors)
+        np.save(Path(directory) / PROJECTION_FILENAME, self.projection)
+
+    @classmethod
+    def load(cls, directory: Path, mmap_mode: Optional[str] = None) -> Optional["LSAIndex"]:
+        vectors_file = Path(directory) / VECTORS_FILENAME
+        projection_file = Path(directory) / PROJECTION_FILENAME
+        if not vectors_file.exists() or not projection_file.exists():
+            return None
+        return cls(np.load(vectors_file, mmap_mode=mmap_mode), np.load(projection_file, mmap_mode=mmap_mode))
+
+    @staticmethod
+    def remove(directory: Path):
+        """Delete a saved LSA index, e.g. when the TF-IDF index it projects is rebuilt."""
+        (Path(directory) / VECTORS_FILENAME).unlink(missing_ok=True)
+        (Path(directory) / PROJECTION_FILENAME).unlink(missing_ok=True)
+
+    def nbytes(self) -> int:
+        return self.vectors.nbytes + self.projection.nbytes
+
+
+def _unit_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
@@ -0,0 +1,197 @@
+"""
+Columnar Metadata Store for Environmental Law RAG System
+Per-chunk metadata as integer columns over a small document table
+"""
+
+import re
+import sys
+import json
+import logging
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Union, Tuple
+from pathlib import Path
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+STORE_FILENAME = "metadata_columns.npz"
+
+# Fields shared by every chunk of a PDF, stored once per document
+DOCUMENT_FIELDS = ('source', 'file_path', 'total_pages', 'document_type')
+
+# Columns stored per chunk; pages are -1 when unknown
+CHUNK_COLUMNS = ('doc_id', 'chunk_index', 'total_chunks', 'page_start', 'page_end')
+
+_PAGE_MARKER = re.compile(r"--- Page (\d+) ---")
+
+
+def _page_span(text: str, previous_page: int) -> Tuple[int, int]:
+    """First and last page a chunk covers, from the page markers inserted at extraction."""
+    pages = [int(number) for number in _PAGE_MARKER.findall(text)]
+    if not pages:
+        return previous_page, previous_page
+    # A chunk that does not open with a marker continues the page the previous chunk ended on
+    starts_on_marker = _PAGE_MARKER.match(text.lstrip()) is not None
+    start = pages[0] if starts_on_marker or previous_page < 0 else previous_page
+    return start, pages[-1]
+
+
+class ChunkMetadataStore:
+    """
+    Chunk metadata held as columns instead of one dict per chunk.
+
+    A small document table keeps the fields every chunk of a PDF repeats
+    (source, file_path, total_pages, document_type) with interned strings;
+    per-chunk values are NumPy integer columns (doc_id, chunk_index,
+    total_chunks, page_start, page_end). Filters are evaluated over whole
+    columns, and the usual metadata dict is only materialized for the
+    chunks a search returns.
+    """
+
+    def __init__(self, documents: List[Dict[str, Any]], columns: Dict[str, np.ndarray]):
+        self.documents = [
+            {field: sys.intern(value) if isinstance(value, str) else value for field, value in document.items()}
+            for document in documents
+        ]
+        self.doc_id = columns['doc_id'].astype(np.int32)
+        self.chunk_index = columns['chunk_index'].astype(np.int32)
+        self.total_chunks = columns['total_chunks'].astype(np.int32)
+        self.page_start = columns['page_start'].astype(np.int32)
+        self.page_end = columns['page_end'].astype(np.int32)
+        self._doc_ids_by_field: Dict[str, Dict[Any, List[int]]] = {}
+
+    @classmethod
+    def from_records(cls,
+                     records: Iterable[Dict[str, Any]],
+                     texts: Optional[List[str]] = None) -> "ChunkMetadataStore":
+        """
+        Build the store from per-chunk metadata dicts in index order.
+
+        Page spans are derived from the chunk texts when given; chunks of one
+        document must appear in chunk order for pages to carry over.
+        """
+        documents: List[Dict[str, Any]] = []
+        doc_ids: Dict[Tuple, int] = {}
+        last_page: Dict[int, int] = {}
+        columns: Dict[str, List[int]] = {name: [] for name in CHUNK_COLUMNS}
+
+        for i, record in enumerate(records):
+            record = record or {}
+            key = tuple(record.get(field) for field in DOCUMENT_FIELDS)
+            doc_id = doc_ids.get(key)
+            if doc_id is None:
+                doc_id = doc_ids[key] = len(documents)
+                documents.append({field: value for field, value in zip(DOCUMENT_FIELDS, key) if value is not None})
+
+            page_start, page_end = _page_span(texts[i], last_page.get(doc_id, -1)) if texts else (-1, -1)
+            last_page[doc_id] = page_end
+
+            columns['doc_id'].append(doc_id)
+            columns['chunk_index'].append(int(record.get('chunk_index', 0)))
+            columns['total_chunks'].append(int(record.get('total_chunks', 0)))
+            columns['page_start'].append(page_start)
+            columns['page_end'].append(page_end)
+
+        return cls(documents, {name: np.array(values, dtype=np.int32) for name, values in columns.items()})
+
+    def __len__(self) -> int:
+        return len(self.doc_id)
+
+    def source(self, index: int) -> str:
+        return self.documents[self.doc_id[index]].get('source', 'Unknown')
+
+    def record(self, index: int) -> Dict[str, Any]:
+        """The metadata dict of one chunk, in the form the engines have always returned."""
+        document = self.documents[self.doc_id[index]]
+        chunk_index = int(self.chunk_index[index])
+        metadata = dict(document)
+        metadata.update({
+            'chunk_id': f"{document.get('source')}_chunk_{chunk_index}",
+            'chunk_index': chunk_index,
+            'total_chunks': int(self.total_chunks[index])
+        })
+        if self.page_start[index] >= 0:
+            metadata['page_start'] = int(self.page_start[index])
+            metadata['page_end'] = int(self.page_end[index])
+        return metadata
+
+    def records(self, indices: Optional[Iterable[int]] = None) -> Iterator[Dict[str, Any]]:
+        """Materialize metadata dicts for the given chunks (all chunks by default)."""
+        for index in (range(len(self)) if indices is None else indices):
+            yield self.record(index)
+
+    def _doc_ids(self, field: str, values) -> List[int]:
+        """Document ids whose field equals any of the values."""
+        if field not in self._doc_ids_by_field:
+            lookup: Dict[Any, List[int]] = {}
+            for doc_id, document in enumerate(self.documents):
+                lookup.setdefault(document.get(field), []).append(doc_id)
+            self._doc_ids_by_field[field] = lookup
+        lookup = self._doc_ids_by_field[field]
+        if isinstance(values, (str, int)):
+            values = [values]
+        return [doc_id for value in values for doc_id in lookup.get(value, [])]
+
+    def mask(self,
+             source: Union[str, List[str], None] = None,
+             document_type: Union[str, List[str], None] = None,
+             page: Union[int, Tuple[int, int], None] = None) -> np.ndarray:
+        """
+        Boolean mask over all chunks matching every given filter.
+
+        Args:
+            source: PDF file name, or a list of them
+            document_type: Document type, or a list of them
+            page: Page number, or an inclusive (first, last) range the chunk must overlap
+        """
+        selected = np.ones(len(self), dtype=bool)
+        if source is not None:
+            selected &= np.isin(self.doc_id, self._doc_ids('source', source))
+        if document_type is not None:
+            selected &= np.isin(self.doc_id, self._doc_ids('document_type', document_type))
+        if page is not None:
+            first, last = (page, page) if isinstance(page, int) else page
+            selected &= (self.page_start >= 0) & (self.page_start <= last) & (self.page_end >= first)
+        return selected
+
+    def save(self, persist_directory: Path):
+        with open(Path(persist_directory) / STORE_FILENAME, 'wb') as f:
+            np.savez(
+                f,
+                documents=np.array(json.dumps(self.documents)),
+                **{name: getattr(self, name) for name in CHUNK_COLUMNS}
+            )
+
+    @classmethod
+    def load(cls, persist_directory: Path) -> Optional["ChunkMetadataStore"]:
+        path = Path(persist_directory) / STORE_FILENAME
+        if not path.exists():
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            documents = json.loads(str(data['documents']))
+            columns = {name: data[name] for name in CHUNK_COLUMNS}
+        return cls(documents, columns)
+
+    @classmethod
+    def load_or_convert(cls,
+                        persist_directory: Path,
+                        expected_chunks: Optional[int] = None,
+                        texts: Optional[List[str]] = None,
+                        save: bool = True) -> "ChunkMetadataStore":
+        """
+        Load the columnar store, converting metadata.json once for indexes built before it existed.
+
+        With save=False the converted store is only kept in memory, e.g. for a read-only snapshot.
+        """
+        store = cls.load(persist_directory)
+        if store is not None and (expected_chunks is None or len(store) == expected_chunks):
+            return store
+
+        logger.info("Converting metadata.json to the columnar metadata store")
+        with open(Path(persist_directory) / "metadata.json", 'r') as f:
+            store = cls.from_records(json.load(f), texts)
+        if save:
+            store.save(persist_directory)
+        return store
@@ -0,0 +1,343 @@
+"""
+Out-of-Core Index Build for Environmental Law RAG System
+Streams chunks through a hashing vectorizer and builds the TF-IDF index on disk
+"""
+
+import os
+import json
+import math
+import shutil
+import logging
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from pathlib import Path
+
+import numpy as np
+
+from lazy_imports import lazy_import
+from corpus_stats import CorpusStatistics
+from metadata_store import STORE_FILENAME as METADATA_STORE_FILENAME
+from lsa_index import LSAIndex
+from anytime_search import BlockMaxIndex
+from positional_index import PositionalIndex
+from suggest_index import SuggestIndex, act_title, logged_queries, saved_queries, section_titles
+from legal_tokenizer import LegalTokenizer
+
+sparse = lazy_import("scipy.sparse")
+HashingVectorizer = lazy_import("sklearn.feature_extraction.text", "HashingVectorizer")
+normalize = lazy_import("sklearn.preprocessing", "normalize")
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CSR_DIRNAME = "tfidf_csr"
+BLOCKS_DIRNAME = "ooc_blocks"
+
+# Rough peak bytes per character of chunk text while a batch is vectorized
+# (token strings, n-gram hashing and the sparse count block)
+BYTES_PER_CHAR = 24
+
+
+class HashedTfidfVectorizer:
+    """
+    Query-side counterpart of an out-of-core build.
+
+    Hashes text exactly as the build did, applies the IDF weights computed
+    in the first pass (zero for pruned features) and L2-normalizes, so query
+    vectors live in the same space as the on-disk index rows.
+    """
+
+    def __init__(self, idf: np.ndarray, n_features: int, ngram_range: Tuple[int, int], stop_words):
+        self.idf = idf.astype(np.float32)
+        self.n_features = n_features
+        self.ngram_range = tuple(ngram_range)
+        self.stop_words = stop_words
+        self._hasher = None
+
+    @property
+    def hasher(self):
+        if self._hasher is None:
+            self._hasher = make_hasher(self.n_features, self.ngram_range, self.stop_words)
+        return self._hasher
+
+    def transform(self, texts: List[str]):
+        counts = self.hasher.transform(texts)
+        return apply_idf(counts, self.idf)
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state["_hasher"] = None
+        return state
+
+
+def make_hasher(n_features: int, ngram_range: Tuple[int, int], stop_words):
+    """Stateless term counter with the same tokenization as the in-memory TfidfVectorizer."""
+    return HashingVectorizer(
+        n_features=n_features,
+        analyzer=LegalTokenizer(ngram_range=ngram_range, stop_words=stop_words),
+        alternate_sign=False,
+        norm=None,
+        dtype=np.float32
+    )
+
+
+def apply_idf(counts, idf: np.ndarray):
+    """Raw term counts -> L2-normalized TF-IDF rows, dropping pruned features."""
+    counts = counts.tocsr()
+    counts.sum_duplicates()
+    counts.data *= idf[counts.indices]
+    counts.eliminate_zeros()
+    return normalize(counts, norm="l2", copy=False)
+
+
+def csr_directory(persist_directory: Path) -> Path:
+    return Path(persist_directory) / CSR_DIRNAME
+
+
+def has_csr_index(persist_directory: Path) -> bool:
+    return (csr_directory(persist_directory) / "manifest.json").exists()
+
+
+def load_csr_index(persist_directory: Path, mmap: bool = True):
+    """
+    Open the on-disk CSR TF-IDF matrix.
+
+    With mmap the data, indices and indptr arrays are memory-mapped, so the
+    matrix is paged in on demand instead of read into memory.
+    """
+    directory = csr_directory(persist_directory)
+    with open(directory / "manifest.json", 'r') as f:
+        manifest = json.load(f)
+
+    mode = "r" if mmap else None
+
+    def array(name, dtype, length):
+        if length == 0:
+            return np.zeros(0, dtype=dtype)
+        if mmap:
+            return np.memmap(directory / name, dtype=dtype, mode=mode, shape=(length,))
+        return np.fromfile(directory / name, dtype=dtype, count=length)
+
+    rows, columns = manifest["shape"]
+    data = array("data.bin", manifest["data_dtype"], manifest["nnz"])
+    indices = array("indices.bin", manifest["indices_dtype"], manifest["nnz"])
+    indptr = array("indptr.bin", manifest["indptr_dtype"], rows + 1)
+    return sparse.csr_matrix((data, indices, indptr), shape=(rows, columns), copy=False)
+
+
+class _JsonArrayWriter:
+    """Writes a JSON array one element at a time."""
+
+    def __init__(self, path: Path):
+        self.file = open(path, 'w')
+        self.file.write("[")
+        self.count = 0
+
+    def write(self, item):
+        if self.count:
+            self.file.write(", ")
+        json.dump(item, self.file)
+        self.count += 1
+
+    def close(self):
+        self.file.write("]")
+        self.file.close()
+
+
+class OutOfCoreIndexBuilder:
+    """
+    Two-pass TF-IDF build whose peak memory is bounded by a budget.
+
+    Pass 1 streams chunks in batches sized to the budget, hashes each batch
+    to term counts, accumulates document frequencies and writes the counts
+    as a sparse block to disk; chunk records are streamed to chunks.json and
+    metadata.json as they arrive. Pass 2 derives IDF weights and the
+    min_df/max_df feature mask from the frequencies, then reweights one
+    block at a time and appends it to a CSR matrix on disk.
+
+    Hashing replaces the fitted vocabulary, so neither pass needs the whole
+    corpus in memory; hash collisions merge a few rare terms. No positional
+    index is built, since it would hold every term position in memory;
+    phrase queries fall back to TF-IDF search. Act names and section titles
+    for autocomplete are counted during pass 1.
+    """
+
+    def __init__(self,
+                 persist_directory: Path,
+                 memory_budget_mb: int = 256,
+                 n_features: int = 2 ** 20,
+                 ngram_range: Tuple[int, int] = (1, 2),
+                 stop_words='english',
+                 min_df: int = 2,
+                 max_df: float = 0.8):
+        """
+        Args:
+            persist_directory: Index directory
+            memory_budget_mb: Peak memory allowed for batches and frequency tables
+            n_features: Hash space size (columns of the index)
+            ngram_range, stop_words, min_df, max_df: As for the in-memory TfidfVectorizer
+        """
+        self.persist_directory = Path(persist_directory)
+        self.memory_budget = memory_budget_mb * 1024 * 1024
+        self.n_features = n_features
+        self.ngram_range = ngram_range
+        self.stop_words = stop_words
+        self.min_df = min_df
+        self.max_df = max_df
+
+        # Frequency table (int64) and IDF weights (float32) stay resident for the
+        # whole build; the IDF step adds two bool masks over the features
+        fixed = n_features * (8 + 4 + 2)
+        self.batch_chars = (self.memory_budget - fixed) // BYTES_PER_CHAR
+        if self.batch_chars < 100_000:
+            raise ValueError(
+                f"Memory budget of {memory_budget_mb} MB is too small for {n_features} hashed features"
+            )
+
+    def build(self, chunks: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Build the index from a stream of chunks ('content' and 'metadata').
+
+        Writes chunks.json, metadata.json, tfidf_csr/, vectorizer.pkl,
+        suggestions and corpus statistics into the persist directory.
+
+        Returns:
+            Summary of the build
+        """
+        blocks_directory = self.persist_directory / BLOCKS_DIRNAME
+        shutil.rmtree(blocks_directory, ignore_errors=True)
+        blocks_directory.mkdir(parents=True)
+
+        try:
+            blocks, document_frequency, total_chunks, stats, suggest_counts = self._count_pass(chunks, blocks_directory)
+            idf, kept = self._idf(document_frequency, total_chunks)
+            nnz = self._merge_pass(blocks, idf, total_chunks)
+        finally:
+            shutil.rmtree(blocks_directory, ignore_errors=True)
+
+        import pickle
+        with open(self.persist_directory / "vectorizer.pkl", 'wb') as f:
+            pickle.dump(HashedTfidfVectorizer(idf, self.n_features, self.ngram_range, self.stop_words), f)
+
+        # A dense matrix, LSA projection or positional index from an earlier in-memory
+        # build would shadow this index or describe other chunks, and columnar
+        # metadata is rebuilt from the streamed metadata.json on first load
+        (self.persist_directory / "tfidf_matrix.npy").unlink(missing_ok=True)
+        (self.persist_directory / METADATA_STORE_FILENAME).unlink(missing_ok=True)
+        LSAIndex.remove(self.persist_directory)
+        PositionalIndex.remove(self.persist_directory)
+
+        # Block maxima for anytime search, read block by block from the memory-mapped matrix
+        BlockMaxIndex.build(load_csr_index(self.persist_directory)).save(self.persist_directory)
+
+        # A hashed vocabulary has no terms to suggest; acts and section titles still are
+        SuggestIndex.from_counts(suggest_counts, logged_queries(self.persist_directory)).save(self.persist_directory)
+        stats.save(self.persist_directory)
+        logger.info(f"Out-of-core build finished: {total_chunks} chunks, {kept} features, {nnz} nonzeros")
+        return {
+            "total_chunks": total_chunks,
+            "blocks": len(blocks),
+            "features": kept,
+            "nnz": nnz
+        }
+
+    def _count_pass(self, chunks: Iterable[Dict[str, Any]], blocks_directory: Path):
+        """Pass 1: hash batches to count blocks on disk and accumulate document frequencies."""
+        hasher = make_hasher(self.n_features, self.ngram_range, self.stop_words)
+        document_frequency = np.zeros(self.n_features, dtype=np.int64)
+        stats = CorpusStatistics()
+        suggest_counts = {"section": Counter(), "act": Counter(), "query": Counter(saved_queries(self.persist_directory))}
+        chunks_writer = _JsonArrayWriter(self.persist_directory / "chunks.json")
+        metadata_writer = _JsonArrayWriter(self.persist_directory / "metadata.json")
+
+        blocks = []
+        batch: List[str] = []
+        batch_chars = 0
+        total_chunks = 0
+
+        def flush():
+            counts = hasher.transform(batch).tocsr()
+            counts.sum_duplicates()
+            # Only the features present in the batch are touched; a bincount with
+            # minlength=n_features would allocate a second full frequency table
+            features, frequencies = np.unique(counts.indices, return_counts=True)
+            document_frequency[features] += frequencies
+            path = blocks_directory / f"block_{len(blocks):05d}.npz"
+            sparse.save_npz(path, counts)
+            blocks.append(path)
+            logger.info(f"Counted block {len(blocks)} ({total_chunks} chunks so far)")
+
+        try:
+            for chunk in chunks:
+                chunks_writer.write(chunk)
+                metadata_writer.write(chunk['metadata'])
+                stats.add_chunk(chunk['metadata'], chunk['content'])
+                suggest_counts["section"].update(section_titles([chunk['content']]))
+                if chunk['metadata'].get('source'):
+                    suggest_counts["act"][act_title(chunk['metadata']['source'])] += 1
+                batch.append(chunk['content'])
+                batch_chars += len(chunk['content'])
+                total_chunks += 1
+                if batch_chars >= self.batch_chars:
+                    flush()
+                    batch, batch_chars = [], 0
+            if batch:
+                flush()
+        finally:
+            chunks_writer.close()
+            metadata_writer.close()
+
+        return blocks, document_frequency, total_chunks, stats, suggest_counts
+
+    def _idf(self, document_frequency: np.ndarray, total_chunks: int) -> Tuple[np.ndarray, int]:
+        """
+        Smoothed IDF as in TfidfVectorizer, zero for features outside [min_df, max_df].
+
+        Computed in place in float32, so the only temporaries are two bool masks.
+        """
+        max_doc_count = self.max_df if isinstance(self.max_df, int) else math.floor(self.max_df * total_chunks)
+        min_doc_count = self.min_df if isinstance(self.min_df, int) else math.ceil(self.min_df * total_chunks)
+        idf = np.add(document_frequency, 1, dtype=np.float32)
+        np.divide(1 + total_chunks, idf, out=idf)
+        np.log(idf, out=idf)
+        idf += 1.0
+
+        keep = document_frequency >= min_doc_count
+        keep &= document_frequency <= max_doc_count
+        kept = int(np.count_nonzero(keep))
+        np.logical_not(keep, out=keep)
+        idf[keep] = 0.0
+        return idf, kept
+
+    def _merge_pass(self, blocks: List[Path], idf: np.ndarray, total_chunks: int) -> int:
+        """Pass 2: reweight each block and append it to the on-disk CSR matrix."""
+        target = csr_directory(self.persist_directory)
+        staging = target.with_name(CSR_DIRNAME + ".tmp")
+        shutil.rmtree(staging, ignore_errors=True)
+        staging.mkdir()
+
+        nnz = 0
+        with open(staging / "data.bin", 'wb') as data_file, \
+                open(staging / "indices.bin", 'wb') as indices_file, \
+                open(staging / "indptr.bin", 'wb') as indptr_file:
+            np.zeros(1, dtype=np.int64).tofile(indptr_file)
+            for path in blocks:
+                block = apply_idf(sparse.load_npz(path), idf)
+                block.data.astype(np.float32).tofile(data_file)
+                block.indices.astype(np.int32).tofile(indices_file)
+                (block.indptr[1:].astype(np.int64) + nnz).tofile(indptr_file)
+                nnz += block.nnz
+
+        with open(staging / "manifest.json", 'w') as f:
+            json.dump({
+                "shape": [total_chunks, self.n_features],
+                "nnz": nnz,
+                "data_dtype": "float32",
+                "indices_dtype": "int32",
+                "indptr_dtype": "int64"
+            }, f, indent=2)
+
+        shutil.rmtree(target, ignore_errors=True)
+        os.rename(staging, target)
+        return nnz
@@ -0,0 +1,234 @@
+"""
+Parallel Index Build for Environmental Law RAG System
+Map-reduce TF-IDF fitting and PDF extraction across worker processes
+"""
+
+import os
+import sys
+import json
+import time
+import numbers
+import logging
+import argparse
+import multiprocessing
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple, Callable, Iterator
+from pathlib import Path
+
+import numpy as np
+
+from lazy_imports import lazy_import
+from legal_tokenizer import tfidf_vectorizer_params
+
+sparse = lazy_import("scipy.sparse")
+TfidfVectorizer = lazy_import("sklearn.feature_extraction.text", "TfidfVectorizer")
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _pool_context():
+    # fork starts workers without re-importing the engines and their dependencies
+    return multiprocessing.get_context("fork" if sys.platform.startswith("linux") else "spawn")
+
+
+def parallel_imap(function: Callable, items: List[Any], workers: Optional[int] = None) -> Iterator[Any]:
+    """Order-preserving map over a process pool, yielding each result as soon as it is ready."""
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(items) <= 1:
+        for item in items:
+            yield function(item)
+        return
+    with _pool_context().Pool(min(workers, len(items))) as pool:
+        yield from pool.imap(function, items)
+
+
+def _count_range(task: Tuple[Dict[str, Any], List[str]]) -> Tuple[Counter, Counter]:
+    """Map: document and term frequencies of one chunk range."""
+    params, texts = task
+    analyze = TfidfVectorizer(**params).build_analyzer()
+    document_frequency = Counter()
+    term_frequency = Counter()
+    for text in texts:
+        counts = Counter(analyze(text))
+        document_frequency.update(counts.keys())
+        term_frequency.update(counts)
+    return document_frequency, term_frequency
+
+
+def _transform_range(task):
+    """Map: TF-IDF rows of one chunk range in the final vocabulary space."""
+    vectorizer, texts = task
+    return vectorizer.transform(texts)
+
+
+def limit_vocabulary(document_frequency: Counter,
+                     term_frequency: Counter,
+                     n_documents: int,
+                     min_df=1,
+                     max_df=1.0,
+                     max_features: Optional[int] = None) -> Tuple[Dict[str, int], np.ndarray]:
+    """
+    Reduce: the vocabulary and document frequencies TfidfVectorizer would keep.
+
+    Mirrors CountVectorizer's fit: features sorted by term, then pruned by
+    document frequency and, if more than max_features remain, the ones with
+    the highest corpus frequency kept using the same argsort on the same
+    array, so ties resolve identically.
+
+    Returns:
+        (vocabulary, document frequencies aligned with it)
+    """
+    if not document_frequency:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+
+    high = max_df if isinstance(max_df, numbers.Integral) else max_df * n_documents
+    low = min_df if isinstance(min_df, numbers.Integral) else min_df * n_documents
+    if high < low:
+        raise ValueError("max_df corresponds to < documents than min_df")
+
+    terms = sorted(document_frequency)
+    dfs = np.array([document_frequency[term] for term in terms], dtype=np.int64)
+    mask = np.ones(len(terms), dtype=bool)
+    if high is not None:
+        mask &= dfs <= high
+    if low is not None:
+        mask &= dfs >= low
+    if max_features is not None and mask.sum() > max_features:
+        tfs = np.array([term_frequency[term] for term in terms], dtype=np.float64)
+        mask_inds = (-tfs[mask]).argsort()[:max_features]
+        new_mask = np.zeros(len(terms), dtype=bool)
+        new_mask[np.where(mask)[0][mask_inds]] = True
+        mask = new_mask
+
+    kept = np.flatnonzero(mask)
+    if len(kept) == 0:
+        raise ValueError("After pruning, no terms remain. Try a lower min_df or a higher max_df.")
+    vocabulary = {terms[i]: position for position, i in enumerate(kept)}
+    return vocabulary, dfs[kept]
+
+
+def smoothed_idf(dfs: np.ndarray, n_documents: int, smooth_idf: bool = True) -> np.ndarray:
+    """IDF exactly as TfidfTransformer.fit computes it."""
+    df = dfs.astype(np.float64)
+    df += int(smooth_idf)
+    n_samples = n_documents + int(smooth_idf)
+    return np.log(n_samples / df) + 1
+
+
+def parallel_fit_transform(vectorizer, texts: List[str], workers: Optional[int] = None):
+    """
+    Fit an unfitted TfidfVectorizer with a map-reduce build and return the TF-IDF matrix.
+
+    Map: workers count document and term frequencies for disjoint chunk
+    ranges. Reduce: the partial tables are summed and pruned into the
+    vocabulary and IDF the single-process fit would produce, which are set
+    on the vectorizer. Map again: each worker emits the rows of its range in
+    that vocabulary, and the blocks are stacked in order.
+
+    The vocabulary and IDF weights equal those of vectorizer.fit_transform(texts).
+    Matrix entries agree up to rounding (about 1e-16): fit_transform keeps
+    each row's terms in a different order, so the L2 norms are summed in a
+    different order.
+    """
+    workers = workers or os.cpu_count() or 1
+    if (vectorizer.vocabulary is not None or not vectorizer.use_idf or vectorizer.sublinear_tf
+            or workers <= 1 or len(texts) < 2 * workers):
+        return vectorizer.fit_transform(texts)
+
+    started = time.perf_counter()
+    params = vectorizer.get_params()
+    ranges = [(int(r[0]), int(r[-1]) + 1) for r in np.array_split(np.arange(len(texts)), workers) if len(r)]
+
+    with _pool_context().Pool(len(ranges)) as pool:
+        partials = pool.map(_count_range, [(params, texts[start:end]) for start, end in ranges])
+
+        document_frequency = Counter()
+        term_frequency = Counter()
+        for partial_df, partial_tf in partials:
+            document_frequency.update(partial_df)
+            term_frequency.update(partial_tf)
+        del partials
+
+        vocabulary, dfs = limit_vocabulary(
+            document_frequency, term_frequency, len(texts),
+            min_df=vectorizer.min_df, max_df=vectorizer.max_df, max_features=vectorizer.max_features
+        )
+        vectorizer.vocabulary_ = vocabulary
+        vectorizer.fixed_vocabulary_ = False
+        vectorizer.idf_ = smoothed_idf(dfs, len(texts), vectorizer.smooth_idf)
+
+        blocks = pool.map(_transform_range, [(vectorizer, texts[start:end]) for start, end in ranges])
+
+    matrix = sparse.vstack(blocks, format="csr")
+    logger.info(f"Parallel TF-IDF fit of {len(texts)} chunks on {len(ranges)} workers "
+                f"in {time.perf_counter() - started:.2f}s ({len(vocabulary)} features)")
+    return matrix
+
+
+def compare_builds(texts: List[str], params: Dict[str, Any], workers: Optional[int] = None,
+                   tolerance: float = 1e-12) -> Dict[str, Any]:
+    """
+    Fit single-process and in parallel, and report whether the results match.
+
+    Vocabulary, IDF weights and the sparsity pattern must be identical; matrix
+    entries may differ by rounding up to tolerance.
+    """
+    started = time.perf_counter()
+    single = TfidfVectorizer(**params)
+    single_matrix = single.fit_transform(texts)
+    single_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    parallel = TfidfVectorizer(**params)
+    parallel_matrix = parallel_fit_transform(parallel, texts, workers=workers)
+    parallel_seconds = time.perf_counter() - started
+
+    same_structure = single_matrix.shape == parallel_matrix.shape
+    max_difference = float("inf")
+    if same_structure:
+        single_matrix, parallel_matrix = single_matrix.tocsr(), parallel_matrix.tocsr()
+        single_matrix.sort_indices()
+        parallel_matrix.sort_indices()
+        same_structure = (np.array_equal(single_matrix.indptr, parallel_matrix.indptr)
+                          and np.array_equal(single_matrix.indices, parallel_matrix.indices))
+        if same_structure:
+            max_difference = float(np.abs(single_matrix.data - parallel_matrix.data).max(initial=0.0))
+
+    matches = (
+        single.vocabulary_ == parallel.vocabulary_
+        and np.array_equal(single.idf_, parallel.idf_)
+        and same_structure
+        and max_difference <= tolerance
+    )
+    return {
+        "matches": bool(matches),
+        "max_difference": max_difference,
+        "features": len(single.vocabulary_),
+        "single_seconds": round(single_seconds, 2),
+        "parallel_seconds": round(parallel_seconds, 2)
+    }
+
+
+def main():
+    """Check that the parallel build reproduces the single-process index"""
+    parser = argparse.ArgumentParser(description="Compare the parallel TF-IDF build with the single-process one")
+    parser.add_argument("--persist-directory", default="rag/chroma_db", help="Index directory holding chunks.json")
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    with open(Path(args.persist_directory) / "chunks.json", 'r') as f:
+        texts = [chunk['content'] for chunk in json.load(f)]
+
+    # Same settings as the TF-IDF engines
+    params = tfidf_vectorizer_params()
+    result = compare_builds(texts, params, workers=args.workers)
+    status = "✅ same index" if result["matches"] else "❌ different"
+    print(f"{status}: {result['features']} features, largest difference {result['max_difference']:.1e}, "
+          f"single process {result['single_seconds']}s, parallel {result['parallel_seconds']}s")
+    return 0 if result["matches"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,365 @@
+"""
+Positional Index for Environmental Law RAG System
+Compressed positional inverted index for exact phrase and NEAR/k proximity queries
+"""
+
+import re
+import math
+import pickle
+import logging
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from typing import List, Dict, Any, Optional, Tuple, Iterable
+from pathlib import Path
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_FILENAME = "positional_index.pkl"
+
+# Documents per postings block; each block can be located and decoded on its own
+BLOCK_SIZE = 64
+
+# Lowercased word tokens; "Section 21(5)" becomes section, 21, 5
+_TOKEN_PATTERN = re.compile(r"\w+")
+_QUERY_PATTERN = re.compile(r'"([^"]*)"|NEAR/(\d+)|(\S+)')
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokens as indexed; stop words are kept so phrases like "consent to establish" match."""
+    return _TOKEN_PATTERN.findall(text.lower())
+
+
+def is_structured_query(query: str) -> bool:
+    """True if the query uses quoted phrases or NEAR/k operators."""
+    return '"' in query or re.search(r"\bNEAR/\d+\b", query) is not None
+
+
+def _encode_varint(value: int, out: bytearray):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _decode_varint(data: bytes, offset: int) -> Tuple[int, int]:
+    value = 0
+    shift = 0
+    while True:
+        byte = data[offset]
+        offset += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, offset
+        shift += 7
+
+
+class TermPostings:
+    """
+    Delta/varint-compressed postings of one term.
+
+    Postings are split into blocks of BLOCK_SIZE documents. The first
+    document id and byte offset of each block are kept uncompressed as skip
+    entries, so looking up a single document only decodes one block.
+    """
+
+    __slots__ = ("df", "block_docs", "block_offsets", "data")
+
+    def __init__(self, postings: List[Tuple[int, List[int]]]):
+        self.df = len(postings)
+        self.block_docs: List[int] = []
+        self.block_offsets: List[int] = []
+        data = bytearray()
+        for i, (doc_id, positions) in enumerate(postings):
+            if i % BLOCK_SIZE == 0:
+                self.block_docs.append(doc_id)
+                self.block_offsets.append(len(data))
+                previous_doc = doc_id
+            _encode_varint(doc_id - previous_doc, data)
+            previous_doc = doc_id
+            _encode_varint(len(positions), data)
+            previous_position = 0
+            for position in positions:
+                _encode_varint(position - previous_position, data)
+                previous_position = position
+        self.data = bytes(data)
+
+    def _decode_block(self, block: int) -> Iterable[Tuple[int, List[int]]]:
+        offset = self.block_offsets[block]
+        doc_id = self.block_docs[block]
+        remaining = min(BLOCK_SIZE, self.df - block * BLOCK_SIZE)
+        for _ in range(remaining):
+            delta, offset = _decode_varint(self.data, offset)
+            doc_id += delta
+            count, offset = _decode_varint(self.data, offset)
+            positions = []
+            position = 0
+            for _ in range(count):
+                delta, offset = _decode_varint(self.data, offset)
+                position += delta
+                positions.append(position)
+            yield doc_id, positions
+
+    def __iter__(self):
+        for block in range(len(self.block_docs)):
+            yield from self._decode_block(block)
+
+    def doc_ids(self) -> List[int]:
+        return [doc_id for doc_id, _ in self]
+
+    def positions(self, doc_id: int) -> Optional[List[int]]:
+        """Positions of the term in one document, decoding only the block that can hold it."""
+        block = bisect_right(self.block_docs, doc_id) - 1
+        if block < 0:
+            return None
+        for candidate, positions in self._decode_block(block):
+            if candidate == doc_id:
+                return positions
+            if candidate > doc_id:
+                break
+        return None
+
+
+def parse_query(query: str) -> Dict[str, Any]:
+    """
+    Parse a structured query.
+
+    Quoted phrases and NEAR/k expressions (whose operands may be words or
+    quoted phrases) are required; remaining bare words are optional and
+    only affect ranking.
+
+    Returns:
+        {'required': [clause, ...], 'optional': [term, ...]} where a clause is
+        ('phrase', terms) or ('near', left_terms, right_terms, k)
+    """
+    items = []
+    for phrase, near, word in _QUERY_PATTERN.findall(query):
+        if near:
+            items.append(("op", int(near)))
+        elif phrase or not word:
+            terms = tokenize(phrase)
+            if terms:
+                items.append(("phrase", terms))
+        else:
+            for term in tokenize(word):
+                items.append(("word", [term]))
+
+    required = []
+    optional = []
+    i = 0
+    while i < len(items):
+        kind, value = items[i]
+        if kind == "op":
+            i += 1
+            continue
+        # Chain "a NEAR/k b NEAR/j c" into pairwise clauses
+        if i + 2 < len(items) and items[i + 1][0] == "op" and items[i + 2][0] != "op":
+            required.append(("near", value, items[i + 2][1], items[i + 1][1]))
+            if i + 3 < len(items) and items[i + 3][0] == "op":
+                i += 2
+            else:
+                i += 3
+            continue
+        if kind == "phrase":
+            required.append(("phrase", value))
+        else:
+            optional.extend(value)
+        i += 1
+
+    return {"required": required, "optional": optional}
+
+
+class PositionalIndex:
+    """
+    Positional inverted index over chunk texts.
+
+    Queries are evaluated by intersecting postings rarest term first: the
+    rarest term's documents are the candidates, and every other term is
+    only probed for those documents through its skip entries, so the cost
+    follows the rarest term rather than the most common one.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, TermPostings] = {}
+        self.num_documents = 0
+        # Sorted vocabulary for prefix lookups, built on first use
+        self._sorted_terms: Optional[List[str]] = None
+
+    @classmethod
+    def build(cls, texts: List[str]) -> "PositionalIndex":
+        """Index texts; document ids are the list positions (the chunk indices)."""
+        raw: Dict[str, List[Tuple[int, List[int]]]] = defaultdict(list)
+        for doc_id, text in enumerate(texts):
+            term_positions: Dict[str, List[int]] = defaultdict(list)
+            for position, term in enumerate(tokenize(text)):
+                term_positions[term].append(position)
+            for term, positions in term_positions.items():
+                raw[term].append((doc_id, positions))
+
+        index = cls()
+        index.num_documents = len(texts)
+        index.postings = {term: TermPostings(postings) for term, postings in raw.items()}
+        logger.info(f"Built positional index with {len(index.postings)} terms over {len(texts)} chunks")
+        return index
+
+    def save(self, directory: Path):
+        with open(Path(directory) / INDEX_FILENAME, 'wb') as f:
+            pickle.dump({"num_documents": self.num_documents, "postings": self.postings}, f)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["PositionalIndex"]:
+        path = Path(directory) / INDEX_FILENAME
+        if not path.exists():
+            return None
+        with open(path, 'rb') as f:
+            state = pickle.load(f)
+        index = cls()
+        index.num_documents = state["num_documents"]
+        index.postings = state["postings"]
+        return index
+
+    @staticmethod
+    def remove(directory: Path):
+        """Delete a saved positional index, e.g. when the chunks it covers are rebuilt."""
+        (Path(directory) / INDEX_FILENAME).unlink(missing_ok=True)
+
+    def _variants(self, term: str) -> List[str]:
+        """Indexed tokens matching a term: the term itself, and if it is longer than three
+        characters, tokens extending it by at most two ("pollution" / "pollutions")."""
+        variants = [term] if term in self.postings else []
+        if len(term) > 3:
+            if self._sorted_terms is None:
+                self._sorted_terms = sorted(self.postings)
+            i = bisect_left(self._sorted_terms, term)
+            while i < len(self._sorted_terms) and self._sorted_terms[i].startswith(term):
+                token = self._sorted_terms[i]
+                if token != term and len(token) - len(term) <= 2:
+                    variants.append(token)
+                i += 1
+        return variants
+
+    def term_positions(self, doc_id: int, terms: List[str]) -> List[Tuple[int, int]]:
+        """
+        Word positions of query terms in one document, as (position, term index) in position order.
+
+        Read from the postings, decoding one block per matching token, so snippets
+        can be placed without scanning the chunk text for the terms.
+        """
+        found: Dict[int, int] = {}
+        for term_index, term in enumerate(terms):
+            for token in self._variants(term):
+                for position in self.postings[token].positions(doc_id) or ():
+                    found.setdefault(position, term_index)
+        return sorted(found.items())
+
+    def _idf(self, term: str) -> float:
+        postings = self.postings.get(term)
+        df = postings.df if postings else 0
+        return math.log((1 + self.num_documents) / (1 + df)) + 1.0
+
+    @staticmethod
+    def _phrase_starts(terms: List[str], term_positions: Dict[str, List[int]]) -> List[int]:
+        """Start positions of the phrase in one document."""
+        starts = None
+        for offset, term in enumerate(terms):
+            positions = term_positions.get(term)
+            if not positions:
+                return []
+            shifted = {position - offset for position in positions}
+            starts = shifted if starts is None else starts & shifted
+            if not starts:
+                return []
+        return sorted(starts)
+
+    @staticmethod
+    def _near_count(left: List[int], left_length: int, right: List[int], right_length: int, k: int) -> int:
+        """Number of left matches with a right match at most k words away, in either order."""
+        count = 0
+        j = 0
+        for start in left:
+            # Skip right matches ending more than k words before this match starts
+            while j < len(right) and right[j] + right_length + k < start:
+                j += 1
+            # ...and accept one starting at most k words after this match ends
+            if j < len(right) and right[j] <= start + left_length + k:
+                count += 1
+        return count
+
+    def _clause_terms(self, clause: Tuple) -> List[str]:
+        return clause[1] if clause[0] == "phrase" else clause[1] + clause[2]
+
+    def _clause_matches(self, clause: Tuple, term_positions: Dict[str, List[int]]) -> int:
+        if clause[0] == "phrase":
+            return len(self._phrase_starts(clause[1], term_positions))
+        _, left, right, k = clause
+        left_starts = self._phrase_starts(left, term_positions)
+        if not left_starts:
+            return 0
+        right_starts = self._phrase_starts(right, term_positions)
+        if not right_starts:
+            return 0
+        return self._near_count(left_starts, len(left), right_starts, len(right), k)
+
+    def search(self, query: str, limit: Optional[int] = 10) -> List[Tuple[int, float, int]]:
+        """
+        Evaluate a structured query.
+
+        Args:
+            query: Query with quoted phrases, NEAR/k operators and optional bare words
+            limit: Maximum number of documents to return (None for all)
+
+        Returns:
+            (doc_id, score, matches) tuples, best first
+        """
+        parsed = parse_query(query)
+        required = parsed["required"]
+        if not required:
+            # No structure: all bare words must co-occur
+            required = [("phrase", [term]) for term in parsed["optional"]]
+            optional = []
+        else:
+            optional = parsed["optional"]
+        if not required:
+            return []
+
+        required_terms = {term for clause in required for term in self._clause_terms(clause)}
+        if any(term not in self.postings for term in required_terms):
+            return []
+
+        # Candidates come from the rarest required term only
+        rarest = min(required_terms, key=lambda term: self.postings[term].df)
+        probe_order = sorted(required_terms - {rarest}, key=lambda term: self.postings[term].df)
+
+        results = []
+        for doc_id, positions in self.postings[rarest]:
+            # Probe the other terms rarest first, stopping at the first one missing
+            term_positions = {rarest: positions}
+            missing = False
+            for term in probe_order:
+                term_positions[term] = self.postings[term].positions(doc_id)
+                if term_positions[term] is None:
+                    missing = True
+                    break
+            if missing:
+                continue
+
+            score = 0.0
+            total_matches = 0
+            for clause in required:
+                matches = self._clause_matches(clause, term_positions)
+                if matches == 0:
+                    break
+                total_matches += matches
+                weight = sum(self._idf(term) for term in self._clause_terms(clause))
+                score += weight * (1.0 + math.log(matches))
+            else:
+                for term in optional:
+                    postings = self.postings.get(term)
+                    positions = postings.positions(doc_id) if postings else None
+                    if positions:
+                        score += 0.5 * self._idf(term) * (1.0 + math.log(len(positions)))
+                results.append((doc_id, score, total_matches))
+
+        results.sort(key=lambda result: (-result[1], result[0]))
+        return results[:limit]
@@ -0,0 +1,215 @@
+"""
+Query Log and Cache Warm-up for Environmental Law RAG System
+Persisted recency-weighted log of frequent questions, replayed after a restart
+"""
+
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Callable
+from pathlib import Path
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUERY_LOG_FILENAME = "query_log.json"
+
+# Rescale scores before the forward-decay weights grow past this many halvings
+_MAX_HALVINGS = 64
+
+
+def _key(question: str) -> str:
+    return " ".join(question.lower().split())
+
+
+class QueryLog:
+    """
+    Recency-weighted frequency log of questions, persisted as JSON.
+
+    Uses forward decay: a question asked at time t adds
+    2 ** ((t - epoch) / half_life) to its score, so a question asked one
+    half-life ago counts half as much as one asked now, without revisiting
+    every entry on each update. When the weights grow large the epoch moves
+    forward and all scores are rescaled. Only the highest-scoring `capacity`
+    questions are kept, and the log is written at most every flush_interval
+    seconds.
+    """
+
+    def __init__(self,
+                 path: Path,
+                 capacity: int = 500,
+                 half_life_hours: float = 72.0,
+                 flush_interval: float = 60.0):
+        """
+        Args:
+            path: JSON file the log is kept in
+            capacity: Number of distinct questions kept
+            half_life_hours: Age at which a question's weight has halved
+            flush_interval: Minimum seconds between writes
+        """
+        self.path = Path(path)
+        self.capacity = capacity
+        self.half_life = half_life_hours * 3600.0
+        self.flush_interval = flush_interval
+        self.epoch = time.time()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._lock = threading.Lock()
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable query log {self.path}: {e}")
+            return
+        self.epoch = data.get("epoch", self.epoch)
+        for entry in data.get("entries", []):
+            self._entries[_key(entry["question"])] = entry
+        # Scores were written under the file's half-life; rebase them onto this one
+        if data.get("half_life") and data["half_life"] != self.half_life:
+            self._rebase(time.time(), data["half_life"])
+
+    def _rebase(self, now: float, half_life: Optional[float] = None):
+        """Move the epoch to now, converting every score to current-time weights."""
+        factor = 2.0 ** (-(now - self.epoch) / (half_life or self.half_life))
+        for entry in self._entries.values():
+            entry["score"] *= factor
+        self.epoch = now
+
+    def record(self, question: str):
+        """Count one asking of a question, now."""
+        key = _key(question)
+        if not key:
+            return
+        now = time.time()
+        with self._lock:
+            if (now - self.epoch) / self.half_life > _MAX_HALVINGS:
+                self._rebase(now)
+            weight = 2.0 ** ((now - self.epoch) / self.half_life)
+            entry = self._entries.get(key)
+            if entry is None:
+                entry = self._entries[key] = {"question": question.strip(), "score": 0.0, "count": 0}
+            entry["score"] += weight
+            entry["count"] += 1
+            entry["last_seen"] = now
+            # Prune in batches so the log is not sorted on every new question
+            if len(self._entries) > 2 * self.capacity:
+                self._prune()
+            self._dirty = True
+            due = time.monotonic() - self._last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def _prune(self):
+        kept = sorted(self._entries.items(), key=lambda item: item[1]["score"], reverse=True)[:self.capacity]
+        self._entries = dict(kept)
+
+    def counts(self) -> Dict[str, int]:
+        """How often each logged question was asked, ignoring recency."""
+        with self._lock:
+            return {entry["question"]: entry["count"] for entry in self._entries.values()}
+
+    def top(self, n: int) -> List[str]:
+        """The n questions with the highest recency-weighted frequency."""
+        with self._lock:
+            entries = sorted(self._entries.values(), key=lambda entry: entry["score"], reverse=True)
+        return [entry["question"] for entry in entries[:n]]
+
+    def flush(self):
+        """Write the log if it changed since the last write."""
+        with self._lock:
+            if not self._dirty:
+                return
+            if len(self._entries) > self.capacity:
+                self._prune()
+            data = {
+                "epoch": self.epoch,
+                "half_life": self.half_life,
+                "entries": list(self._entries.values())
+            }
+            self._dirty = False
+            self._last_flush = time.monotonic()
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_file = self.path.with_suffix(".json.tmp")
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.path)
+        except OSError as e:
+            logger.warning(f"Could not write query log {self.path}: {e}")
+
+
+def replay(questions: List[str], ask: Callable[[str], Any]) -> Dict[str, Any]:
+    """
+    Run questions through the answer pipeline to warm its caches.
+
+    Each question goes through `ask` (e.g. the engine's query()), which
+    fills the answer cache and pulls the index files it touches into the
+    OS page cache. Failures are logged and skipped.
+    """
+    started = time.perf_counter()
+    failed = 0
+    for question in questions:
+        try:
+            ask(question)
+        except Exception as e:
+            failed += 1
+            logger.warning(f"Warm-up query failed: {question[:80]!r}: {e}")
+    elapsed = time.perf_counter() - started
+    logger.info(f"Replayed {len(questions) - failed}/{len(questions)} logged questions in {elapsed:.1f}s")
+    return {"replayed": len(questions) - failed, "failed": failed, "seconds": round(elapsed, 2)}
+
+
+def start_replay(questions: List[str], ask: Callable[[str], Any]) -> Optional[threading.Thread]:
+    """Replay questions in a daemon thread so the service answers requests meanwhile."""
+    if not questions:
+        return None
+    thread = threading.Thread(target=replay, args=(questions, ask), name="rag-query-replay", daemon=True)
+    thread.start()
+    return thread
+
+
+def query_log_path(index_root: Path) -> Optional[Path]:
+    """Query log file from RAG_QUERY_LOG (default <index root>/query_log.json); None when set to 'off'."""
+    path = os.environ.get("RAG_QUERY_LOG", "")
+    if path.lower() == "off":
+        return None
+    return Path(path) if path else Path(index_root) / QUERY_LOG_FILENAME
+
+
+def query_log_from_env(index_root: Path) -> Optional[QueryLog]:
+    """
+    Query log configured from the environment; None when disabled.
+
+    RAG_QUERY_LOG: log file (default <index root>/query_log.json, 'off' disables)
+    RAG_QUERY_LOG_SIZE: questions kept (default 500)
+    RAG_QUERY_LOG_HALF_LIFE_HOURS: recency half-life (default 72)
+    """
+    path = query_log_path(index_root)
+    if path is None:
+        return None
+    log = QueryLog(
+        path,
+        capacity=int(os.environ.get("RAG_QUERY_LOG_SIZE", "500")),
+        half_life_hours=float(os.environ.get("RAG_QUERY_LOG_HALF_LIFE_HOURS", "72"))
+    )
+    # Keep what was recorded since the last periodic write
+    atexit.register(log.flush)
+    return log
+
+
+def warmup_count_from_env() -> int:
+    """Number of logged questions replayed at startup (RAG_WARMUP_QUERIES, default 50, 0 disables)."""
+    return int(os.environ.get("RAG_WARMUP_QUERIES", "50"))
@@ -5,28 +5,36 @@ A comprehensive Retrieval-Augmented Generation system for environmental law PDFs
 
 import os
 import logging
-from typing import List, Dict, Any, Optional
+from threading import Thread
+from typing import List, Dict, Any, Optional, Iterator
 from pathlib import Path
 
 # Core libraries
-import chromadb
-from chromadb.config import Settings
 import numpy as np
-import pandas as pd
 
-# LangChain components
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.document_loaders import PyPDFLoader
-from langchain.embeddings import HuggingFaceEmbeddings
-from langchain.vectorstores import Chroma
-from langchain.chains import RetrievalQA
-from langchain.llms import HuggingFacePipeline
-from langchain.prompts import PromptTemplate
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+from lazy_imports import lazy_import
+
+# LangChain components (imported on first use)
+RecursiveCharacterTextSplitter = lazy_import("langchain.text_splitter", "RecursiveCharacterTextSplitter")
+HuggingFaceEmbeddings = lazy_import("langchain.embeddings", "HuggingFaceEmbeddings")
+Chroma = lazy_import("langchain.vectorstores", "Chroma")
+RetrievalQA = lazy_import("langchain.chains", "RetrievalQA")
+HuggingFacePipeline = lazy_import("langchain.llms", "HuggingFacePipeline")
+PromptTemplate = lazy_import("langchain.prompts", "PromptTemplate")
+pipeline = lazy_import("transformers", "pipeline")
+TextIteratorStreamer = lazy_import("transformers", "TextIteratorStreamer")
 
 # PDF processing
-import PyPDF2
-from sentence_transformers import SentenceTransformer
+PyPDF2 = lazy_import("PyPDF2")
+
+from embedding_server import EmbeddingClient
+from corpus_stats import CorpusStatistics
+from build_checkpoint import BuildCheckpoint
+from reranker import TwoStageReranker
+from diversify import candidate_count, select_results
+from semantic_cache import SemanticAnswerCache
+from context_packer import pack_context, approximate_token_count
+from slow_query_log import stage, record
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -41,7 +49,8 @@ class EnvironmentalLawRAG:
     def __init__(self, 
                  pdf_directory: str = "rag",
                  persist_directory: str = "rag/chroma_db",
-                 embedding_model: str = "all-MiniLM-L6-v2"):
+                 embedding_model: str = "all-MiniLM-L6-v2",
+                 embedding_socket: Optional[str] = None):
         """
         Initialize the RAG system.
         
@@ -49,16 +58,28 @@ class EnvironmentalLawRAG:
             pdf_directory: Directory containing PDF files
             persist_directory: Directory to persist ChromaDB
             embedding_model: HuggingFace embedding model name
+            embedding_socket: Unix socket of a shared embedding server (defaults to $RAG_EMBEDDING_SOCKET)
         """
         self.pdf_directory = Path(pdf_directory)
         self.persist_directory = Path(persist_directory)
         self.embedding_model = embedding_model
+        # Optional shared embedding server (see embedding_server.py)
+        self.embedding_socket = embedding_socket or os.environ.get("RAG_EMBEDDING_SOCKET")
         
         # Initialize components
         self.embeddings = None
         self.vectorstore = None
         self.qa_chain = None
+        self.qa_prompt = None
+        self.llm = None
+        self.llm_pipeline = None
+        self.context_token_budget = None
         self.documents = []
+        self.corpus_stats = None
+        # Optional second retrieval stage applied to the top candidates
+        self.reranker: Optional[TwoStageReranker] = None
+        # Optional cache of answers to paraphrased questions
+        self.answer_cache: Optional[SemanticAnswerCache] = None
         
         # Create persist directory if it doesn't exist
         self.persist_directory.mkdir(parents=True, exist_ok=True)
@@ -68,6 +89,11 @@ class EnvironmentalLawRAG:
     def setup_embeddings(self):
         """Setup embedding model"""
         try:
+            if self.embedding_socket:
+                self.embeddings = EmbeddingClient(self.embedding_socket, expected_model=self.embedding_model)
+                logger.info(f"Using shared embedding server at {self.embedding_socket}")
+                return
+            
             self.embeddings = HuggingFaceEmbeddings(
                 model_name=self.embedding_model,
                 model_kwargs={'device': 'cpu'}
@@ -77,10 +103,14 @@ class EnvironmentalLawRAG:
             logger.error(f"Error loading embeddings model: {e}")
             raise
     
-    def load_pdf_documents(self) -> List[Dict[str, Any]]:
+    def load_pdf_documents(self, checkpoint: Optional[BuildCheckpoint] = None) -> List[Dict[str, Any]]:
         """
         Load and process all PDF documents from the directory.
         
+        Args:
+            checkpoint: Optional build checkpoint; PDFs already extracted by an
+                interrupted build are reused instead of parsed again
+        
         Returns:
             List of processed documents with metadata
         """
@@ -94,6 +124,13 @@ class EnvironmentalLawRAG:
         logger.info(f"Found {len(pdf_files)} PDF files to process")
         
         for pdf_file in pdf_files:
+            if checkpoint is not None:
+                cached = checkpoint.get_extraction(pdf_file)
+                if cached is not None:
+                    logger.info(f"Reusing checkpointed extraction of {pdf_file.name}")
+                    documents.append(cached)
+                    continue
+            
             try:
                 logger.info(f"Processing {pdf_file.name}")
                 
@@ -121,6 +158,9 @@ class EnvironmentalLawRAG:
                         'metadata': doc_metadata
                     })
                     
+                    if checkpoint is not None:
+                        checkpoint.record_extraction(pdf_file, documents[-1])
+                    
                     logger.info(f"Successfully processed {pdf_file.name} ({len(pdf_reader.pages)} pages)")
                 else:
                     logger.warning(f"No text extracted from {pdf_file.name}")
@@ -130,20 +170,29 @@ class EnvironmentalLawRAG:
                 continue
         
         self.documents = documents
+        if checkpoint is not None:
+            checkpoint.mark_complete("extraction")
         logger.info(f"Successfully loaded {len(documents)} documents")
         return documents
     
-    def chunk_documents(self, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Dict[str, Any]]:
+    def chunk_documents(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                        checkpoint: Optional[BuildCheckpoint] = None) -> List[Dict[str, Any]]:
         """
         Split documents into chunks for better retrieval.
         
         Args:
             chunk_size: Size of each chunk in characters
             chunk_overlap: Overlap between chunks
+            checkpoint: Optional build checkpoint to resume from
             
         Returns:
             List of document chunks
         """
+        if checkpoint is not None and checkpoint.is_complete(
+                "chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap, corpus=checkpoint.corpus_version()):
+            logger.info("Reusing checkpointed chunks")
+            return checkpoint.load_json("chunks")
+        
         if not self.documents:
             logger.warning("No documents loaded. Call load_pdf_documents() first.")
             return []
@@ -175,15 +224,25 @@ class EnvironmentalLawRAG:
                     'metadata': chunk_metadata
                 })
         
+        if checkpoint is not None:
+            checkpoint.save_json("chunks", all_chunks)
+            checkpoint.mark_complete("chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                      corpus=checkpoint.corpus_version())
+        
         logger.info(f"Created {len(all_chunks)} chunks from {len(self.documents)} documents")
         return all_chunks
     
-    def create_vectorstore(self, chunks: List[Dict[str, Any]]):
+    def create_vectorstore(self, chunks: List[Dict[str, Any]],
+                           checkpoint: Optional[BuildCheckpoint] = None,
+                           batch_size: int = 256):
         """
         Create and populate the ChromaDB vector store.
         
         Args:
             chunks: List of document chunks to store
+            checkpoint: Optional build checkpoint; batches embedded by an
+                interrupted build are skipped
+            batch_size: Number of chunks embedded and persisted per batch
         """
         if not chunks:
             logger.warning("No chunks provided for vector store creation")
@@ -193,22 +252,50 @@ class EnvironmentalLawRAG:
             self.setup_embeddings()
         
         try:
-            # Prepare documents and metadatas for ChromaDB
-            documents = [chunk['content'] for chunk in chunks]
-            metadatas = [chunk['metadata'] for chunk in chunks]
-            ids = [chunk['metadata']['chunk_id'] for chunk in chunks]
-            
             # Create ChromaDB collection
-            self.vectorstore = Chroma.from_texts(
-                texts=documents,
-                embedding=self.embeddings,
-                metadatas=metadatas,
-                ids=ids,
-                persist_directory=str(self.persist_directory)
+            self.vectorstore = Chroma(
+                persist_directory=str(self.persist_directory),
+                embedding_function=self.embeddings
             )
             
-            # Persist the vector store
-            self.vectorstore.persist()
+            # Batches embedded from other chunks, or in other sizes, are redone
+            batch_params = dict(batch_size=batch_size, chunking=checkpoint.stage_params("chunking")) if checkpoint is not None else {}
+            completed = checkpoint.completed_batches("vectorization", **batch_params) if checkpoint is not None else set()
+            if not completed and self.vectorstore._collection.count() > 0:
+                # A fresh build replaces whatever an earlier run left behind
+                self.vectorstore.delete_collection()
+                self.vectorstore = Chroma(
+                    persist_directory=str(self.persist_directory),
+                    embedding_function=self.embeddings
+                )
+            
+            for batch_index, start in enumerate(range(0, len(chunks), batch_size)):
+                if batch_index in completed:
+                    continue
+                
+                batch = chunks[start:start + batch_size]
+                self.vectorstore.add_texts(
+                    texts=[chunk['content'] for chunk in batch],
+                    metadatas=[chunk['metadata'] for chunk in batch],
+                    ids=[chunk['metadata']['chunk_id'] for chunk in batch]
+                )
+                
+                # Persist the vector store after every batch
+                self.vectorstore.persist()
+                
+                if checkpoint is not None:
+                    checkpoint.mark_batch("vectorization", batch_index, **batch_params)
+                logger.info(f"Embedded chunks {start + 1}-{start + len(batch)} of {len(chunks)}")
+            
+            if checkpoint is not None:
+                checkpoint.mark_complete("vectorization", chunking=checkpoint.stage_params("chunking"))
+            
+            # Keep corpus statistics alongside the index
+            self.corpus_stats = CorpusStatistics()
+            self.corpus_stats.add_chunks(chunks)
+            self.corpus_stats.save(self.persist_directory)
+            if checkpoint is not None:
+                checkpoint.mark_complete("persistence")
             
             logger.info(f"Vector store created with {len(chunks)} chunks")
             
@@ -216,8 +303,13 @@ class EnvironmentalLawRAG:
             logger.error(f"Error creating vector store: {e}")
             raise
     
-    def load_existing_vectorstore(self):
-        """Load existing vector store if it exists"""
+    def load_existing_vectorstore(self, read_only: bool = False):
+        """
+        Load existing vector store if it exists.
+        
+        With read_only, missing corpus statistics are rebuilt in memory
+        without being written, as for a published snapshot.
+        """
         try:
             if not self.embeddings:
                 self.setup_embeddings()
@@ -233,6 +325,7 @@ class EnvironmentalLawRAG:
             
             if count > 0:
                 logger.info(f"Loaded existing vector store with {count} documents")
+                self.load_corpus_statistics(count, save=not read_only)
                 return True
             else:
                 logger.info("No existing vector store found")
@@ -242,13 +335,29 @@ class EnvironmentalLawRAG:
             logger.error(f"Error loading existing vector store: {e}")
             return False
     
-    def setup_qa_chain(self, llm_model: str = "microsoft/DialoGPT-medium"):
+    def load_corpus_statistics(self, count: int, save: bool = True):
+        """Load persisted corpus statistics, rebuilding them once if missing or stale."""
+        stats = CorpusStatistics.load(self.persist_directory)
+        if stats is None or stats.total_chunks != count:
+            logger.info("Rebuilding corpus statistics from the collection")
+            results = self.vectorstore._collection.get(include=["metadatas", "documents"])
+            stats = CorpusStatistics.from_records(results["metadatas"], results["documents"])
+            if save:
+                stats.save(self.persist_directory)
+        self.corpus_stats = stats
+    
+    def setup_qa_chain(self, llm_model: str = "microsoft/DialoGPT-medium",
+                       context_token_budget: Optional[int] = 256):
         """
         Setup the question-answering chain using local Hugging Face models.
         
         Args:
             llm_model: Hugging Face model to use for generation
+            context_token_budget: Token budget for the packed prompt context;
+                None stuffs the full retrieved chunks into the prompt instead
         """
+        self.context_token_budget = context_token_budget
+        
         if not self.vectorstore:
             logger.error("Vector store not initialized. Create vector store first.")
             return
@@ -304,6 +413,7 @@ class EnvironmentalLawRAG:
                 
                 # Create HuggingFacePipeline for LangChain
                 llm = HuggingFacePipeline(pipeline=pipe)
+                self.llm_pipeline = pipe
                 logger.info("Local LLM loaded successfully")
                 
             except Exception as e:
@@ -317,6 +427,11 @@ class EnvironmentalLawRAG:
                         return "Based on the provided context, I can help you find relevant information. Please check the source documents for detailed answers."
                 
                 llm = SimpleLocalLLM()
+                self.llm_pipeline = None
+            
+            # Keep the prompt and LLM around for stream_query()
+            self.qa_prompt = PROMPT
+            self.llm = llm
             
             # Create QA chain
             self.qa_chain = RetrievalQA.from_chain_type(
@@ -333,6 +448,14 @@ class EnvironmentalLawRAG:
             logger.error(f"Error setting up QA chain: {e}")
             raise
     
+    def enable_answer_cache(self, capacity: int = 256, threshold: float = 0.9):
+        """Put a semantic answer cache in front of query()."""
+        self.answer_cache = SemanticAnswerCache(self.embeddings.embed_documents, capacity=capacity, threshold=threshold)
+    
+    def _index_version(self):
+        """Identifies the loaded index; cached answers are dropped when it changes."""
+        return self.corpus_stats.updated_at if self.corpus_stats else None
+    
     def query(self, question: str, k: int = 5) -> Dict[str, Any]:
         """
         Query the RAG system with a question.
@@ -349,33 +472,155 @@ class EnvironmentalLawRAG:
             return {"error": "QA chain not initialized"}
         
         try:
-            # Query the system
-            result = self.qa_chain({"query": question})
-            
-            return {
-                "question": question,
-                "answer": result["result"],
-                "source_documents": [
-                    {
-                        "content": doc.page_content,
-                        "metadata": doc.metadata,
-                        "source": doc.metadata.get("source", "Unknown")
-                    }
-                    for doc in result["source_documents"]
-                ]
-            }
+            if self.answer_cache is not None:
+                cached = self.answer_cache.lookup(question, namespace=k, index_version=self._index_version())
+                if cached is not None:
+                    return cached
+            
+            if self.context_token_budget is not None:
+                # Prompt with the best sentences of the retrieved chunks only
+                context_docs = self.search_similar_documents(question, k=k)
+                with stage("pack_context"):
+                    prompt, citations = self.build_prompt(question, context_docs)
+                with stage("generate"):
+                    answer = self.llm(prompt)
+                
+                result = {
+                    "question": question,
+                    "answer": answer,
+                    "source_documents": context_docs,
+                    "citations": citations
+                }
+            else:
+                # Query the system
+                with stage("qa_chain"):
+                    chain_result = self.qa_chain({"query": question})
+                
+                result = {
+                    "question": question,
+                    "answer": chain_result["result"],
+                    "source_documents": [
+                        {
+                            "content": doc.page_content,
+                            "metadata": doc.metadata,
+                            "source": doc.metadata.get("source", "Unknown")
+                        }
+                        for doc in chain_result["source_documents"]
+                    ]
+                }
+            
+            if self.answer_cache is not None:
+                self.answer_cache.store(question, result, namespace=k, index_version=self._index_version())
+            
+            return result
             
         except Exception as e:
             logger.error(f"Error querying RAG system: {e}")
             return {"error": str(e)}
     
-    def search_similar_documents(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+    def build_prompt(self, question: str, context_docs: List[Dict[str, Any]]):
+        """
+        Fill the QA prompt with context packed to the configured token budget.
+        
+        Returns:
+            (prompt, citations)
+        """
+        if self.llm_pipeline is not None:
+            tokenizer = self.llm_pipeline.tokenizer
+            count_tokens = lambda text: len(tokenizer.encode(text, add_special_tokens=False))
+        else:
+            count_tokens = approximate_token_count
+        
+        budget = self.context_token_budget
+        if budget is None:
+            # No packing: the full chunks, as the "stuff" chain does
+            context = "\n\n".join(doc['content'] for doc in context_docs)
+            citations = [
+                {'ref': i, 'source': doc['source'], 'chunk_id': doc['metadata'].get('chunk_id')}
+                for i, doc in enumerate(context_docs, 1)
+            ]
+        else:
+            context, citations = pack_context(question, context_docs, token_budget=budget, count_tokens=count_tokens)
+        
+        return self.qa_prompt.format(context=context, question=question), citations
+    
+    def stream_query(self, question: str, k: int = 5, max_new_tokens: int = 256) -> Iterator[Dict[str, Any]]:
+        """
+        Query the RAG system, yielding the answer while it is generated.
+        
+        Retrieved sources are yielded before generation starts, so the time to
+        first byte does not depend on the answer length.
+        
+        Args:
+            question: The question to ask
+            k: Number of relevant documents to retrieve
+            max_new_tokens: Upper bound on generated tokens
+            
+        Yields:
+            Events of the form {"event": "sources" | "token" | "done" | "error", "data": ...}
+        """
+        if not self.qa_chain:
+            logger.error("QA chain not initialized. Call setup_qa_chain() first.")
+            yield {"event": "error", "data": "QA chain not initialized"}
+            return
+        
+        try:
+            context_docs = self.search_similar_documents(question, k=k)
+            yield {"event": "sources", "data": context_docs}
+            
+            prompt, citations = self.build_prompt(question, context_docs)
+            
+            if self.llm_pipeline is None:
+                # Fallback LLM has no incremental output; send its answer as one token
+                answer = self.llm(prompt)
+                yield {"event": "token", "data": answer}
+                yield {"event": "done", "data": {"question": question, "answer": answer, "citations": citations}}
+                return
+            
+            tokenizer = self.llm_pipeline.tokenizer
+            model = self.llm_pipeline.model
+            
+            # Keep the end of the prompt (instructions and question) within the context window
+            max_prompt_tokens = max(1, tokenizer.model_max_length - max_new_tokens)
+            input_ids = tokenizer(prompt, return_tensors="pt").input_ids[:, -max_prompt_tokens:]
+            
+            # Generate in a background thread; the streamer hands over decoded text as it is produced
+            streamer = TextIteratorStreamer(tokenizer, skip_prompt=True, skip_special_tokens=True)
+            generation = Thread(
+                target=model.generate,
+                kwargs={
+                    "input_ids": input_ids,
+                    "streamer": streamer,
+                    "max_new_tokens": max_new_tokens,
+                    "do_sample": True,
+                    "temperature": 0.7,
+                    "pad_token_id": 50256
+                },
+                daemon=True
+            )
+            generation.start()
+            
+            answer = ""
+            for text in streamer:
+                if text:
+                    answer += text
+                    yield {"event": "token", "data": text}
+            generation.join()
+            
+            yield {"event": "done", "data": {"question": question, "answer": answer, "citations": citations}}
+            
+        except Exception as e:
+            logger.error(f"Error streaming RAG answer: {e}")
+            yield {"event": "error", "data": str(e)}
+    
+    def search_similar_documents(self, query: str, k: int = 5, diversity: float = 0.0) -> List[Dict[str, Any]]:
         """
         Search for similar documents without generating an answer.
         
         Args:
             query: Search query
             k: Number of documents to return
+            diversity: MMR trade-off in [0, 1]; above 0, near-duplicate chunks are demoted
             
         Returns:
             List of similar documents
@@ -385,7 +630,11 @@ class EnvironmentalLawRAG:
             return []
         
         try:
-            docs = self.vectorstore.similarity_search_with_score(query, k=k)
+            # More candidates when re-ranking or diversifying
+            fetch_k = candidate_count(k, self.reranker, diversity)
+            with stage("retrieve"):
+                docs = self.vectorstore.similarity_search_with_score(query, k=fetch_k)
+            record(candidates=len(docs))
             
             results = []
             for doc, score in docs:
@@ -396,30 +645,36 @@ class EnvironmentalLawRAG:
                     "source": doc.metadata.get("source", "Unknown")
                 })
             
-            return results
+            # Chroma returns distances, so lower first-stage scores are better
+            return select_results(
+                query, results, k,
+                reranker=self.reranker,
+                diversity=diversity,
+                vectors=lambda: self._stored_embeddings(results),
+                higher_is_better=False
+            )
             
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return []
     
+    def _stored_embeddings(self, results: List[Dict[str, Any]]) -> np.ndarray:
+        """Fetch the stored embeddings of search results, in result order."""
+        ids = [doc['metadata']['chunk_id'] for doc in results]
+        stored = self.vectorstore._collection.get(ids=ids, include=["embeddings"])
+        by_id = dict(zip(stored['ids'], stored['embeddings']))
+        return np.array([by_id[chunk_id] for chunk_id in ids], dtype=np.float32)
+    
     def get_document_statistics(self) -> Dict[str, Any]:
         """Get statistics about the loaded documents"""
         if not self.vectorstore:
             return {"error": "Vector store not initialized"}
         
         try:
-            collection = self.vectorstore._collection
-            count = collection.count()
-            
-            # Get unique sources
-            results = collection.get()
-            sources = set(metadata.get("source", "Unknown") for metadata in results["metadatas"])
+            if self.corpus_stats is None:
+                self.load_corpus_statistics(self.vectorstore._collection.count())
             
-            return {
-                "total_chunks": count,
-                "unique_documents": len(sources),
-                "sources": list(sources)
-            }
+            return self.corpus_stats.to_dict()
             
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
@@ -0,0 +1,482 @@
+"""
+SQLite FTS5 RAG System for Environmental Laws
+On-disk full-text index with bm25() ranking, using only the standard library
+"""
+
+import os
+import re
+import sqlite3
+import logging
+import threading
+from typing import List, Dict, Any, Optional, Tuple, Union
+from pathlib import Path
+
+from lazy_imports import lazy_import
+
+# PDF processing (imported on first use)
+PyPDF2 = lazy_import("PyPDF2")
+
+from corpus_stats import CorpusStatistics
+from slow_query_log import stage, record
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DATABASE_FILENAME = "fts_index.sqlite3"
+
+SCHEMA = """
+CREATE TABLE documents (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL UNIQUE,
+    file_path TEXT,
+    total_pages INTEGER,
+    document_type TEXT
+);
+CREATE TABLE chunks (
+    id INTEGER PRIMARY KEY,
+    doc_id INTEGER NOT NULL REFERENCES documents(id),
+    chunk_index INTEGER NOT NULL,
+    total_chunks INTEGER NOT NULL,
+    page_start INTEGER NOT NULL,
+    page_end INTEGER NOT NULL,
+    content TEXT NOT NULL
+);
+CREATE INDEX documents_type ON documents(document_type);
+CREATE INDEX chunks_doc ON chunks(doc_id);
+CREATE INDEX chunks_pages ON chunks(page_start, page_end);
+CREATE VIRTUAL TABLE chunks_fts USING fts5(
+    content,
+    content='chunks',
+    content_rowid='id',
+    tokenize='porter unicode61'
+);
+"""
+
+# Words that would match nearly every chunk; bm25() gives them almost no weight anyway
+_STOP_WORDS = frozenset("""
+a an and are as at be by can do does for from how in is it of on or that the this to
+under what when where which who why will with
+""".split())
+
+_PAGE_MARKER = re.compile(r"--- Page (\d+) ---")
+_PHRASE = re.compile(r'"([^"]+)"')
+_WORD = re.compile(r"\w+")
+
+
+def _page_span(text: str, previous_page: int) -> Tuple[int, int]:
+    """First and last page a chunk covers; same rules as metadata_store, without NumPy."""
+    pages = [int(number) for number in _PAGE_MARKER.findall(text)]
+    if not pages:
+        return previous_page, previous_page
+    starts_on_marker = _PAGE_MARKER.match(text.lstrip()) is not None
+    start = pages[0] if starts_on_marker or previous_page < 0 else previous_page
+    return start, pages[-1]
+
+
+def match_expression(query: str) -> Optional[str]:
+    """
+    FTS5 MATCH expression for a free-text query.
+
+    Quoted phrases must all occur; the remaining words are OR-ed so bm25()
+    ranks chunks by how many of them they contain and how rare they are.
+    Every term is quoted, so FTS5 operators typed by users are plain words.
+    """
+    phrases = [" ".join(_WORD.findall(phrase)) for phrase in _PHRASE.findall(query)]
+    phrases = [f'"{phrase}"' for phrase in phrases if phrase]
+    words = [word for word in _WORD.findall(_PHRASE.sub(" ", query).lower()) if word not in _STOP_WORDS]
+    words = list(dict.fromkeys(words))
+    if not words and not phrases:
+        # Only stop words: search for them rather than nothing
+        words = list(dict.fromkeys(_WORD.findall(query.lower())))
+    if not words and not phrases:
+        return None
+    optional = " OR ".join(f'"{word}"' for word in words)
+    if not phrases:
+        return optional
+    required = " AND ".join(phrases)
+    return f"{required} AND ({optional})" if optional else required
+
+
+class FTSEnvironmentalLawRAG:
+    """
+    A RAG system over a SQLite FTS5 index.
+
+    Chunks are stored in one SQLite file: a documents table, a chunks table
+    with indexed metadata columns, and an external-content FTS5 table over
+    the chunk text ranked with bm25(). Nothing is held in memory beyond
+    SQLite's page cache, and no scikit-learn, embeddings or Chroma are needed.
+    """
+    
+    def __init__(self,
+                 pdf_directory: str = ".",
+                 persist_directory: str = "rag/fts_db"):
+        """
+        Initialize the FTS5 RAG system.
+        """
+        self.pdf_directory = Path(pdf_directory)
+        self.persist_directory = Path(persist_directory)
+        self.database_path = self.persist_directory / DATABASE_FILENAME
+        
+        # Initialize components
+        self.documents = []
+        self.corpus_stats = None
+        # One read connection per thread; SQLite connections are not shared across threads
+        self._connections = threading.local()
+        # Bumped when the database file is replaced; threads then reopen their connections
+        self._generation = 0
+        
+        # Create persist directory if it doesn't exist
+        self.persist_directory.mkdir(parents=True, exist_ok=True)
+        
+        logger.info("FTS5 Environmental Law RAG System initialized")
+    
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._connections, 'connection', None)
+        if connection is not None and self._connections.generation != self._generation:
+            # Still reading the file that a rebuild replaced
+            self.close()
+            connection = None
+        if connection is None:
+            generation = self._generation
+            connection = sqlite3.connect(f"file:{self.database_path}?mode=ro", uri=True)
+            connection.row_factory = sqlite3.Row
+            self._connections.connection = connection
+            self._connections.generation = generation
+        return connection
+    
+    def load_pdf_documents(self) -> List[Dict[str, Any]]:
+        """Load and process all PDF documents from the directory."""
+        documents = []
+        pdf_files = list(self.pdf_directory.glob("*.pdf"))
+        
+        if not pdf_files:
+            logger.warning(f"No PDF files found in {self.pdf_directory}")
+            return documents
+        
+        logger.info(f"Found {len(pdf_files)} PDF files to process")
+        
+        for pdf_file in pdf_files:
+            try:
+                logger.info(f"Processing {pdf_file.name}")
+                
+                with open(pdf_file, 'rb') as file:
+                    pdf_reader = PyPDF2.PdfReader(file)
+                    text = ""
+                    
+                    for page_num, page in enumerate(pdf_reader.pages):
+                        page_text = page.extract_text()
+                        if page_text.strip():
+                            text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
+                
+                if not text.strip():
+                    logger.warning(f"No text extracted from {pdf_file.name}")
+                    continue
+                
+                documents.append({
+                    'content': text,
+                    'metadata': {
+                        'source': pdf_file.name,
+                        'file_path': str(pdf_file),
+                        'total_pages': len(pdf_reader.pages),
+                        'document_type': 'environmental_law'
+                    }
+                })
+            
+            except Exception as e:
+                logger.error(f"Error processing {pdf_file.name}: {e}")
+        
+        self.documents = documents
+        logger.info(f"Successfully loaded {len(documents)} documents")
+        return documents
+    
+    def chunk_documents(self, chunk_size: int = 1000) -> List[Dict[str, Any]]:
+        """Split documents into paragraph-aligned chunks."""
+        if not self.documents:
+            logger.warning("No documents loaded. Call load_pdf_documents() first.")
+            return []
+        
+        all_chunks = []
+        for doc in self.documents:
+            chunks = []
+            current_chunk = ""
+            for paragraph in doc['content'].split('\n\n'):
+                if len(current_chunk) + len(paragraph) <= chunk_size:
+                    current_chunk += paragraph + "\n\n"
+                else:
+                    if current_chunk.strip():
+                        chunks.append(current_chunk.strip())
+                    current_chunk = paragraph + "\n\n"
+            if current_chunk.strip():
+                chunks.append(current_chunk.strip())
+            
+            for i, chunk in enumerate(chunks):
+                chunk_metadata = doc['metadata'].copy()
+                chunk_metadata.update({
+                    'chunk_id': f"{doc['metadata']['source']}_chunk_{i}",
+                    'chunk_index': i,
+                    'total_chunks': len(chunks)
+                })
+                all_chunks.append({'content': chunk, 'metadata': chunk_metadata})
+        
+        logger.info(f"Created {len(all_chunks)} chunks from {len(self.documents)} documents")
+        return all_chunks
+    
+    def create_vectorstore(self, chunks: List[Dict[str, Any]]):
+        """
+        Write chunks to a new FTS5 index.
+
+        The database is built under a temporary name and renamed into place,
+        so readers never see a half-built index.
+        """
+        if not chunks:
+            logger.warning("No chunks provided for index creation")
+            return
+        
+        tmp_path = self.database_path.with_suffix(".tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            connection = sqlite3.connect(tmp_path)
+            connection.executescript(SCHEMA)
+            
+            doc_ids: Dict[str, int] = {}
+            last_page: Dict[int, int] = {}
+            rows = []
+            for chunk in chunks:
+                metadata = chunk['metadata']
+                source = metadata.get('source', 'Unknown')
+                doc_id = doc_ids.get(source)
+                if doc_id is None:
+                    cursor = connection.execute(
+                        "INSERT INTO documents (source, file_path, total_pages, document_type) VALUES (?, ?, ?, ?)",
+                        (source, metadata.get('file_path'), metadata.get('total_pages'), metadata.get('document_type'))
+                    )
+                    doc_id = doc_ids[source] = cursor.lastrowid
+                page_start, page_end = _page_span(chunk['content'], last_page.get(doc_id, -1))
+                last_page[doc_id] = page_end
+                rows.append((doc_id, int(metadata.get('chunk_index', 0)), int(metadata.get('total_chunks', 0)),
+                             page_start, page_end, chunk['content']))
+            
+            connection.executemany(
+                "INSERT INTO chunks (doc_id, chunk_index, total_chunks, page_start, page_end, content) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            # Index all chunk text in one pass, then merge the FTS b-trees for faster queries
+            connection.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('rebuild')")
+            connection.execute("INSERT INTO chunks_fts (chunks_fts) VALUES ('optimize')")
+            connection.commit()
+            connection.execute("VACUUM")
+            connection.close()
+            
+            self.close()
+            os.replace(tmp_path, self.database_path)
+            self._generation += 1
+            
+            # Track corpus statistics during the build
+            self.corpus_stats = CorpusStatistics()
+            self.corpus_stats.add_chunks(chunks)
+            self.corpus_stats.save(self.persist_directory)
+            
+            logger.info(f"FTS5 index created with {len(rows)} chunks")
+        
+        except Exception as e:
+            logger.error(f"Error creating FTS5 index: {e}")
+            tmp_path.unlink(missing_ok=True)
+            raise
+    
+    def load_existing_vectorstore(self) -> bool:
+        """Open an existing index if there is one."""
+        if not self.database_path.exists():
+            logger.info("No existing FTS5 index found")
+            return False
+        
+        try:
+            # The file may have been replaced since other threads opened it
+            self._generation += 1
+            count = self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            
+            # Load persisted statistics, rebuilding them once if they are missing
+            self.corpus_stats = CorpusStatistics.load(self.persist_directory)
+            if self.corpus_stats is None or self.corpus_stats.total_chunks != count:
+                rows = self._connection().execute(
+                    "SELECT d.source, c.content FROM chunks c JOIN documents d ON d.id = c.doc_id"
+                ).fetchall()
+                self.corpus_stats = CorpusStatistics.from_records(
+                    [{'source': row['source']} for row in rows], [row['content'] for row in rows]
+                )
+                self.corpus_stats.save(self.persist_directory)
+            
+            logger.info(f"Loaded existing FTS5 index with {count} chunks")
+            return True
+        
+        except sqlite3.Error as e:
+            logger.error(f"Error loading FTS5 index: {e}")
+            return False
+    
+    def close(self):
+        """Close this thread's database connection."""
+        connection = getattr(self._connections, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._connections.connection = None
+    
+    @staticmethod
+    def _filter_clause(source: Union[str, List[str], None] = None,
+                       document_type: Union[str, List[str], None] = None,
+                       page: Union[int, Tuple[int, int], None] = None) -> Tuple[str, List[Any]]:
+        """SQL conditions and parameters for ChunkMetadataStore.mask()-style filters."""
+        conditions, params = [], []
+        for column, value in (("d.source", source), ("d.document_type", document_type)):
+            if value is None:
+                continue
+            values = [value] if isinstance(value, str) else list(value)
+            conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+            params.extend(values)
+        if page is not None:
+            first, last = (page, page) if isinstance(page, int) else page
+            conditions.append("c.page_start >= 0 AND c.page_start <= ? AND c.page_end >= ?")
+            params.extend([last, first])
+        return "".join(f" AND {condition}" for condition in conditions), params
+    
+    def search_similar_documents(self, query: str, k: int = 5,
+                                 filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Search for relevant chunks with FTS5 and bm25() ranking.
+
+        Args:
+            query: Search query; "quoted phrases" must occur in every result
+            k: Number of documents to return
+            filters: Metadata filters, e.g. {"source": "air_act-1981.pdf", "page": 4}
+        """
+        if not self.database_path.exists():
+            logger.error("FTS5 index not initialized")
+            return []
+        
+        try:
+            expression = match_expression(query)
+            if expression is None:
+                return []
+            where, params = self._filter_clause(**(filters or {}))
+            
+            # bm25() is lower for better matches; the metadata join uses the indexed columns
+            with stage("retrieve"):
+                rows = self._connection().execute(
+                    "SELECT c.id, c.chunk_index, c.total_chunks, c.page_start, c.page_end, c.content, "
+                    "d.source, d.file_path, d.total_pages, d.document_type, bm25(chunks_fts) AS rank "
+                    "FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid JOIN documents d ON d.id = c.doc_id "
+                    f"WHERE chunks_fts MATCH ?{where} ORDER BY rank LIMIT ?",
+                    [expression, *params, k]
+                ).fetchall()
+            record(candidates=len(rows))
+            
+            return [self._hit(row) for row in rows]
+        
+        except Exception as e:
+            logger.error(f"Error searching documents: {e}")
+            return []
+    
+    @staticmethod
+    def _hit(row: sqlite3.Row) -> Dict[str, Any]:
+        """Search hit in the engines' usual shape."""
+        metadata = {
+            'source': row['source'],
+            'file_path': row['file_path'],
+            'total_pages': row['total_pages'],
+            'document_type': row['document_type'],
+            'chunk_id': f"{row['source']}_chunk_{row['chunk_index']}",
+            'chunk_index': row['chunk_index'],
+            'total_chunks': row['total_chunks']
+        }
+        if row['page_start'] >= 0:
+            metadata['page_start'] = row['page_start']
+            metadata['page_end'] = row['page_end']
+        return {
+            'content': row['content'],
+            'metadata': metadata,
+            'similarity_score': -row['rank'],
+            'source': row['source']
+        }
+    
+    def generate_answer(self, question: str, context_docs: List[Dict[str, Any]]) -> str:
+        """Extract the sentences of the retrieved chunks that mention the question's terms."""
+        if not context_docs:
+            return "I couldn't find relevant information to answer your question."
+        
+        sources = list(dict.fromkeys(doc['source'] for doc in context_docs))
+        terms = [word for word in _WORD.findall(question.lower()) if word not in _STOP_WORDS]
+        
+        key_sentences = []
+        for doc in context_docs:
+            for sentence in doc['content'].split('.'):
+                if any(term in sentence.lower() for term in terms):
+                    key_sentences.append(" ".join(sentence.split()))
+                    if len(key_sentences) >= 3:
+                        break
+            if len(key_sentences) >= 3:
+                break
+        
+        if key_sentences:
+            return ". ".join(key_sentences) + f".\n\nSources: {', '.join(sources)}"
+        return f"I found relevant information in the documents. Please check the source documents for detailed answers. Sources: {', '.join(sources)}"
+    
+    def query(self, question: str, k: int = 5) -> Dict[str, Any]:
+        """Query the RAG system with a question."""
+        if not self.database_path.exists():
+            logger.error("FTS5 index not initialized")
+            return {"error": "Vector store not initialized"}
+        
+        try:
+            # Search for relevant documents
+            context_docs = self.search_similar_documents(question, k=k)
+            
+            # Generate answer
+            with stage("answer"):
+                answer = self.generate_answer(question, context_docs)
+            
+            return {
+                "question": question,
+                "answer": answer,
+                "source_documents": context_docs
+            }
+        
+        except Exception as e:
+            logger.error(f"Error querying RAG system: {e}")
+            return {"error": str(e)}
+    
+    def get_document_statistics(self) -> Dict[str, Any]:
+        """Get statistics about the loaded documents"""
+        if self.corpus_stats is None:
+            return {"error": "Vector store not initialized"}
+        return self.corpus_stats.to_dict()
+
+
+def main():
+    """Build the FTS5 index if needed and run a few sample questions"""
+    rag = FTSEnvironmentalLawRAG(pdf_directory=os.environ.get("RAG_PDF_DIRECTORY", "."))
+    
+    if not rag.load_existing_vectorstore():
+        print("No existing FTS5 index found. Creating new one...")
+        rag.load_pdf_documents()
+        chunks = rag.chunk_documents()
+        if not chunks:
+            print("❌ No documents to index")
+            return
+        rag.create_vectorstore(chunks)
+        rag.load_existing_vectorstore()
+    
+    stats = rag.get_document_statistics()
+    print(f"📊 {stats.get('total_chunks', 0)} chunks from {stats.get('unique_documents', 0)} documents")
+    
+    for question in [
+        "What are the penalties for air pollution violations?",
+        "What is the Water Prevention and Control of Pollution Act about?",
+        '"consent to establish" industry',
+    ]:
+        result = rag.query(question)
+        print(f"\n❓ {question}")
+        print(f"💡 {result.get('answer', result.get('error'))[:400]}")
+
+
+if __name__ == "__main__":
+    main()
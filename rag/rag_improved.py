@@ -5,22 +5,40 @@ A robust RAG system that properly stores and retrieves document content
 
 import os
 import logging
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator
 from pathlib import Path
 import re
 import json
+import shutil
 
 # Core libraries
-import chromadb
-from chromadb.config import Settings
 import numpy as np
 
-# PDF processing
-import PyPDF2
+from lazy_imports import lazy_import
 
-# Simple text processing
-from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+# PDF processing (imported on first use)
+PyPDF2 = lazy_import("PyPDF2")
+
+# Simple text processing; only needed to fit a new index, since
+# unpickling a saved vectorizer imports scikit-learn itself
+TfidfVectorizer = lazy_import("sklearn.feature_extraction.text", "TfidfVectorizer")
+
+from corpus_stats import CorpusStatistics
+from build_checkpoint import BuildCheckpoint
+from reranker import TwoStageReranker
+from diversify import candidate_count, select_results
+from snippets import annotate_matches
+from semantic_cache import SemanticAnswerCache, out_of_vocabulary_terms
+from positional_index import PositionalIndex, is_structured_query
+from sharded_search import ShardedIndex, SearchResults, load_manifest, write_shards
+from out_of_core import OutOfCoreIndexBuilder, csr_directory, has_csr_index, load_csr_index
+from parallel_build import parallel_fit_transform, parallel_imap
+from metadata_store import ChunkMetadataStore
+from legal_tokenizer import tfidf_vectorizer_params
+from slow_query_log import stage, record
+from lsa_index import LSAIndex, DEFAULT_DIMENSIONS as DEFAULT_LSA_DIMENSIONS
+from suggest_index import SuggestIndex, logged_queries, saved_queries
+from anytime_search import BlockMaxIndex, DEFAULT_BLOCK_SIZE, anytime_search, matrix_block_scorer
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -45,16 +63,37 @@ class ImprovedEnvironmentalLawRAG:
         self.vectorizer = None
         self.documents = []
         self.document_texts = []
-        self.document_metadata = []
-        self.document_chunks = []  # Store actual chunks with content
+        # Chunk metadata as columns; dicts are only built for returned results
+        self.metadata_store: Optional[ChunkMetadataStore] = None
+        self.document_chunks = []  # Chunks with content, kept while building
+        self.corpus_stats = None
+        # Optional second retrieval stage applied to the top candidates
+        self.reranker: Optional[TwoStageReranker] = None
+        # Optional cache of answers to paraphrased questions
+        self.answer_cache: Optional[SemanticAnswerCache] = None
+        # Positional index for exact phrase and NEAR/k queries
+        self.positional_index: Optional[PositionalIndex] = None
+        # Shard workers serving the index when it is too large for one process
+        self.shards: Optional[ShardedIndex] = None
+        # Optional dense LSA projection scored instead of the sparse TF-IDF matrix
+        self.lsa_index: Optional[LSAIndex] = None
+        # Autocomplete over the vocabulary, section titles and act names
+        self.suggest_index: Optional[SuggestIndex] = None
+        # Per-block term maxima for anytime search, saved with the matrix
+        self.block_index: Optional[BlockMaxIndex] = None
+        # Loaded from a published snapshot, whose directory is never written
+        self.read_only = False
+        # Default time budget for search_similar_documents(); None scores every chunk
+        self.search_deadline_ms: Optional[float] = None
         
         # Create persist directory if it doesn't exist
         self.persist_directory.mkdir(parents=True, exist_ok=True)
         
         logger.info("Improved Environmental Law RAG System initialized")
     
-    def load_pdf_documents(self) -> List[Dict[str, Any]]:
-        """Load and process all PDF documents from the directory."""
+    def load_pdf_documents(self, checkpoint: Optional[BuildCheckpoint] = None,
+                           workers: int = 1) -> List[Dict[str, Any]]:
+        """Load and process all PDF documents from the directory, extracting on up to `workers` processes."""
         documents = []
         pdf_files = list(self.pdf_directory.glob("*.pdf"))
         
@@ -64,46 +103,75 @@ class ImprovedEnvironmentalLawRAG:
         
         logger.info(f"Found {len(pdf_files)} PDF files to process")
         
+        extracted = {}
+        pending = []
         for pdf_file in pdf_files:
-            try:
-                logger.info(f"Processing {pdf_file.name}")
-                
-                with open(pdf_file, 'rb') as file:
-                    pdf_reader = PyPDF2.PdfReader(file)
-                    text = ""
-                    
-                    for page_num, page in enumerate(pdf_reader.pages):
-                        page_text = page.extract_text()
-                        if page_text.strip():
-                            text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
-                
-                if text.strip():
-                    doc_metadata = {
-                        'source': pdf_file.name,
-                        'file_path': str(pdf_file),
-                        'total_pages': len(pdf_reader.pages),
-                        'document_type': 'environmental_law'
-                    }
-                    
-                    documents.append({
-                        'content': text,
-                        'metadata': doc_metadata
-                    })
-                    
-                    logger.info(f"Successfully processed {pdf_file.name} ({len(pdf_reader.pages)} pages)")
-                else:
-                    logger.warning(f"No text extracted from {pdf_file.name}")
-                    
-            except Exception as e:
-                logger.error(f"Error processing {pdf_file.name}: {e}")
-                continue
+            if checkpoint is not None:
+                cached = checkpoint.get_extraction(pdf_file)
+                if cached is not None:
+                    logger.info(f"Reusing checkpointed extraction of {pdf_file.name}")
+                    extracted[pdf_file] = cached
+                    continue
+            pending.append(pdf_file)
         
+        # Results arrive in file order, so each one is checkpointed as soon as it is ready
+        for pdf_file, document in zip(pending, parallel_imap(self._extract_pdf, pending, workers=workers)):
+            if document is not None:
+                extracted[pdf_file] = document
+                if checkpoint is not None:
+                    checkpoint.record_extraction(pdf_file, document)
+        
+        documents = [extracted[pdf_file] for pdf_file in pdf_files if pdf_file in extracted]
         self.documents = documents
+        if checkpoint is not None:
+            checkpoint.mark_complete("extraction")
         logger.info(f"Successfully loaded {len(documents)} documents")
         return documents
     
-    def chunk_documents(self, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Dict[str, Any]]:
+    @staticmethod
+    def _extract_pdf(pdf_file: Path) -> Optional[Dict[str, Any]]:
+        """Extract the text of one PDF with page markers; None if it yields no text (runs in build workers)."""
+        try:
+            logger.info(f"Processing {pdf_file.name}")
+            
+            with open(pdf_file, 'rb') as file:
+                pdf_reader = PyPDF2.PdfReader(file)
+                text = ""
+                
+                for page_num, page in enumerate(pdf_reader.pages):
+                    page_text = page.extract_text()
+                    if page_text.strip():
+                        text += f"\n--- Page {page_num + 1} ---\n{page_text}\n"
+            
+            if not text.strip():
+                logger.warning(f"No text extracted from {pdf_file.name}")
+                return None
+            
+            doc_metadata = {
+                'source': pdf_file.name,
+                'file_path': str(pdf_file),
+                'total_pages': len(pdf_reader.pages),
+                'document_type': 'environmental_law'
+            }
+            
+            logger.info(f"Successfully processed {pdf_file.name} ({len(pdf_reader.pages)} pages)")
+            return {
+                'content': text,
+                'metadata': doc_metadata
+            }
+            
+        except Exception as e:
+            logger.error(f"Error processing {pdf_file.name}: {e}")
+            return None
+    
+    def chunk_documents(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                        checkpoint: Optional[BuildCheckpoint] = None) -> List[Dict[str, Any]]:
         """Split documents into chunks for better retrieval."""
+        if checkpoint is not None and checkpoint.is_complete(
+                "chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap, corpus=checkpoint.corpus_version()):
+            logger.info("Reusing checkpointed chunks")
+            return checkpoint.load_json("chunks")
+        
         if not self.documents:
             logger.warning("No documents loaded. Call load_pdf_documents() first.")
             return []
@@ -111,43 +179,80 @@ class ImprovedEnvironmentalLawRAG:
         all_chunks = []
         
         for doc in self.documents:
-            text = doc['content']
-            chunks = []
-            
-            # Simple chunking by splitting on double newlines first
-            paragraphs = text.split('\n\n')
-            current_chunk = ""
-            
-            for paragraph in paragraphs:
-                if len(current_chunk) + len(paragraph) <= chunk_size:
-                    current_chunk += paragraph + "\n\n"
-                else:
-                    if current_chunk.strip():
-                        chunks.append(current_chunk.strip())
-                    current_chunk = paragraph + "\n\n"
-            
-            # Add the last chunk
-            if current_chunk.strip():
-                chunks.append(current_chunk.strip())
-            
-            for i, chunk in enumerate(chunks):
-                chunk_metadata = doc['metadata'].copy()
-                chunk_metadata.update({
-                    'chunk_id': f"{doc['metadata']['source']}_chunk_{i}",
-                    'chunk_index': i,
-                    'total_chunks': len(chunks)
-                })
-                
-                all_chunks.append({
-                    'content': chunk,
-                    'metadata': chunk_metadata
-                })
+            all_chunks.extend(self._split_document(doc, chunk_size))
+        
+        if checkpoint is not None:
+            checkpoint.save_json("chunks", all_chunks)
+            checkpoint.mark_complete("chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                      corpus=checkpoint.corpus_version())
         
         logger.info(f"Created {len(all_chunks)} chunks from {len(self.documents)} documents")
         return all_chunks
     
-    def create_vectorstore(self, chunks: List[Dict[str, Any]]):
-        """Create and populate the vector store using TF-IDF."""
+    def _split_document(self, doc: Dict[str, Any], chunk_size: int) -> List[Dict[str, Any]]:
+        """Split one document into paragraph-aligned chunks."""
+        text = doc['content']
+        chunks = []
+        
+        # Simple chunking by splitting on double newlines first
+        paragraphs = text.split('\n\n')
+        current_chunk = ""
+        
+        for paragraph in paragraphs:
+            if len(current_chunk) + len(paragraph) <= chunk_size:
+                current_chunk += paragraph + "\n\n"
+            else:
+                if current_chunk.strip():
+                    chunks.append(current_chunk.strip())
+                current_chunk = paragraph + "\n\n"
+        
+        # Add the last chunk
+        if current_chunk.strip():
+            chunks.append(current_chunk.strip())
+        
+        doc_chunks = []
+        for i, chunk in enumerate(chunks):
+            chunk_metadata = doc['metadata'].copy()
+            chunk_metadata.update({
+                'chunk_id': f"{doc['metadata']['source']}_chunk_{i}",
+                'chunk_index': i,
+                'total_chunks': len(chunks)
+            })
+            
+            doc_chunks.append({
+                'content': chunk,
+                'metadata': chunk_metadata
+            })
+        return doc_chunks
+    
+    def iter_chunks(self, chunk_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Extract and chunk the PDFs one at a time, without holding the corpus in memory."""
+        for pdf_file in sorted(self.pdf_directory.glob("*.pdf")):
+            document = self._extract_pdf(pdf_file)
+            if document is not None:
+                yield from self._split_document(document, chunk_size)
+    
+    def create_vectorstore_out_of_core(self, chunks: Iterable[Dict[str, Any]],
+                                       memory_budget_mb: int = 256) -> bool:
+        """
+        Build the index from a stream of chunks with bounded memory (see out_of_core.py).
+        
+        The result is an on-disk CSR matrix with a hashing vectorizer, which
+        load_existing_vectorstore() opens memory-mapped. The index is not
+        loaded here: loading reads every chunk text, which the budget does not cover.
+        """
+        try:
+            builder = OutOfCoreIndexBuilder(self.persist_directory, memory_budget_mb=memory_budget_mb)
+            builder.build(chunks)
+            return True
+        except Exception as e:
+            logger.error(f"Error in out-of-core build: {e}")
+            return False
+    
+    def create_vectorstore(self, chunks: List[Dict[str, Any]],
+                           checkpoint: Optional[BuildCheckpoint] = None,
+                           workers: int = 1):
+        """Create and populate the vector store using TF-IDF, fitted on up to `workers` processes."""
         if not chunks:
             logger.warning("No chunks provided for vector store creation")
             return
@@ -158,23 +263,53 @@ class ImprovedEnvironmentalLawRAG:
             
             # Prepare documents for TF-IDF
             self.document_texts = [chunk['content'] for chunk in chunks]
-            self.document_metadata = [chunk['metadata'] for chunk in chunks]
-            
-            # Create TF-IDF vectorizer
-            self.vectorizer = TfidfVectorizer(
-                max_features=5000,
-                stop_words='english',
-                ngram_range=(1, 2),
-                min_df=2,
-                max_df=0.8
+            self.metadata_store = ChunkMetadataStore.from_records(
+                (chunk['metadata'] for chunk in chunks), self.document_texts
             )
             
-            # Fit the vectorizer
-            logger.info("Creating TF-IDF vectors...")
-            self.tfidf_matrix = self.vectorizer.fit_transform(self.document_texts)
+            if checkpoint is not None and checkpoint.is_complete("vectorization", chunking=checkpoint.stage_params("chunking")):
+                # Reuse the TF-IDF state fitted by an interrupted build
+                logger.info("Reusing checkpointed TF-IDF vectors")
+                self.vectorizer, self.tfidf_matrix = checkpoint.load_pickle("tfidf")
+            else:
+                # Create TF-IDF vectorizer; the legal tokenizer is pickled with it,
+                # so queries are tokenized exactly like the indexed chunks
+                self.vectorizer = TfidfVectorizer(**tfidf_vectorizer_params())
+                
+                # Fit the vectorizer
+                logger.info("Creating TF-IDF vectors...")
+                if workers > 1:
+                    # Map-reduce fit; produces the same vocabulary, IDF and matrix
+                    self.tfidf_matrix = parallel_fit_transform(self.vectorizer, self.document_texts, workers=workers)
+                else:
+                    self.tfidf_matrix = self.vectorizer.fit_transform(self.document_texts)
+                
+                if checkpoint is not None:
+                    checkpoint.save_pickle("tfidf", (self.vectorizer, self.tfidf_matrix))
+                    checkpoint.mark_complete("vectorization", chunking=checkpoint.stage_params("chunking"))
+            
+            # Positional index for exact phrase and proximity queries
+            self.positional_index = PositionalIndex.build(self.document_texts)
+            
+            # Autocomplete suggestions, built from this index's vocabulary and texts
+            # Questions added to the previous suggestions or logged since are kept
+            self.suggest_index = SuggestIndex.build(self.vectorizer, self.metadata_store, self.document_texts,
+                                                    queries=saved_queries(self.persist_directory),
+                                                    logged=logged_queries(self.persist_directory))
+            
+            # An LSA index projects the old matrix; build_lsa_index() refits it
+            self.lsa_index = None
+            self.block_index = None
+            
+            # Track corpus statistics during the build
+            self.corpus_stats = CorpusStatistics()
+            self.corpus_stats.add_chunks(chunks)
             
             # Save to file for persistence
-            self.save_vectorstore()
+            if not self.save_vectorstore():
+                raise RuntimeError("Vector store could not be saved")
+            if checkpoint is not None:
+                checkpoint.mark_complete("persistence")
             
             logger.info(f"Vector store created with {len(chunks)} chunks")
             
@@ -187,27 +322,62 @@ class ImprovedEnvironmentalLawRAG:
         try:
             # Save TF-IDF matrix
             np.save(self.persist_directory / "tfidf_matrix.npy", self.tfidf_matrix.toarray())
+            # An on-disk matrix from an earlier out-of-core build would shadow this one
+            shutil.rmtree(csr_directory(self.persist_directory), ignore_errors=True)
             
-            # Save metadata
+            # Save metadata, as columns for loading and as JSON records for other tools
+            chunks = self._stored_chunks()
+            self.metadata_store.save(self.persist_directory)
             with open(self.persist_directory / "metadata.json", 'w') as f:
-                json.dump(self.document_metadata, f)
+                json.dump([chunk['metadata'] for chunk in chunks], f)
             
             # Save document chunks with full content
             with open(self.persist_directory / "chunks.json", 'w') as f:
-                json.dump(self.document_chunks, f)
+                json.dump(chunks, f)
             
             # Save vectorizer
             import pickle
             with open(self.persist_directory / "vectorizer.pkl", 'wb') as f:
                 pickle.dump(self.vectorizer, f)
             
+            # Save positional index
+            if self.positional_index is not None:
+                self.positional_index.save(self.persist_directory)
+            
+            # Save autocomplete suggestions
+            if self.suggest_index is not None:
+                self.suggest_index.save(self.persist_directory)
+            
+            # Save or drop the LSA projection so it always matches the saved matrix
+            if self.lsa_index is not None:
+                self.lsa_index.save(self.persist_directory)
+            else:
+                LSAIndex.remove(self.persist_directory)
+            # Block maxima for anytime search, written with the matrix they bound
+            self.block_index = BlockMaxIndex.build(self.tfidf_matrix)
+            self.block_index.save(self.persist_directory)
+            
+            # Statistics go last so the recorded index size covers every file
+            if self.corpus_stats is not None:
+                self.corpus_stats.save(self.persist_directory)
+            
             logger.info("Vector store saved successfully")
+            return True
             
         except Exception as e:
             logger.error(f"Error saving vector store: {e}")
+            return False
     
-    def load_existing_vectorstore(self):
-        """Load existing vector store if it exists"""
+    def load_existing_vectorstore(self, mmap_mode: Optional[str] = None, read_only: bool = False):
+        """
+        Load existing vector store if it exists.
+        
+        Args:
+            mmap_mode: Memory-map the TF-IDF matrix instead of reading it (e.g. 'r'),
+                so several processes share one copy through the page cache
+            read_only: Build missing derived files in memory without writing them,
+                as for a published snapshot
+        """
         try:
             # Check if files exist
             tfidf_file = self.persist_directory / "tfidf_matrix.npy"
@@ -215,69 +385,359 @@ class ImprovedEnvironmentalLawRAG:
             vectorizer_file = self.persist_directory / "vectorizer.pkl"
             chunks_file = self.persist_directory / "chunks.json"
             
-            if not all([tfidf_file.exists(), metadata_file.exists(), vectorizer_file.exists(), chunks_file.exists()]):
+            matrix_exists = tfidf_file.exists() or has_csr_index(self.persist_directory)
+            if not all([matrix_exists, metadata_file.exists(), vectorizer_file.exists(), chunks_file.exists()]):
                 logger.info("No existing vector store found")
                 return False
             
-            # Load TF-IDF matrix
-            self.tfidf_matrix = np.load(tfidf_file)
-            
-            # Load metadata
-            with open(metadata_file, 'r') as f:
-                self.document_metadata = json.load(f)
+            # Load TF-IDF matrix; an out-of-core build leaves a memory-mapped CSR matrix instead
+            if has_csr_index(self.persist_directory):
+                self.tfidf_matrix = load_csr_index(self.persist_directory)
+            else:
+                self.tfidf_matrix = np.load(tfidf_file, mmap_mode=mmap_mode)
             
-            # Load document chunks with full content
+            # Load chunk content; the per-chunk metadata dicts in chunks.json are dropped
             with open(chunks_file, 'r') as f:
-                self.document_chunks = json.load(f)
+                self.document_texts = [chunk['content'] for chunk in json.load(f)]
+            self.document_chunks = []
+            
+            # Load columnar metadata, converting metadata.json once for older indexes
+            self.metadata_store = ChunkMetadataStore.load_or_convert(
+                self.persist_directory, expected_chunks=len(self.document_texts), texts=self.document_texts,
+                save=not read_only
+            )
+            
+            # Load the LSA projection if one was built for this matrix
+            self.lsa_index = LSAIndex.load(self.persist_directory, mmap_mode=mmap_mode)
+            if self.lsa_index is not None and (len(self.lsa_index), self.lsa_index.num_features) != self.tfidf_matrix.shape:
+                logger.warning("Ignoring LSA index built for a different TF-IDF matrix")
+                self.lsa_index = None
+            self.block_index = None
+            self.read_only = read_only
             
             # Load vectorizer
             import pickle
             with open(vectorizer_file, 'rb') as f:
                 self.vectorizer = pickle.load(f)
             
-            # Reconstruct document texts from chunks
-            self.document_texts = [chunk['content'] for chunk in self.document_chunks]
-            
-            logger.info(f"Loaded existing vector store with {len(self.document_metadata)} documents")
+            # Load positional index, building it once for older indexes; out-of-core
+            # builds have none and answer phrase queries with TF-IDF search
+            self.positional_index = PositionalIndex.load(self.persist_directory)
+            if self.positional_index is not None and self.positional_index.num_documents != len(self.document_texts):
+                logger.warning("Ignoring positional index built for different chunks")
+                self.positional_index = None
+            if self.positional_index is None and not has_csr_index(self.persist_directory):
+                self.positional_index = PositionalIndex.build(self.document_texts)
+                if not read_only:
+                    self.positional_index.save(self.persist_directory)
+            
+            # Load autocomplete suggestions; indexes built before them have none
+            self.suggest_index = SuggestIndex.load(self.persist_directory)
+            
+            # Load persisted statistics, rebuilding them once for older indexes
+            self.corpus_stats = CorpusStatistics.load(self.persist_directory)
+            if self.corpus_stats is None or self.corpus_stats.total_chunks != len(self.metadata_store):
+                self.corpus_stats = CorpusStatistics.from_records(self.metadata_store.records(), self.document_texts)
+                if not read_only:
+                    self.corpus_stats.save(self.persist_directory)
+            
+            logger.info(f"Loaded existing vector store with {len(self.metadata_store)} documents")
             return True
                 
         except Exception as e:
             logger.error(f"Error loading existing vector store: {e}")
             return False
     
-    def search_similar_documents(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar documents using TF-IDF."""
-        if not hasattr(self, 'vectorizer') or not hasattr(self, 'tfidf_matrix'):
+    def build_lsa_index(self, dimensions: int = DEFAULT_LSA_DIMENSIONS) -> bool:
+        """
+        Project the TF-IDF matrix onto a truncated-SVD basis and search with it.
+        
+        The projection is saved next to the index and loaded with it, so
+        search_similar_documents() scores the dense LSA vectors from then on.
+        """
+        try:
+            self.lsa_index = LSAIndex.build(self.tfidf_matrix, dimensions=dimensions)
+            self.lsa_index.save(self.persist_directory)
+            return True
+        except Exception as e:
+            logger.error(f"Error building LSA index: {e}")
+            self.lsa_index = None
+            return False
+    
+    def build_shards(self, num_shards: int = 4):
+        """Split the loaded index into shards for load_sharded_vectorstore()."""
+        return write_shards(self.persist_directory, self.tfidf_matrix, self._stored_chunks(), num_shards)
+    
+    def _stored_chunks(self) -> List[Dict[str, Any]]:
+        """Chunks in the {'content', 'metadata'} form, rebuilt from the columns after a load."""
+        if self.document_chunks:
+            return self.document_chunks
+        return [
+            {'content': text, 'metadata': metadata}
+            for text, metadata in zip(self.document_texts, self.metadata_store.records())
+        ]
+    
+    def load_sharded_vectorstore(self, timeout: float = 0.5):
+        """
+        Serve an existing sharded index through shard worker processes.
+        
+        Only the vectorizer and metadata are loaded here; the TF-IDF rows and
+        chunk content stay in the workers.
+        """
+        try:
+            vectorizer_file = self.persist_directory / "vectorizer.pkl"
+            
+            if load_manifest(self.persist_directory) is None or not vectorizer_file.exists():
+                logger.info("No sharded vector store found")
+                return False
+            
+            # Load vectorizer shared by all shards
+            import pickle
+            with open(vectorizer_file, 'rb') as f:
+                self.vectorizer = pickle.load(f)
+            
+            # Load columnar metadata for filters and statistics
+            self.metadata_store = ChunkMetadataStore.load_or_convert(self.persist_directory)
+            
+            self.corpus_stats = CorpusStatistics.load(self.persist_directory)
+            if self.corpus_stats is None:
+                self.corpus_stats = CorpusStatistics.from_records(self.metadata_store.records())
+            
+            self.suggest_index = SuggestIndex.load(self.persist_directory)
+            
+            self.shards = ShardedIndex(self.persist_directory, timeout=timeout)
+            if not self.shards.start():
+                self.close()
+                return False
+            
+            logger.info(f"Serving {len(self.metadata_store)} documents from {self.shards.num_shards} shards")
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error loading sharded vector store: {e}")
+            self.close()
+            return False
+    
+    def close(self):
+        """Stop shard workers, if any."""
+        if self.shards is not None:
+            self.shards.close()
+            self.shards = None
+    
+    def search_similar_documents(self, query: str, k: int = 5, diversity: float = 0.0,
+                                 filters: Optional[Dict[str, Any]] = None,
+                                 min_score: Optional[float] = None,
+                                 deadline_ms: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Search for similar documents using TF-IDF.
+        
+        With min_score or a deadline the search runs in anytime mode (see
+        anytime_search.py): chunks are scored block by block, highest-impact
+        blocks first, and if the budget runs out the best results so far are
+        returned as SearchResults with truncated=True.
+        
+        Args:
+            query: Search query
+            k: Number of documents to return
+            diversity: MMR trade-off in [0, 1]; above 0, near-duplicate chunks are demoted
+            filters: Metadata filters for ChunkMetadataStore.mask(), e.g. {"source": "air_act-1981.pdf", "page": 4}
+            min_score: Only return chunks scoring at least this
+            deadline_ms: Scoring time budget; defaults to self.search_deadline_ms
+        """
+        if self.shards is None and (not hasattr(self, 'vectorizer') or not hasattr(self, 'tfidf_matrix')):
             logger.error("Vector store not initialized")
             return []
         
         try:
-            # Transform query to TF-IDF
-            query_vector = self.vectorizer.transform([query])
+            # Quoted phrases and NEAR/k operators are answered by the positional index
+            if self.positional_index is not None and is_structured_query(query):
+                return self.phrase_search(query, k=k, diversity=diversity, filters=filters)
             
-            # Calculate cosine similarity
-            similarities = cosine_similarity(query_vector, self.tfidf_matrix).flatten()
+            # Chunks allowed by the filters, evaluated over whole metadata columns
+            allowed = self.metadata_store.mask(**filters) if filters else None
             
-            # Get top k most similar documents
-            top_indices = similarities.argsort()[-k:][::-1]
+            # Transform query to TF-IDF
+            with stage("vectorize"):
+                query_vector = self.vectorizer.transform([query])
+            
+            if deadline_ms is None:
+                deadline_ms = self.search_deadline_ms
+            
+            if self.shards is not None:
+                return self._search_shards(query, query_vector, k, diversity, allowed, min_score, deadline_ms)
+            
+            # Get top k most similar documents (more candidates when re-ranking or diversifying)
+            fetch_k = candidate_count(k, self.reranker, diversity)
+            if min_score is not None or deadline_ms is not None:
+                return self._anytime_search(query, query_vector, k, fetch_k, diversity, allowed, min_score, deadline_ms)
+            
+            # Rows and query are L2-normalized, so cosine similarity is a dot product over
+            # the query's terms; only those columns are read, which also keeps a
+            # memory-mapped matrix from being copied into memory
+            with stage("score"):
+                if self.lsa_index is not None:
+                    # Dense LSA scores from one matrix-vector product
+                    similarities = self.lsa_index.scores(query_vector)
+                elif hasattr(self.tfidf_matrix, 'tocsr'):
+                    similarities = (self.tfidf_matrix @ query_vector.T).toarray().ravel()
+                else:
+                    similarities = np.asarray(self.tfidf_matrix[:, query_vector.indices] @ query_vector.data).ravel()
+                
+                if allowed is not None:
+                    similarities = np.where(allowed, similarities, -np.inf)
+                
+                top_indices = similarities.argsort()[-fetch_k:][::-1]
+                top_indices = top_indices[top_indices < len(self.document_texts)]
+                top_indices = top_indices[np.isfinite(similarities[top_indices])]
+                record(candidates=len(similarities))
             
-            documents = []
-            for i, idx in enumerate(top_indices):
-                if idx < len(self.document_chunks):
-                    chunk = self.document_chunks[idx]
-                    documents.append({
-                        'content': chunk['content'],
-                        'metadata': chunk['metadata'],
-                        'similarity_score': similarities[idx],
-                        'source': chunk['metadata'].get('source', 'Unknown')
-                    })
+            documents = [self._hit(idx, similarities[idx]) for idx in top_indices]
             
-            return documents
+            return self._select(
+                query, documents, k,
+                diversity=diversity,
+                vectors=lambda: self.tfidf_matrix[top_indices]
+            )
             
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
             return []
     
+    def phrase_search(self, query: str, k: int = 5, diversity: float = 0.0,
+                      filters: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Search with exact phrases and proximity operators.
+        
+        Only chunks satisfying every quoted phrase ("consent to establish") and
+        NEAR/k clause (water NEAR/5 pollution) are returned; other words in the
+        query only affect the ranking.
+        """
+        if self.positional_index is None:
+            logger.error("Positional index not available")
+            return []
+        
+        try:
+            fetch_k = candidate_count(k, self.reranker, diversity)
+            with stage("phrase_match"):
+                if filters:
+                    # Rank every match so enough survive the filters
+                    allowed = self.metadata_store.mask(**filters)
+                    matches = self.positional_index.search(query, limit=None)
+                    matches = [match for match in matches if allowed[match[0]]][:fetch_k]
+                else:
+                    matches = self.positional_index.search(query, limit=fetch_k)
+            record(candidates=len(matches))
+            top_indices = np.array([doc_id for doc_id, _, _ in matches], dtype=int)
+            
+            documents = [self._hit(doc_id, score, phrase_matches=count) for doc_id, score, count in matches]
+            
+            return self._select(
+                query, documents, k,
+                diversity=diversity,
+                vectors=lambda: self.tfidf_matrix[top_indices]
+            )
+            
+        except Exception as e:
+            logger.error(f"Error in phrase search: {e}")
+            return []
+    
+    def _anytime_search(self, query: str, query_vector, k: int, fetch_k: int, diversity: float,
+                        allowed: Optional[np.ndarray], min_score: Optional[float],
+                        deadline_ms: Optional[float]) -> SearchResults:
+        """Score block by block under a score cutoff and time budget."""
+        with stage("score"):
+            if self.lsa_index is not None:
+                # Dense LSA scores have no per-block bound, so blocks go in row order
+                lsa_query = self.lsa_index.project(query_vector)
+                vectors = self.lsa_index.vectors
+                score_block = lambda start, end: vectors[start:end] @ lsa_query
+                block_size, upper_bounds = DEFAULT_BLOCK_SIZE, None
+            else:
+                if self.block_index is None:
+                    self.block_index = BlockMaxIndex.load_or_build(self.persist_directory, self.tfidf_matrix,
+                                                                   save=not self.read_only)
+                score_block = matrix_block_scorer(self.tfidf_matrix, query_vector)
+                block_size = self.block_index.block_size
+                upper_bounds = self.block_index.upper_bounds(query_vector)
+            
+            found = anytime_search(
+                score_block, len(self.document_texts), fetch_k,
+                block_size=block_size,
+                upper_bounds=upper_bounds,
+                min_score=min_score,
+                deadline_ms=deadline_ms,
+                allowed=allowed
+            )
+            record(candidates=found.rows_scored)
+        
+        top_indices = found.indices
+        documents = [self._hit(idx, score) for idx, score in zip(top_indices, found.scores)]
+        
+        results = self._select(
+            query, documents, k,
+            diversity=diversity,
+            vectors=lambda: self.tfidf_matrix[top_indices]
+        )
+        return SearchResults(results, truncated=found.truncated)
+    
+    def _select(self, query: str, documents: List[Dict[str, Any]], k: int,
+                diversity: float = 0.0, vectors=None) -> List[Dict[str, Any]]:
+        """Final k hits (see select_results), annotated with their best-matching window."""
+        results = select_results(query, documents, k, reranker=self.reranker,
+                                 diversity=diversity, vectors=vectors)
+        # Term positions come from the postings when the positional index is loaded
+        term_positions = None
+        if self.positional_index is not None:
+            term_positions = lambda doc, terms: self.positional_index.term_positions(doc['chunk_row'], terms)
+        with stage("snippets"):
+            return annotate_matches(query, results, term_positions=term_positions)
+    
+    def _hit(self, idx: int, score: float, **extra) -> Dict[str, Any]:
+        """Search hit for one chunk; its metadata dict is materialized here."""
+        metadata = self.metadata_store.record(idx)
+        return {
+            'content': self.document_texts[idx],
+            'metadata': metadata,
+            'similarity_score': score,
+            'chunk_row': int(idx),
+            **extra,
+            'source': metadata.get('source', 'Unknown')
+        }
+    
+    def _search_shards(self, query: str, query_vector, k: int, diversity: float,
+                       allowed: Optional[np.ndarray] = None,
+                       min_score: Optional[float] = None,
+                       deadline_ms: Optional[float] = None) -> SearchResults:
+        """
+        Scatter the query to the shard workers and merge their top candidates.
+        
+        Filters and min_score are applied inside each shard before it picks its
+        top candidates; a deadline replaces the index's per-shard timeout.
+        """
+        fetch_k = candidate_count(k, self.reranker, diversity)
+        timeout = deadline_ms / 1000.0 if deadline_ms is not None else None
+        with stage("shard_gather"):
+            merged = self.shards.search(query_vector, fetch_k, with_vectors=diversity > 0,
+                                        timeout=timeout, allowed=allowed, min_score=min_score)
+        record(candidates=len(self.metadata_store))
+        
+        documents = []
+        for score, idx, chunk in merged.hits:
+            documents.append({
+                'content': chunk['content'],
+                'metadata': chunk['metadata'],
+                'similarity_score': score,
+                'chunk_row': idx,
+                'source': chunk['metadata'].get('source', 'Unknown')
+            })
+        
+        results = self._select(
+            query, documents, k,
+            diversity=diversity,
+            vectors=merged.vectors
+        )
+        return SearchResults(results, partial=merged.partial)
+    
     def generate_improved_answer(self, question: str, context_docs: List[Dict[str, Any]]) -> str:
         """Generate an improved answer based on context documents."""
         if not context_docs:
@@ -345,45 +805,82 @@ class ImprovedEnvironmentalLawRAG:
         
         return f"I found relevant information in the documents. Please check the source documents for detailed answers. Sources: {', '.join(sources)}"
     
-    def query(self, question: str, k: int = 5) -> Dict[str, Any]:
-        """Query the RAG system with a question."""
-        if not hasattr(self, 'vectorizer') or not hasattr(self, 'tfidf_matrix'):
+    def enable_answer_cache(self, capacity: int = 256, threshold: float = 0.9):
+        """Put a semantic answer cache in front of query()."""
+        # Resolve the vectorizer per call; create_vectorstore() replaces it in place
+        self.answer_cache = SemanticAnswerCache(
+            lambda questions: self.vectorizer.transform(questions),
+            capacity=capacity,
+            threshold=threshold,
+            exact_terms=lambda question: out_of_vocabulary_terms(self.vectorizer, question)
+        )
+    
+    def suggest(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Autocomplete suggestions for a partly typed query."""
+        if self.suggest_index is None:
+            return []
+        return self.suggest_index.suggest(prefix, limit=limit)
+    
+    def _index_version(self):
+        """Identifies the loaded index; cached answers are dropped when it changes."""
+        return self.corpus_stats.updated_at if self.corpus_stats else None
+    
+    def query(self, question: str, k: int = 5,
+              min_score: Optional[float] = None,
+              deadline_ms: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Query the RAG system with a question.
+        
+        min_score and deadline_ms are passed to search_similar_documents().
+        """
+        if self.shards is None and (not hasattr(self, 'vectorizer') or not hasattr(self, 'tfidf_matrix')):
             logger.error("Vector store not initialized")
             return {"error": "Vector store not initialized"}
         
         try:
+            if self.answer_cache is not None:
+                cached = self.answer_cache.lookup(question, namespace=(k, min_score), index_version=self._index_version())
+                if cached is not None:
+                    return cached
+            
             # Search for relevant documents
-            context_docs = self.search_similar_documents(question, k=k)
+            context_docs = self.search_similar_documents(question, k=k, min_score=min_score, deadline_ms=deadline_ms)
             
             # Generate answer
-            answer = self.generate_improved_answer(question, context_docs)
+            with stage("answer"):
+                answer = self.generate_improved_answer(question, context_docs)
             
-            return {
+            result = {
                 "question": question,
                 "answer": answer,
                 "source_documents": context_docs
             }
             
+            # Answers from an incomplete shard gather or a search cut short by its
+            # deadline are flagged and not cached
+            if getattr(context_docs, 'partial', False):
+                result["partial"] = True
+            if getattr(context_docs, 'truncated', False):
+                result["truncated"] = True
+            if self.answer_cache is not None and not (result.get("partial") or result.get("truncated")):
+                self.answer_cache.store(question, result, namespace=(k, min_score), index_version=self._index_version())
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Error querying RAG system: {e}")
             return {"error": str(e)}
     
     def get_document_statistics(self) -> Dict[str, Any]:
         """Get statistics about the loaded documents"""
-        if not hasattr(self, 'document_metadata'):
+        if self.metadata_store is None:
             return {"error": "Vector store not initialized"}
         
         try:
-            count = len(self.document_metadata)
-            
-            # Get unique sources
-            sources = set(metadata.get("source", "Unknown") for metadata in self.document_metadata)
+            if self.corpus_stats is None:
+                self.corpus_stats = CorpusStatistics.from_records(self.metadata_store.records())
             
-            return {
-                "total_chunks": count,
-                "unique_documents": len(sources),
-                "sources": list(sources)
-            }
+            return self.corpus_stats.to_dict()
             
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
@@ -10,13 +10,24 @@ from pathlib import Path
 import re
 
 # Core libraries
-import chromadb
-from chromadb.config import Settings
 import numpy as np
 
-# PDF processing
-import PyPDF2
-from sentence_transformers import SentenceTransformer
+from lazy_imports import lazy_import
+
+# Vector store (imported on first use)
+chromadb = lazy_import("chromadb")
+
+# PDF processing and embeddings (imported on first use)
+PyPDF2 = lazy_import("PyPDF2")
+SentenceTransformer = lazy_import("sentence_transformers", "SentenceTransformer")
+
+from embedding_server import EmbeddingClient
+from corpus_stats import CorpusStatistics
+from build_checkpoint import BuildCheckpoint
+from reranker import TwoStageReranker
+from diversify import candidate_count, select_results
+from semantic_cache import SemanticAnswerCache
+from slow_query_log import stage, record
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -31,18 +42,26 @@ class SimpleEnvironmentalLawRAG:
     def __init__(self, 
                  pdf_directory: str = "rag",
                  persist_directory: str = "rag/chroma_db",
-                 embedding_model: str = "all-MiniLM-L6-v2"):
+                 embedding_model: str = "all-MiniLM-L6-v2",
+                 embedding_socket: Optional[str] = None):
         """
         Initialize the simple RAG system.
         """
         self.pdf_directory = Path(pdf_directory)
         self.persist_directory = Path(persist_directory)
         self.embedding_model = embedding_model
+        # Optional shared embedding server (see embedding_server.py)
+        self.embedding_socket = embedding_socket or os.environ.get("RAG_EMBEDDING_SOCKET")
         
         # Initialize components
         self.embeddings = None
         self.vectorstore = None
         self.documents = []
+        self.corpus_stats = None
+        # Optional second retrieval stage applied to the top candidates
+        self.reranker: Optional[TwoStageReranker] = None
+        # Optional cache of answers to paraphrased questions
+        self.answer_cache: Optional[SemanticAnswerCache] = None
         
         # Create persist directory if it doesn't exist
         self.persist_directory.mkdir(parents=True, exist_ok=True)
@@ -52,13 +71,18 @@ class SimpleEnvironmentalLawRAG:
     def setup_embeddings(self):
         """Setup embedding model"""
         try:
+            if self.embedding_socket:
+                self.embeddings = EmbeddingClient(self.embedding_socket, expected_model=self.embedding_model)
+                logger.info(f"Using shared embedding server at {self.embedding_socket}")
+                return
+            
             self.embeddings = SentenceTransformer(self.embedding_model)
             logger.info(f"Embeddings model '{self.embedding_model}' loaded successfully")
         except Exception as e:
             logger.error(f"Error loading embeddings model: {e}")
             raise
     
-    def load_pdf_documents(self) -> List[Dict[str, Any]]:
+    def load_pdf_documents(self, checkpoint: Optional[BuildCheckpoint] = None) -> List[Dict[str, Any]]:
         """Load and process all PDF documents from the directory."""
         documents = []
         pdf_files = list(self.pdf_directory.glob("*.pdf"))
@@ -70,6 +94,13 @@ class SimpleEnvironmentalLawRAG:
         logger.info(f"Found {len(pdf_files)} PDF files to process")
         
         for pdf_file in pdf_files:
+            if checkpoint is not None:
+                cached = checkpoint.get_extraction(pdf_file)
+                if cached is not None:
+                    logger.info(f"Reusing checkpointed extraction of {pdf_file.name}")
+                    documents.append(cached)
+                    continue
+            
             try:
                 logger.info(f"Processing {pdf_file.name}")
                 
@@ -95,6 +126,9 @@ class SimpleEnvironmentalLawRAG:
                         'metadata': doc_metadata
                     })
                     
+                    if checkpoint is not None:
+                        checkpoint.record_extraction(pdf_file, documents[-1])
+                    
                     logger.info(f"Successfully processed {pdf_file.name} ({len(pdf_reader.pages)} pages)")
                 else:
                     logger.warning(f"No text extracted from {pdf_file.name}")
@@ -104,11 +138,19 @@ class SimpleEnvironmentalLawRAG:
                 continue
         
         self.documents = documents
+        if checkpoint is not None:
+            checkpoint.mark_complete("extraction")
         logger.info(f"Successfully loaded {len(documents)} documents")
         return documents
     
-    def chunk_documents(self, chunk_size: int = 1000, chunk_overlap: int = 200) -> List[Dict[str, Any]]:
+    def chunk_documents(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                        checkpoint: Optional[BuildCheckpoint] = None) -> List[Dict[str, Any]]:
         """Split documents into chunks for better retrieval."""
+        if checkpoint is not None and checkpoint.is_complete(
+                "chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap, corpus=checkpoint.corpus_version()):
+            logger.info("Reusing checkpointed chunks")
+            return checkpoint.load_json("chunks")
+        
         if not self.documents:
             logger.warning("No documents loaded. Call load_pdf_documents() first.")
             return []
@@ -148,11 +190,18 @@ class SimpleEnvironmentalLawRAG:
                     'metadata': chunk_metadata
                 })
         
+        if checkpoint is not None:
+            checkpoint.save_json("chunks", all_chunks)
+            checkpoint.mark_complete("chunking", chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                      corpus=checkpoint.corpus_version())
+        
         logger.info(f"Created {len(all_chunks)} chunks from {len(self.documents)} documents")
         return all_chunks
     
-    def create_vectorstore(self, chunks: List[Dict[str, Any]]):
-        """Create and populate the ChromaDB vector store."""
+    def create_vectorstore(self, chunks: List[Dict[str, Any]],
+                           checkpoint: Optional[BuildCheckpoint] = None,
+                           batch_size: int = 256):
+        """Create and populate the ChromaDB vector store, one embedded batch at a time."""
         if not chunks:
             logger.warning("No chunks provided for vector store creation")
             return
@@ -161,29 +210,55 @@ class SimpleEnvironmentalLawRAG:
             self.setup_embeddings()
         
         try:
-            # Prepare documents and metadatas for ChromaDB
-            documents = [chunk['content'] for chunk in chunks]
-            metadatas = [chunk['metadata'] for chunk in chunks]
-            ids = [chunk['metadata']['chunk_id'] for chunk in chunks]
-            
-            # Generate embeddings
-            logger.info("Generating embeddings...")
-            embeddings_list = self.embeddings.encode(documents).tolist()
-            
             # Create ChromaDB client
             client = chromadb.PersistentClient(path=str(self.persist_directory))
-            collection = client.create_collection(
+            
+            # Batches embedded from other chunks, or in other sizes, are redone
+            batch_params = dict(batch_size=batch_size, chunking=checkpoint.stage_params("chunking")) if checkpoint is not None else {}
+            completed = checkpoint.completed_batches("vectorization", **batch_params) if checkpoint is not None else set()
+            if not completed:
+                # A fresh build replaces whatever an earlier run left behind
+                try:
+                    client.delete_collection("environmental_laws")
+                except Exception:
+                    pass
+            
+            collection = client.get_or_create_collection(
                 name="environmental_laws",
                 metadata={"description": "Environmental law documents"}
             )
             
-            # Add documents to collection
-            collection.add(
-                documents=documents,
-                metadatas=metadatas,
-                ids=ids,
-                embeddings=embeddings_list
-            )
+            # Generate embeddings and add documents batch by batch
+            logger.info("Generating embeddings...")
+            for batch_index, start in enumerate(range(0, len(chunks), batch_size)):
+                if batch_index in completed:
+                    continue
+                
+                batch = chunks[start:start + batch_size]
+                documents = [chunk['content'] for chunk in batch]
+                
+                # Upsert so a batch interrupted mid-write is simply rewritten
+                collection.upsert(
+                    documents=documents,
+                    metadatas=[chunk['metadata'] for chunk in batch],
+                    ids=[chunk['metadata']['chunk_id'] for chunk in batch],
+                    embeddings=self.embeddings.encode(documents).tolist()
+                )
+                
+                if checkpoint is not None:
+                    checkpoint.mark_batch("vectorization", batch_index, **batch_params)
+                logger.info(f"Embedded chunks {start + 1}-{start + len(batch)} of {len(chunks)}")
+            
+            self.collection = collection
+            if checkpoint is not None:
+                checkpoint.mark_complete("vectorization", chunking=checkpoint.stage_params("chunking"))
+            
+            # Keep corpus statistics alongside the index
+            self.corpus_stats = CorpusStatistics()
+            self.corpus_stats.add_chunks(chunks)
+            self.corpus_stats.save(self.persist_directory)
+            if checkpoint is not None:
+                checkpoint.mark_complete("persistence")
             
             logger.info(f"Vector store created with {len(chunks)} chunks")
             
@@ -191,8 +266,13 @@ class SimpleEnvironmentalLawRAG:
             logger.error(f"Error creating vector store: {e}")
             raise
     
-    def load_existing_vectorstore(self):
-        """Load existing vector store if it exists"""
+    def load_existing_vectorstore(self, read_only: bool = False):
+        """
+        Load existing vector store if it exists.
+        
+        With read_only, missing corpus statistics are rebuilt in memory
+        without being written, as for a published snapshot.
+        """
         try:
             if not self.embeddings:
                 self.setup_embeddings()
@@ -205,6 +285,7 @@ class SimpleEnvironmentalLawRAG:
             if count > 0:
                 logger.info(f"Loaded existing vector store with {count} documents")
                 self.collection = collection
+                self.load_corpus_statistics(count, save=not read_only)
                 return True
             else:
                 logger.info("No existing vector store found")
@@ -214,21 +295,40 @@ class SimpleEnvironmentalLawRAG:
             logger.error(f"Error loading existing vector store: {e}")
             return False
     
-    def search_similar_documents(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
-        """Search for similar documents."""
+    def load_corpus_statistics(self, count: int, save: bool = True):
+        """Load persisted corpus statistics, rebuilding them once if missing or stale."""
+        stats = CorpusStatistics.load(self.persist_directory)
+        if stats is None or stats.total_chunks != count:
+            logger.info("Rebuilding corpus statistics from the collection")
+            results = self.collection.get(include=["metadatas", "documents"])
+            stats = CorpusStatistics.from_records(results["metadatas"], results["documents"])
+            if save:
+                stats.save(self.persist_directory)
+        self.corpus_stats = stats
+    
+    def search_similar_documents(self, query: str, k: int = 5, diversity: float = 0.0) -> List[Dict[str, Any]]:
+        """Search for similar documents; diversity > 0 enables MMR diversification."""
         if not hasattr(self, 'collection'):
             logger.error("Vector store not initialized")
             return []
         
         try:
             # Generate query embedding
-            query_embedding = self.embeddings.encode([query]).tolist()[0]
+            with stage("embed"):
+                query_embedding = self.embeddings.encode([query]).tolist()[0]
             
-            # Search in ChromaDB
-            results = self.collection.query(
-                query_embeddings=[query_embedding],
-                n_results=k
-            )
+            # Search in ChromaDB (more candidates when re-ranking or diversifying)
+            fetch_k = candidate_count(k, self.reranker, diversity)
+            include = ["documents", "metadatas", "distances"]
+            if diversity > 0:
+                include.append("embeddings")
+            with stage("retrieve"):
+                results = self.collection.query(
+                    query_embeddings=[query_embedding],
+                    n_results=fetch_k,
+                    include=include
+                )
+            record(candidates=len(results['documents'][0]))
             
             documents = []
             for i in range(len(results['documents'][0])):
@@ -239,7 +339,12 @@ class SimpleEnvironmentalLawRAG:
                     'source': results['metadatas'][0][i].get('source', 'Unknown')
                 })
             
-            return documents
+            return select_results(
+                query, documents, k,
+                reranker=self.reranker,
+                diversity=diversity,
+                vectors=results['embeddings'][0] if diversity > 0 else None
+            )
             
         except Exception as e:
             logger.error(f"Error searching documents: {e}")
@@ -306,6 +411,14 @@ class SimpleEnvironmentalLawRAG:
         
         return f"I found relevant information in the documents. Please check the source documents for detailed answers. Sources: {', '.join(sources)}"
     
+    def enable_answer_cache(self, capacity: int = 256, threshold: float = 0.9):
+        """Put a semantic answer cache in front of query()."""
+        self.answer_cache = SemanticAnswerCache(self.embeddings.encode, capacity=capacity, threshold=threshold)
+    
+    def _index_version(self):
+        """Identifies the loaded index; cached answers are dropped when it changes."""
+        return self.corpus_stats.updated_at if self.corpus_stats else None
+    
     def query(self, question: str, k: int = 5) -> Dict[str, Any]:
         """Query the RAG system with a question."""
         if not hasattr(self, 'collection'):
@@ -313,18 +426,29 @@ class SimpleEnvironmentalLawRAG:
             return {"error": "Vector store not initialized"}
         
         try:
+            if self.answer_cache is not None:
+                cached = self.answer_cache.lookup(question, namespace=k, index_version=self._index_version())
+                if cached is not None:
+                    return cached
+            
             # Search for relevant documents
             context_docs = self.search_similar_documents(question, k=k)
             
             # Generate answer
-            answer = self.generate_simple_answer(question, context_docs)
+            with stage("answer"):
+                answer = self.generate_simple_answer(question, context_docs)
             
-            return {
+            result = {
                 "question": question,
                 "answer": answer,
                 "source_documents": context_docs
             }
             
+            if self.answer_cache is not None:
+                self.answer_cache.store(question, result, namespace=k, index_version=self._index_version())
+            
+            return result
+            
         except Exception as e:
             logger.error(f"Error querying RAG system: {e}")
             return {"error": str(e)}
@@ -335,17 +459,10 @@ class SimpleEnvironmentalLawRAG:
             return {"error": "Vector store not initialized"}
         
         try:
-            count = self.collection.count()
+            if self.corpus_stats is None:
+                self.load_corpus_statistics(self.collection.count())
             
-            # Get unique sources
-            results = self.collection.get()
-            sources = set(metadata.get("source", "Unknown") for metadata in results["metadatas"])
-            
-            return {
-                "total_chunks": count,
-                "unique_documents": len(sources),
-                "sources": list(sources)
-            }
+            return self.corpus_stats.to_dict()
             
         except Exception as e:
             logger.error(f"Error getting statistics: {e}")
@@ -0,0 +1,234 @@
+"""
+Two-Stage Re-ranking for Environmental Law RAG System
+Re-scores the top-N candidates of any retrieval engine with more expensive signals
+"""
+
+import os
+import re
+import logging
+from typing import List, Dict, Any, Optional, Tuple
+
+import numpy as np
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+# Function words that carry no signal for proximity or title matching
+_QUERY_STOP_WORDS = frozenset([
+    "a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "is", "are",
+    "was", "be", "by", "with", "what", "which", "who", "how", "when", "where",
+    "does", "do", "under", "about", "as", "at", "from", "this", "that", "it"
+])
+
+# Lines that look like statute headings: "21. Restrictions on ...", "Section 15",
+# "CHAPTER IV", or short all-caps titles
+_HEADING_PATTERN = re.compile(
+    r"^\s*(?:\d+[A-Z]?\.\s+\S|section\s+\d+|chapter\s+[ivxlc\d]+|[A-Z][A-Z ,\-()]{8,}$)",
+    re.IGNORECASE | re.MULTILINE
+)
+
+
+def query_terms(query: str) -> List[str]:
+    """Distinct lower-cased content words of a query, in order."""
+    seen = []
+    for term in _WORD_PATTERN.findall(query.lower()):
+        if term not in _QUERY_STOP_WORDS and term not in seen:
+            seen.append(term)
+    return seen
+
+
+def _normalize(scores: np.ndarray) -> np.ndarray:
+    """Min-max scale scores to [0, 1] so signals can be combined."""
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.size == 0:
+        return scores
+    low, high = scores.min(), scores.max()
+    if high - low < 1e-12:
+        return np.zeros_like(scores)
+    return (scores - low) / (high - low)
+
+
+class TermProximityReranker:
+    """Rewards candidates in which the query terms occur close together."""
+
+    name = "proximity"
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> np.ndarray:
+        terms = query_terms(query)
+        scores = np.zeros(len(candidates))
+        if not terms:
+            return scores
+
+        term_ids = {term: i for i, term in enumerate(terms)}
+        for c, doc in enumerate(candidates):
+            # (position, term id) for every occurrence of a query term
+            hits = [
+                (pos, term_ids[word])
+                for pos, word in enumerate(_WORD_PATTERN.findall(doc['content'].lower()))
+                if word in term_ids
+            ]
+            matched = len(set(term_id for _, term_id in hits))
+            if matched == 0:
+                continue
+
+            # Smallest token window containing every matched term
+            counts: Dict[int, int] = {}
+            covered = 0
+            best_span = None
+            left = 0
+            for right in range(len(hits)):
+                term_id = hits[right][1]
+                counts[term_id] = counts.get(term_id, 0) + 1
+                if counts[term_id] == 1:
+                    covered += 1
+                while covered == matched:
+                    span = hits[right][0] - hits[left][0] + 1
+                    if best_span is None or span < best_span:
+                        best_span = span
+                    left_id = hits[left][1]
+                    counts[left_id] -= 1
+                    if counts[left_id] == 0:
+                        covered -= 1
+                    left += 1
+
+            coverage = matched / len(terms)
+            scores[c] = coverage * (matched / best_span)
+        return scores
+
+
+class SectionTitleReranker:
+    """Rewards candidates whose section headings mention the query terms."""
+
+    name = "title"
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> np.ndarray:
+        terms = set(query_terms(query))
+        scores = np.zeros(len(candidates))
+        if not terms:
+            return scores
+
+        for c, doc in enumerate(candidates):
+            content = doc['content']
+            best = 0.0
+            for match in _HEADING_PATTERN.finditer(content):
+                line_end = content.find("\n", match.start())
+                heading = content[match.start():line_end if line_end != -1 else len(content)]
+                overlap = len(terms.intersection(_WORD_PATTERN.findall(heading.lower())))
+                best = max(best, overlap / len(terms))
+            scores[c] = best
+        return scores
+
+
+class EmbeddingReranker:
+    """Cosine similarity between query and candidate embeddings."""
+
+    name = "embedding"
+
+    def __init__(self, encoder):
+        """
+        Args:
+            encoder: SentenceTransformer-style object with encode(), or a
+                LangChain embeddings object with embed_documents()
+        """
+        self.encoder = encoder
+
+    def _encode(self, texts: List[str]) -> np.ndarray:
+        if hasattr(self.encoder, "encode"):
+            vectors = self.encoder.encode(texts)
+        else:
+            vectors = self.encoder.embed_documents(texts)
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.maximum(norms, 1e-12)
+
+    def score(self, query: str, candidates: List[Dict[str, Any]]) -> np.ndarray:
+        if not candidates:
+            return np.zeros(0)
+        vectors = self._encode([query] + [doc['content'] for doc in candidates])
+        return vectors[1:] @ vectors[0]
+
+
+class TwoStageReranker:
+    """
+    Second retrieval stage.
+
+    The engine retrieves `candidates` documents with its own fast similarity,
+    then only those are re-scored here. The final score is a weighted sum of
+    the normalized first-stage score and every re-ranker's normalized score.
+    """
+
+    def __init__(self,
+                 rerankers: List[Tuple[Any, float]],
+                 candidates: int = 100,
+                 first_stage_weight: float = 1.0):
+        """
+        Args:
+            rerankers: (reranker, weight) pairs
+            candidates: Number of first-stage results to re-rank
+            first_stage_weight: Weight of the engine's own similarity score
+        """
+        self.rerankers = rerankers
+        self.candidates = candidates
+        self.first_stage_weight = first_stage_weight
+
+    def rank(self,
+             query: str,
+             documents: List[Dict[str, Any]],
+             higher_is_better: bool = True) -> np.ndarray:
+        """
+        Combined score of each first-stage result, in input order.
+
+        Args:
+            query: The search query
+            documents: First-stage results carrying 'content' and 'similarity_score'
+            higher_is_better: False when the engine's score is a distance
+        """
+        first_stage = np.array([float(doc.get('similarity_score', 0.0)) for doc in documents])
+        if not higher_is_better:
+            first_stage = -first_stage
+        combined = self.first_stage_weight * _normalize(first_stage)
+        for reranker, weight in self.rerankers:
+            try:
+                combined += weight * _normalize(reranker.score(query, documents))
+            except Exception as e:
+                logger.warning(f"Re-ranker '{reranker.name}' failed, skipping: {e}")
+        return combined
+
+
+def reranker_from_env(encoder=None) -> Optional[TwoStageReranker]:
+    """
+    Build a re-ranker from environment settings, or None if disabled.
+
+    RAG_RERANKERS is a comma-separated list of re-rankers with optional
+    weights, e.g. "proximity:1.0,title:0.5,embedding"; RAG_RERANK_CANDIDATES
+    sets the first-stage candidate count (default 100).
+    """
+    spec = os.environ.get("RAG_RERANKERS", "").strip()
+    if not spec:
+        return None
+
+    rerankers = []
+    for item in spec.split(","):
+        name, _, weight = item.strip().partition(":")
+        weight = float(weight) if weight else 1.0
+        if name == "proximity":
+            rerankers.append((TermProximityReranker(), weight))
+        elif name == "title":
+            rerankers.append((SectionTitleReranker(), weight))
+        elif name == "embedding":
+            if encoder is None:
+                logger.warning("Embedding re-ranker requested but no embedding model is loaded; skipping")
+                continue
+            rerankers.append((EmbeddingReranker(encoder), weight))
+        elif name:
+            logger.warning(f"Unknown re-ranker '{name}', skipping")
+
+    if not rerankers:
+        return None
+
+    candidates = int(os.environ.get("RAG_RERANK_CANDIDATES", "100"))
+    logger.info(f"Re-ranking top {candidates} candidates with: {', '.join(r.name for r, _ in rerankers)}")
+    return TwoStageReranker(rerankers, candidates=candidates)
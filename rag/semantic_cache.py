@@ -0,0 +1,233 @@
+"""
+Semantic Answer Cache for Environmental Law RAG System
+Serves stored answers for paraphrases of previously answered questions
+"""
+
+import os
+import re
+import logging
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Callable, Hashable
+
+import numpy as np
+
+from lazy_imports import lazy_import
+from slow_query_log import stage, record
+
+sparse = lazy_import("scipy.sparse")
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Section, rule and year numbers: "37", "15A", "1986"
+_NUMBER = re.compile(r"\d+[a-z]*")
+
+
+def numeric_terms(question: str) -> frozenset:
+    """Numbers in a question; questions about different sections must not share answers."""
+    return frozenset(_NUMBER.findall(question.lower()))
+
+
+def out_of_vocabulary_terms(vectorizer, question: str) -> frozenset:
+    """
+    Terms of a question that a fitted TF-IDF vectorizer drops.
+
+    transform() ignores words outside the vocabulary, so questions that
+    differ only in such words get identical vectors. Only single words
+    count; most n-grams of any question are unseen. Hashing vectorizers
+    keep every term and need no check.
+    """
+    vocabulary = getattr(vectorizer, 'vocabulary_', None)
+    if not vocabulary:
+        return frozenset()
+    analyzer = vectorizer.build_analyzer()
+    return frozenset(term for term in analyzer(question) if " " not in term and term not in vocabulary)
+
+
+class SemanticAnswerCache:
+    """
+    Small in-memory similarity index of answered questions.
+
+    Dense question vectors live in one preallocated float32 matrix so a
+    lookup is a single matrix-vector product. Sparse TF-IDF vectors stay
+    sparse (a hashed vectorizer has 2**20 columns) and are stacked into a
+    CSR matrix that is rebuilt after a store. Entries are evicted least recently used
+    first, and the whole cache is dropped when the index version changes.
+    A hit also needs the same numbers in both questions, and the same
+    exact_terms if given, since vectors barely move when only a section
+    number differs.
+    """
+
+    def __init__(self,
+                 encode: Callable[[List[str]], Any],
+                 capacity: int = 256,
+                 threshold: float = 0.9,
+                 exact_terms: Optional[Callable[[str], Hashable]] = None):
+        """
+        Args:
+            encode: Maps a list of questions to vectors (dense array or sparse matrix)
+            capacity: Maximum number of cached answers
+            threshold: Minimum cosine similarity for a cache hit
+            exact_terms: Terms that must match exactly, e.g. words the encoder ignores
+        """
+        self.encode = encode
+        self.exact_terms = exact_terms
+        self.capacity = capacity
+        self.threshold = threshold
+        self.index_version: Optional[Hashable] = None
+
+        self._lock = threading.Lock()
+        self._vectors: Optional[np.ndarray] = None
+        self._rows: Dict[int, Any] = {}
+        self._stacked = None
+        self._active = np.zeros(capacity, dtype=bool)
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def _embed(self, question: str):
+        """Unit-length question vector: a 1-D array, or a 1-row CSR matrix for sparse encoders."""
+        vector = self.encode([question])
+        if hasattr(vector, "tocsr"):
+            vector = vector.tocsr().astype(np.float32)
+            norm = np.sqrt(vector.multiply(vector).sum())
+            return vector / norm if norm > 0 else vector
+        vector = np.asarray(vector, dtype=np.float32).ravel()
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    @staticmethod
+    def _is_zero(vector) -> bool:
+        return vector.nnz == 0 if hasattr(vector, "nnz") else not vector.any()
+
+    def _similarities(self, vector) -> Optional[np.ndarray]:
+        """Cosine similarity of the vector to every slot; None if nothing comparable is stored."""
+        if hasattr(vector, "nnz"):
+            if not self._rows:
+                return None
+            if self._stacked is None:
+                empty = sparse.csr_matrix((1, vector.shape[1]), dtype=np.float32)
+                self._stacked = sparse.vstack([self._rows.get(slot, empty) for slot in range(self.capacity)],
+                                              format="csr")
+            return (self._stacked @ vector.T).toarray().ravel()
+        if self._vectors is None:
+            return None
+        return self._vectors @ vector
+
+    def _key(self, question: str, namespace: Hashable) -> Hashable:
+        exact = self.exact_terms(question) if self.exact_terms is not None else None
+        return (namespace, numeric_terms(question), exact)
+
+    def _check_version(self, index_version: Optional[Hashable]):
+        """Drop every entry once the index they were answered from is replaced."""
+        if index_version != self.index_version:
+            if self._entries:
+                logger.info("Index version changed, clearing semantic answer cache")
+            self._entries.clear()
+            self._active[:] = False
+            # A rebuilt index may come with a vectorizer of another width
+            self._vectors = None
+            self._rows.clear()
+            self._stacked = None
+            self.index_version = index_version
+
+    def lookup(self,
+               question: str,
+               namespace: Hashable = None,
+               index_version: Optional[Hashable] = None) -> Optional[Dict[str, Any]]:
+        """
+        Return the cached result of the most similar earlier question, if close enough.
+
+        Args:
+            question: Incoming question
+            namespace: Extra key that must match exactly, e.g. the requested k
+            index_version: Version of the index the caller is answering from
+        """
+        with stage("cache_lookup"):
+            result = self._lookup(question, namespace, index_version)
+        record(cache="hit" if result is not None else "miss")
+        return result
+
+    def _lookup(self, question: str, namespace: Hashable, index_version: Optional[Hashable]) -> Optional[Dict[str, Any]]:
+        vector = self._embed(question)
+        key = self._key(question, namespace)
+        with self._lock:
+            self._check_version(index_version)
+            similarities = self._similarities(vector) if self._active.any() and not self._is_zero(vector) else None
+            if similarities is None:
+                self.misses += 1
+                return None
+
+            similarities = np.where(self._active, similarities, -1.0)
+            for slot in np.argsort(-similarities):
+                if similarities[slot] < self.threshold:
+                    break
+                entry = self._entries[int(slot)]
+                if entry["key"] != key:
+                    continue
+
+                self._entries.move_to_end(int(slot))
+                self.hits += 1
+                result = dict(entry["result"])
+                result["cache"] = {
+                    "hit": True,
+                    "similarity": float(similarities[slot]),
+                    "matched_question": entry["question"]
+                }
+                return result
+
+            self.misses += 1
+            return None
+
+    def store(self,
+              question: str,
+              result: Dict[str, Any],
+              namespace: Hashable = None,
+              index_version: Optional[Hashable] = None):
+        """Cache the result for a question, evicting the least recently used entry if full."""
+        vector = self._embed(question)
+        if self._is_zero(vector):
+            return
+
+        with self._lock:
+            self._check_version(index_version)
+            if len(self._entries) >= self.capacity:
+                slot, _ = self._entries.popitem(last=False)
+            else:
+                slot = int(np.flatnonzero(~self._active)[0])
+
+            if hasattr(vector, "nnz"):
+                self._rows[slot] = vector
+                self._stacked = None
+            else:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.capacity, vector.shape[0]), dtype=np.float32)
+                self._vectors[slot] = vector
+            self._active[slot] = True
+            self._entries[slot] = {"question": question, "key": self._key(question, namespace), "result": result}
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "capacity": self.capacity,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+
+def cache_settings_from_env() -> Optional[Dict[str, Any]]:
+    """
+    Cache settings for the web interfaces.
+
+    RAG_ANSWER_CACHE_SIZE sets the capacity (0 disables the cache) and
+    RAG_ANSWER_CACHE_THRESHOLD the similarity needed for a hit.
+    """
+    capacity = int(os.environ.get("RAG_ANSWER_CACHE_SIZE", "256"))
+    if capacity <= 0:
+        return None
+    return {
+        "capacity": capacity,
+        "threshold": float(os.environ.get("RAG_ANSWER_CACHE_THRESHOLD", "0.9"))
+    }
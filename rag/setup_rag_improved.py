@@ -11,6 +11,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from rag_improved import ImprovedEnvironmentalLawRAG
+from build_checkpoint import BuildCheckpoint
 
 def setup_rag_system():
     """Setup the RAG system with all PDF documents"""
@@ -26,32 +27,74 @@ def setup_rag_system():
     # Initialize RAG system
     rag = ImprovedEnvironmentalLawRAG(pdf_directory=".")
     
+    # Resume an interrupted build from its last checkpoint
+    checkpoint = BuildCheckpoint(rag.persist_directory)
+    resuming = checkpoint.in_progress()
+    
+    # Extract PDFs and fit TF-IDF on every core unless told otherwise
+    workers = int(os.environ.get('RAG_BUILD_WORKERS', os.cpu_count() or 1))
+    
+    # Stream the corpus through a bounded-memory build when a budget is set
+    memory_budget_mb = int(os.environ.get('RAG_BUILD_MEMORY_MB', '0'))
+    
     # Check if vector store already exists
-    if not rag.load_existing_vectorstore():
-        print("No existing vector store found. Creating new one...")
+    has_index = not resuming and rag.load_existing_vectorstore()
+    if not has_index and memory_budget_mb > 0:
+        print(f"No existing vector store found. Building out of core within {memory_budget_mb} MB...")
+        print("   Streaming PDFs through a hashing vectorizer into an on-disk index...")
+        if not rag.create_vectorstore_out_of_core(rag.iter_chunks(chunk_size=1000), memory_budget_mb=memory_budget_mb):
+            print("❌ Out-of-core build failed. See the log for details.")
+            return None
+        print("✅ Vector store created successfully!")
+        # Loading reads every chunk text, which the budget does not cover; stop here
+        print("\n🚀 Query it with 'python rag_improved.py' or 'python bulk_query.py --engine improved',")
+        print("   or rerun this script to load it, run the test queries and add LSA or shards.")
+        return None
+    elif not has_index:
+        if resuming:
+            print("♻️ Found an interrupted build, resuming from the last checkpoint...")
+        else:
+            print("No existing vector store found. Creating new one...")
         
         # Load PDF documents
-        documents = rag.load_pdf_documents()
+        documents = rag.load_pdf_documents(checkpoint=checkpoint, workers=workers)
         
         if not documents:
             print("❌ No PDF documents found in the current directory.")
             print("Please ensure your PDF files are in the current folder.")
             return None
         
-        print(f"✅ Loaded {len(documents)} documents")
+        print(f"✅ Loaded {len(documents)} documents ({workers} worker processes)")
         
         print("\n🔪 Chunking documents...")
-        chunks = rag.chunk_documents(chunk_size=1000, chunk_overlap=200)
+        chunks = rag.chunk_documents(chunk_size=1000, chunk_overlap=200, checkpoint=checkpoint)
         print(f"✅ Created {len(chunks)} chunks")
         
         print("\n🗄️ Creating vector store...")
         print("   Using TF-IDF for fast and reliable text similarity...")
         print("   Storing full document content for better answers...")
-        rag.create_vectorstore(chunks)
+        rag.create_vectorstore(chunks, checkpoint=checkpoint, workers=workers)
+        checkpoint.clear()
         print("✅ Vector store created successfully!")
     else:
         print("✅ Existing vector store found!")
     
+    # Optionally project the TF-IDF matrix onto a dense LSA basis
+    lsa_dimensions = int(os.environ.get('RAG_LSA_DIMENSIONS', '0'))
+    if lsa_dimensions > 0:
+        print(f"\n📐 Building a {lsa_dimensions}-dimensional LSA index...")
+        if rag.build_lsa_index(lsa_dimensions):
+            print("✅ LSA index written; searches now score the dense projection")
+        else:
+            print("❌ LSA index could not be built. See the log for details.")
+    
+    # Optionally split the index into shards served by worker processes
+    num_shards = int(os.environ.get('RAG_SHARDS', '0'))
+    if num_shards > 0:
+        print(f"\n🧩 Splitting the index into {num_shards} shards...")
+        rag.build_shards(num_shards)
+        print("✅ Shards written; serve them with load_sharded_vectorstore()")
+    
     # Get final statistics
     stats = rag.get_document_statistics()
     print(f"\n📊 Final statistics:")
@@ -11,6 +11,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from rag_simple import SimpleEnvironmentalLawRAG
+from build_checkpoint import BuildCheckpoint
 
 def setup_rag_system():
     """Setup the RAG system with all PDF documents"""
@@ -24,8 +25,12 @@ def setup_rag_system():
     # Initialize RAG system
     rag = SimpleEnvironmentalLawRAG()
     
-    # Check if vector store already exists
-    if rag.load_existing_vectorstore():
+    # Resume an interrupted build from its last checkpoint, otherwise
+    # check if vector store already exists
+    checkpoint = BuildCheckpoint(rag.persist_directory)
+    if checkpoint.in_progress():
+        print("♻️ Found an interrupted build, resuming from the last checkpoint...")
+    elif rag.load_existing_vectorstore():
         print("✅ Existing vector store found!")
         stats = rag.get_document_statistics()
         print(f"📊 Current statistics:")
@@ -39,7 +44,7 @@ def setup_rag_system():
             return rag
     
     print("\n📚 Loading PDF documents...")
-    documents = rag.load_pdf_documents()
+    documents = rag.load_pdf_documents(checkpoint=checkpoint)
     
     if not documents:
         print("❌ No PDF documents found in the 'rag' directory.")
@@ -49,12 +54,13 @@ def setup_rag_system():
     print(f"✅ Loaded {len(documents)} documents")
     
     print("\n🔪 Chunking documents...")
-    chunks = rag.chunk_documents(chunk_size=1000, chunk_overlap=200)
+    chunks = rag.chunk_documents(chunk_size=1000, chunk_overlap=200, checkpoint=checkpoint)
     print(f"✅ Created {len(chunks)} chunks")
     
     print("\n🗄️ Creating vector store...")
     print("   This may take a few minutes for large documents...")
-    rag.create_vectorstore(chunks)
+    rag.create_vectorstore(chunks, checkpoint=checkpoint)
+    checkpoint.clear()
     print("✅ Vector store created successfully!")
     
     # Get final statistics
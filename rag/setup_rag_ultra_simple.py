@@ -11,6 +11,7 @@ from pathlib import Path
 sys.path.append(str(Path(__file__).parent))
 
 from rag_ultra_simple import UltraSimpleEnvironmentalLawRAG
+from build_checkpoint import BuildCheckpoint
 
 def setup_rag_system():
     """Setup the RAG system with all PDF documents"""
@@ -25,27 +26,38 @@ def setup_rag_system():
     # Initialize RAG system
     rag = UltraSimpleEnvironmentalLawRAG(pdf_directory=".")
     
+    # Resume an interrupted build from its last checkpoint
+    checkpoint = BuildCheckpoint(rag.persist_directory)
+    resuming = checkpoint.in_progress()
+    
+    # Extract PDFs and fit TF-IDF on every core unless told otherwise
+    workers = int(os.environ.get('RAG_BUILD_WORKERS', os.cpu_count() or 1))
+    
     # Check if vector store already exists
-    if not rag.load_existing_vectorstore():
-        print("No existing vector store found. Creating new one...")
+    if resuming or not rag.load_existing_vectorstore():
+        if resuming:
+            print("♻️ Found an interrupted build, resuming from the last checkpoint...")
+        else:
+            print("No existing vector store found. Creating new one...")
         
         # Load PDF documents
-        documents = rag.load_pdf_documents()
+        documents = rag.load_pdf_documents(checkpoint=checkpoint, workers=workers)
         
         if not documents:
             print("❌ No PDF documents found in the 'rag' directory.")
             print("Please ensure your PDF files are in the 'rag' folder.")
             return None
         
-        print(f"✅ Loaded {len(documents)} documents")
+        print(f"✅ Loaded {len(documents)} documents ({workers} worker processes)")
         
         print("\n🔪 Chunking documents...")
-        chunks = rag.chunk_documents(chunk_size=1000, chunk_overlap=200)
+        chunks = rag.chunk_documents(chunk_size=1000, chunk_overlap=200, checkpoint=checkpoint)
         print(f"✅ Created {len(chunks)} chunks")
         
         print("\n🗄️ Creating vector store...")
         print("   Using TF-IDF for fast and reliable text similarity...")
-        rag.create_vectorstore(chunks)
+        rag.create_vectorstore(chunks, checkpoint=checkpoint, workers=workers)
+        checkpoint.clear()
         print("✅ Vector store created successfully!")
     else:
         print("✅ Existing vector store found!")
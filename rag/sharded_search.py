@@ -0,0 +1,395 @@
+"""
+Sharded Search for Environmental Law RAG System
+Splits the TF-IDF index into shards queried in parallel worker processes
+"""
+
+import sys
+import json
+import time
+import heapq
+import queue
+import shutil
+import logging
+import argparse
+import itertools
+import threading
+import multiprocessing
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from pathlib import Path
+
+import numpy as np
+
+from lazy_imports import lazy_import
+
+sparse = lazy_import("scipy.sparse")
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SHARDS_DIRNAME = "shards"
+MANIFEST_FILENAME = "manifest.json"
+
+
+def shards_directory(persist_directory: Path) -> Path:
+    return Path(persist_directory) / SHARDS_DIRNAME
+
+
+def load_manifest(persist_directory: Path) -> Optional[Dict[str, Any]]:
+    """Shard layout written by write_shards(), or None if the index is not sharded."""
+    try:
+        with open(shards_directory(persist_directory) / MANIFEST_FILENAME, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def write_shards(persist_directory: Path,
+                 tfidf_matrix,
+                 chunks: List[Dict[str, Any]],
+                 num_shards: int) -> Dict[str, Any]:
+    """
+    Split a fitted TF-IDF index into contiguous shards.
+
+    All shards share the engine's vectorizer, so the vocabulary and IDF
+    weights are global and scores from different shards are comparable.
+    Each shard holds its rows as a sparse matrix plus the matching chunks.
+    The new layout is written next to the old one and swapped in by rename.
+
+    Args:
+        persist_directory: Index directory; shards go to <persist_directory>/shards
+        tfidf_matrix: Row-normalized TF-IDF matrix (dense or sparse)
+        chunks: Chunk records ('content' and 'metadata'), one per matrix row
+        num_shards: Number of shards to create
+
+    Returns:
+        The shard manifest
+    """
+    matrix = sparse.csr_matrix(tfidf_matrix, dtype=np.float32)
+    if matrix.shape[0] != len(chunks):
+        raise ValueError(f"Matrix has {matrix.shape[0]} rows but there are {len(chunks)} chunks")
+    num_shards = max(1, min(num_shards, len(chunks)))
+
+    target = shards_directory(persist_directory)
+    staging = target.with_name(SHARDS_DIRNAME + ".tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    manifest = {
+        "num_shards": num_shards,
+        "total_chunks": len(chunks),
+        "created_at": datetime.now().isoformat(),
+        "shards": []
+    }
+    for number, rows in enumerate(np.array_split(np.arange(len(chunks)), num_shards)):
+        name = f"shard-{number:03d}"
+        shard_path = staging / name
+        shard_path.mkdir()
+        sparse.save_npz(shard_path / "tfidf_matrix.npz", matrix[rows[0]:rows[-1] + 1])
+        with open(shard_path / "chunks.json", 'w') as f:
+            json.dump(chunks[rows[0]:rows[-1] + 1], f)
+        manifest["shards"].append({"name": name, "offset": int(rows[0]), "count": int(len(rows))})
+
+    with open(staging / MANIFEST_FILENAME, 'w') as f:
+        json.dump(manifest, f, indent=2)
+
+    shutil.rmtree(target, ignore_errors=True)
+    staging.rename(target)
+    logger.info(f"Wrote {num_shards} shards covering {len(chunks)} chunks")
+    return manifest
+
+
+def _shard_worker(shard_path: str, offset: int, connection):
+    """Worker process: answers top-k requests against one shard until told to stop."""
+    shard_path = Path(shard_path)
+    matrix = sparse.load_npz(shard_path / "tfidf_matrix.npz").tocsr()
+    with open(shard_path / "chunks.json", 'r') as f:
+        chunks = json.load(f)
+    connection.send(("ready", matrix.shape[0]))
+
+    while True:
+        try:
+            message = connection.recv()
+        except EOFError:
+            break
+        if message is None:
+            break
+
+        request_id, query_vector, k, with_vectors, allowed, min_score = message
+        try:
+            # Rows and query are L2-normalized, so the dot product is the cosine similarity
+            scores = np.asarray((matrix @ query_vector.T).todense()).ravel()
+            # Filters and the score cutoff apply before the shard picks its top k
+            if allowed is not None:
+                allowed = np.unpackbits(allowed, count=len(scores)).astype(bool)
+                scores = np.where(allowed, scores, -np.inf)
+            if min_score is not None:
+                scores[scores < min_score] = -np.inf
+            k = min(k, len(scores))
+            top = np.argpartition(-scores, k - 1)[:k] if k > 0 else np.array([], dtype=int)
+            top = top[np.argsort(-scores[top], kind="stable")]
+            top = top[np.isfinite(scores[top])]
+
+            hits = [(float(scores[i]), offset + int(i), chunks[i]) for i in top]
+            vectors = matrix[top] if with_vectors else None
+            connection.send((request_id, hits, vectors))
+        except Exception as e:
+            connection.send((request_id, e, None))
+
+
+class SearchResults(list):
+    """
+    Result list of an engine search, flagged when it may be incomplete:
+    partial when some shards were missing, truncated when an anytime search
+    ran out of its time budget before scoring every block.
+    """
+
+    def __init__(self, documents=(), partial: bool = False, truncated: bool = False):
+        super().__init__(documents)
+        self.partial = partial
+        self.truncated = truncated
+
+
+class ShardSearchResult:
+    """Merged top-k of a scatter-gather search."""
+
+    def __init__(self, hits: List[Tuple[float, int, Dict[str, Any]]], vectors, shards_answered: int, shards_total: int):
+        self.hits = hits
+        self.vectors = vectors
+        self.shards_answered = shards_answered
+        self.shards_total = shards_total
+
+    @property
+    def partial(self) -> bool:
+        """True when some shards timed out or failed and their results are missing."""
+        return self.shards_answered < self.shards_total
+
+
+class ShardedIndex:
+    """
+    Scatter-gather search over index shards, one worker process per shard.
+
+    The query is vectorized once by the caller and sent to every worker.
+    Each worker returns its own top-k, already sorted, and the lists are
+    combined with a k-way heap merge. Shards that do not answer before the
+    timeout are left out and the result is flagged as partial, so a slow or
+    dead shard bounds latency instead of blocking the query.
+    """
+
+    def __init__(self, persist_directory: Path, timeout: float = 0.5):
+        """
+        Args:
+            persist_directory: Index directory containing the shards/ layout
+            timeout: Seconds to wait for all shards before returning partial results
+        """
+        self.directory = shards_directory(persist_directory)
+        self.manifest = load_manifest(persist_directory)
+        if self.manifest is None:
+            raise FileNotFoundError(f"No shard manifest in {self.directory}")
+        self.timeout = timeout
+
+        self._request_ids = itertools.count()
+        self._pending: Dict[int, queue.Queue] = {}
+        self._pending_lock = threading.Lock()
+        self._workers: List[Dict[str, Any]] = []
+
+    @property
+    def num_shards(self) -> int:
+        return self.manifest["num_shards"]
+
+    def start(self, startup_timeout: float = 120.0):
+        """Spawn the shard workers and wait until each has loaded its shard."""
+        context = multiprocessing.get_context("spawn")
+        for shard in self.manifest["shards"]:
+            parent_end, child_end = context.Pipe()
+            process = context.Process(
+                target=_shard_worker,
+                args=(str(self.directory / shard["name"]), shard["offset"], child_end),
+                name=f"rag-{shard['name']}",
+                daemon=True
+            )
+            process.start()
+            child_end.close()
+            self._workers.append({
+                "name": shard["name"],
+                "offset": shard["offset"],
+                "count": shard["count"],
+                "process": process,
+                "connection": parent_end,
+                "send_lock": threading.Lock(),
+                "alive": False
+            })
+
+        for worker in self._workers:
+            try:
+                if not worker["connection"].poll(startup_timeout):
+                    logger.error(f"Shard {worker['name']} did not start within {startup_timeout}s")
+                    continue
+                status, count = worker["connection"].recv()
+            except (EOFError, OSError):
+                logger.error(f"Shard {worker['name']} failed to load")
+                continue
+            worker["alive"] = status == "ready"
+            threading.Thread(target=self._read_replies, args=(worker,),
+                             name=f"{worker['name']}-reader", daemon=True).start()
+
+        alive = sum(worker["alive"] for worker in self._workers)
+        logger.info(f"Started {alive} of {len(self._workers)} shard workers")
+        return alive > 0
+
+    def _read_replies(self, worker: Dict[str, Any]):
+        """Route replies from one worker to the request waiting for them."""
+        while True:
+            try:
+                request_id, hits, vectors = worker["connection"].recv()
+            except (EOFError, OSError):
+                if worker["alive"]:
+                    logger.error(f"Shard {worker['name']} stopped")
+                worker["alive"] = False
+                return
+            with self._pending_lock:
+                replies = self._pending.get(request_id)
+            # Replies to requests that already gave up on this shard are dropped
+            if replies is not None:
+                replies.put((worker["name"], hits, vectors))
+
+    def search(self, query_vector, k: int, with_vectors: bool = False,
+               timeout: Optional[float] = None,
+               allowed: Optional[np.ndarray] = None,
+               min_score: Optional[float] = None) -> ShardSearchResult:
+        """
+        Top-k chunks across all shards.
+
+        Args:
+            query_vector: Query transformed by the shared vectorizer (1 x vocabulary)
+            k: Number of results to return
+            with_vectors: Also return the TF-IDF rows of the results (for MMR)
+            timeout: Overrides the index timeout for this query
+            allowed: Boolean mask over all chunks; each shard only ranks its allowed rows
+            min_score: Each shard drops rows scoring below this before picking its top k
+        """
+        timeout = self.timeout if timeout is None else timeout
+        query_vector = sparse.csr_matrix(query_vector, dtype=np.float32)
+        request_id = next(self._request_ids)
+        replies: queue.Queue = queue.Queue()
+        with self._pending_lock:
+            self._pending[request_id] = replies
+
+        try:
+            # Scatter
+            expected = 0
+            for worker in self._workers:
+                if not worker["alive"]:
+                    continue
+                # Each shard gets its slice of the mask, bit-packed to keep the message small
+                shard_allowed = None
+                if allowed is not None:
+                    shard_allowed = np.packbits(allowed[worker["offset"]:worker["offset"] + worker["count"]])
+                try:
+                    with worker["send_lock"]:
+                        worker["connection"].send(
+                            (request_id, query_vector, k, with_vectors, shard_allowed, min_score))
+                    expected += 1
+                except (OSError, ValueError) as e:
+                    logger.error(f"Could not reach shard {worker['name']}: {e}")
+                    worker["alive"] = False
+
+            # Gather until every shard answered or the deadline passed
+            deadline = time.monotonic() + timeout
+            shard_hits = []
+            shard_vectors = []
+            while len(shard_hits) < expected:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    name, hits, vectors = replies.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if isinstance(hits, Exception):
+                    logger.error(f"Shard {name} failed: {hits}")
+                    expected -= 1
+                    continue
+                shard_hits.append(hits)
+                shard_vectors.append(vectors)
+        finally:
+            with self._pending_lock:
+                self._pending.pop(request_id, None)
+
+        answered = len(shard_hits)
+        if answered < self.num_shards:
+            logger.warning(f"Partial results: {answered} of {self.num_shards} shards answered")
+
+        # k-way merge of the per-shard lists, each already sorted by score
+        if with_vectors:
+            tagged = [
+                [(score, index, chunk, vectors[row]) for row, (score, index, chunk) in enumerate(hits)]
+                for hits, vectors in zip(shard_hits, shard_vectors)
+            ]
+            merged = list(itertools.islice(heapq.merge(*tagged, key=lambda hit: -hit[0]), k))
+            vectors = sparse.vstack([hit[3] for hit in merged]) if merged else None
+            merged = [hit[:3] for hit in merged]
+        else:
+            merged = list(itertools.islice(heapq.merge(*shard_hits, key=lambda hit: -hit[0]), k))
+            vectors = None
+
+        return ShardSearchResult(merged, vectors, answered, self.num_shards)
+
+    def close(self):
+        """Stop the shard workers."""
+        for worker in self._workers:
+            try:
+                with worker["send_lock"]:
+                    worker["connection"].send(None)
+            except (OSError, ValueError):
+                pass
+            worker["alive"] = False
+        for worker in self._workers:
+            worker["process"].join(timeout=5)
+            if worker["process"].is_alive():
+                worker["process"].terminate()
+            worker["connection"].close()
+        self._workers = []
+
+
+def main():
+    """Build shards for an existing improved index, or query a sharded index"""
+    from rag_improved import ImprovedEnvironmentalLawRAG
+
+    parser = argparse.ArgumentParser(description="Sharded TF-IDF search")
+    parser.add_argument("command", choices=["build", "query"])
+    parser.add_argument("text", nargs="?", help="Query text for the query command")
+    parser.add_argument("--persist-directory", default="rag/chroma_db")
+    parser.add_argument("--shards", type=int, default=4, help="Number of shards to build")
+    parser.add_argument("--timeout", type=float, default=0.5, help="Per-query shard timeout in seconds")
+    parser.add_argument("-k", type=int, default=5)
+    args = parser.parse_args()
+
+    rag = ImprovedEnvironmentalLawRAG(persist_directory=args.persist_directory)
+    if args.command == "build":
+        if not rag.load_existing_vectorstore():
+            print("❌ No index found. Please run setup_rag_improved.py first.")
+            return 1
+        rag.build_shards(args.shards)
+        print(f"✅ Built {args.shards} shards")
+        return 0
+
+    if not args.text:
+        parser.error("query needs the query text")
+    if not rag.load_sharded_vectorstore(timeout=args.timeout):
+        print("❌ No sharded index found. Run the build command first.")
+        return 1
+    try:
+        results = rag.search_similar_documents(args.text, k=args.k)
+        for doc in results:
+            print(f"{doc['similarity_score']:.3f}  {doc['source']}")
+        if results.partial:
+            print("⚠️ Partial results: some shards did not answer in time")
+    finally:
+        rag.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,201 @@
+"""
+Slow-Query Log for Environmental Law RAG System
+Ring buffer of queries over a latency threshold, with stage timings and sampled profiles
+"""
+
+import io
+import os
+import time
+import random
+import logging
+import cProfile
+import pstats
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Iterator
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class QueryTrace:
+    """Timings and counters collected while one query runs."""
+
+    def __init__(self, query: str, k: Optional[int], endpoint: str):
+        self.query = query
+        self.k = k
+        self.endpoint = endpoint
+        self.stages: Dict[str, float] = {}
+        self.candidates = 0
+        self.cache: Optional[str] = None
+
+
+# The trace of the query running in the current thread or task, if it is being traced
+_active_trace: ContextVar[Optional[QueryTrace]] = ContextVar("rag_query_trace", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a stage of the query path.
+
+    Stages repeated within one query add up. Outside a traced query this
+    costs one context variable lookup.
+    """
+    trace = _active_trace.get()
+    if trace is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        trace.stages[name] = trace.stages.get(name, 0.0) + elapsed_ms
+
+
+def record(candidates: Optional[int] = None, cache: Optional[str] = None):
+    """Count scored candidates or set the cache status ('hit'/'miss') of the traced query."""
+    trace = _active_trace.get()
+    if trace is None:
+        return
+    if candidates is not None:
+        trace.candidates += int(candidates)
+    if cache is not None:
+        trace.cache = cache
+
+
+class SlowQueryLog:
+    """
+    Bounded log of queries slower than a threshold.
+
+    Every traced query collects per-stage timings, the number of candidates
+    scored and its cache status; only those over threshold_ms are kept, in
+    a ring buffer of the latest `capacity` entries. A profile_rate fraction
+    of queries also runs under cProfile, and the profile is attached to the
+    entry if the query turns out to be slow. One query is profiled at a time.
+    """
+
+    def __init__(self,
+                 threshold_ms: float = 1000.0,
+                 capacity: int = 100,
+                 profile_rate: float = 0.0,
+                 profile_lines: int = 30):
+        """
+        Args:
+            threshold_ms: Queries taking at least this long are logged
+            capacity: Number of slow queries kept
+            profile_rate: Fraction of queries run under cProfile (0 disables)
+            profile_lines: Functions listed in an attached profile
+        """
+        self.threshold_ms = threshold_ms
+        self.capacity = capacity
+        self.profile_rate = profile_rate
+        self.profile_lines = profile_lines
+        self.traced = 0
+        self.slow = 0
+        self._entries = deque(maxlen=capacity)
+        self._lock = threading.Lock()
+        self._profile_lock = threading.Lock()
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        if self.profile_rate <= 0 or random.random() >= self.profile_rate:
+            return None
+        if not self._profile_lock.acquire(blocking=False):
+            return None
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is active in this process
+            self._profile_lock.release()
+            return None
+        return profiler
+
+    def _finish_profile(self, profiler: cProfile.Profile, keep: bool) -> Optional[str]:
+        profiler.disable()
+        self._profile_lock.release()
+        if not keep:
+            return None
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(self.profile_lines)
+        return stream.getvalue()
+
+    @contextmanager
+    def trace(self, query: str, k: Optional[int] = None, endpoint: str = "query") -> Iterator[QueryTrace]:
+        """Trace one query; it is logged on exit if it was slow."""
+        trace = QueryTrace(query, k, endpoint)
+        token = _active_trace.set(trace)
+        profiler = self._start_profile()
+        started = time.perf_counter()
+        try:
+            yield trace
+        finally:
+            total_ms = (time.perf_counter() - started) * 1000
+            is_slow = total_ms >= self.threshold_ms
+            profile = self._finish_profile(profiler, keep=is_slow) if profiler is not None else None
+            _active_trace.reset(token)
+            with self._lock:
+                self.traced += 1
+                if is_slow:
+                    self.slow += 1
+                    self._entries.append(self._entry(trace, total_ms, profile))
+            if is_slow:
+                logger.warning(f"Slow {endpoint} ({total_ms:.0f} ms): {query[:80]!r}")
+
+    @staticmethod
+    def _entry(trace: QueryTrace, total_ms: float, profile: Optional[str]) -> Dict[str, Any]:
+        entry = {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "endpoint": trace.endpoint,
+            "query": trace.query,
+            "k": trace.k,
+            "total_ms": round(total_ms, 2),
+            "stages_ms": {name: round(ms, 2) for name, ms in trace.stages.items()},
+            "candidates_scored": trace.candidates,
+            "cache": trace.cache or "disabled",
+        }
+        if profile is not None:
+            entry["profile"] = profile
+        return entry
+
+    def entries(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Logged slow queries, newest first."""
+        with self._lock:
+            entries = list(reversed(self._entries))
+        return entries[:limit] if limit else entries
+
+    def to_dict(self, limit: Optional[int] = None) -> Dict[str, Any]:
+        with self._lock:
+            traced, slow = self.traced, self.slow
+        return {
+            "threshold_ms": self.threshold_ms,
+            "capacity": self.capacity,
+            "profile_rate": self.profile_rate,
+            "queries_traced": traced,
+            "slow_queries": slow,
+            "entries": self.entries(limit)
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+def slow_query_log_from_env() -> SlowQueryLog:
+    """
+    Slow-query log configured from the environment.
+
+    RAG_SLOW_QUERY_MS: latency threshold (default 1000)
+    RAG_SLOW_QUERY_LOG_SIZE: entries kept (default 100)
+    RAG_SLOW_QUERY_PROFILE_RATE: fraction of queries profiled with cProfile (default 0)
+    """
+    return SlowQueryLog(
+        threshold_ms=float(os.environ.get("RAG_SLOW_QUERY_MS", "1000")),
+        capacity=int(os.environ.get("RAG_SLOW_QUERY_LOG_SIZE", "100")),
+        profile_rate=float(os.environ.get("RAG_SLOW_QUERY_PROFILE_RATE", "0"))
+    )
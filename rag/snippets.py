@@ -0,0 +1,186 @@
+"""
+Snippets for Environmental Law RAG System
+Locates the best-matching passage of each hit and renders highlighted snippets
+"""
+
+import re
+import html
+import logging
+from typing import List, Dict, Any, Optional, Tuple, Callable
+
+from reranker import query_terms
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Characters of chunk text shown per snippet
+SNIPPET_CHARS = 240
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def term_spans(text: str, terms: List[str]) -> List[Tuple[int, int, int]]:
+    """
+    Character spans of query term occurrences, as (start, end, term index).
+
+    A word matches a term exactly or as a short inflection of it
+    ("pollution" / "pollutions", "industry" / "industrys" but not "industrial").
+    """
+    if not terms:
+        return []
+    index = {term: i for i, term in enumerate(terms)}
+    spans = []
+    for match in _WORD_PATTERN.finditer(text):
+        word = match.group().lower()
+        term_index = index.get(word)
+        if term_index is None:
+            for term, i in index.items():
+                if len(term) > 3 and word.startswith(term) and len(word) - len(term) <= 2:
+                    term_index = i
+                    break
+        if term_index is not None:
+            spans.append((match.start(), match.end(), term_index))
+    return spans
+
+
+def token_spans(text: str, positions: List[Tuple[int, int]]) -> List[Tuple[int, int, int]]:
+    """
+    Character spans of the words at the given positions, as (start, end, term index).
+
+    Positions count words the way the positional index does and must be
+    sorted; the text is only walked up to the last one.
+    """
+    spans = []
+    wanted = iter(positions)
+    target, term = next(wanted, (None, None))
+    for position, match in enumerate(_WORD_PATTERN.finditer(text)):
+        if target is None:
+            break
+        if position == target:
+            spans.append((match.start(), match.end(), term))
+            target, term = next(wanted, (None, None))
+    return spans
+
+
+def best_window(text: str, spans: List[Tuple[int, int, int]], window_chars: int = SNIPPET_CHARS) -> Tuple[int, int]:
+    """
+    Character offsets of the window covering the most distinct query terms.
+
+    A two-pointer sweep over the term spans finds the stretch of at most
+    window_chars with the most distinct terms (then the most occurrences),
+    which is then widened to window_chars and snapped to word boundaries.
+    """
+    if not spans:
+        return 0, _snap_end(text, min(len(text), window_chars))
+
+    counts: Dict[int, int] = {}
+    best = (0, 0, 0, 0)  # distinct terms, occurrences, first span, last span
+    left = 0
+    for right, (_, end, term) in enumerate(spans):
+        counts[term] = counts.get(term, 0) + 1
+        while end - spans[left][0] > window_chars:
+            left_term = spans[left][2]
+            counts[left_term] -= 1
+            if counts[left_term] == 0:
+                del counts[left_term]
+            left += 1
+        candidate = (len(counts), right - left + 1, left, right)
+        if candidate[:2] > best[:2]:
+            best = candidate
+
+    match_start = spans[best[2]][0]
+    match_end = spans[best[3]][1]
+    slack = max(0, window_chars - (match_end - match_start))
+    start = max(0, match_start - slack // 3)
+    end = min(len(text), max(match_end, start + window_chars))
+    start = max(0, min(start, end - window_chars))
+    return _snap_start(text, start, match_start), _snap_end(text, end)
+
+
+def _snap_start(text: str, start: int, limit: int) -> int:
+    """Move start forward to the beginning of a word, never past limit."""
+    if start == 0 or text[start - 1].isspace():
+        return start
+    boundary = text.find(" ", start, limit)
+    return boundary + 1 if boundary != -1 else start
+
+
+def _snap_end(text: str, end: int) -> int:
+    """Move end back to the end of a word."""
+    if end >= len(text) or text[end].isspace():
+        return end
+    boundary = text.rfind(" ", 0, end)
+    return boundary if boundary > 0 else end
+
+
+def annotate_matches(query: str, documents: List[Dict[str, Any]],
+                     window_chars: int = SNIPPET_CHARS,
+                     term_positions: Optional[Callable[[Dict[str, Any], List[str]], List[Tuple[int, int]]]] = None
+                     ) -> List[Dict[str, Any]]:
+    """
+    Add the best-matching window to each hit.
+
+    Each returned document carries 'match_offsets' ([start, end] character
+    offsets into its content) and 'match_spans' (term occurrences inside that
+    window), so callers can render a snippet without rescanning the text.
+
+    Args:
+        query: The search query
+        documents: Selected hits
+        window_chars: Snippet length
+        term_positions: Optional (document, terms) -> [(word position, term index)],
+            e.g. from PositionalIndex.term_positions(); without it the text is
+            scanned for the terms
+    """
+    terms = query_terms(query)
+    annotated = []
+    for doc in documents:
+        text = doc.get('content', '')
+        if term_positions is not None:
+            spans = token_spans(text, term_positions(doc, terms))
+        else:
+            spans = term_spans(text, terms)
+        start, end = best_window(text, spans, window_chars)
+        annotated.append(dict(
+            doc,
+            match_offsets=[start, end],
+            match_spans=[[s, e] for s, e, _ in spans if s >= start and e <= end]
+        ))
+    return annotated
+
+
+def render_snippet(doc: Dict[str, Any], query: Optional[str] = None,
+                   window_chars: int = SNIPPET_CHARS) -> str:
+    """
+    HTML snippet of a hit: the match window, escaped, with terms in <mark>.
+
+    Uses the offsets from annotate_matches(); documents without them are
+    annotated on the fly from the query.
+    """
+    if 'match_offsets' not in doc:
+        doc = annotate_matches(query or "", [doc], window_chars)[0]
+
+    text = doc.get('content', '')
+    start, end = doc['match_offsets']
+    parts = ["… " if start > 0 else ""]
+    position = start
+    for span_start, span_end in doc.get('match_spans', []):
+        parts.append(html.escape(text[position:span_start]))
+        parts.append(f"<mark>{html.escape(text[span_start:span_end])}</mark>")
+        position = span_end
+    parts.append(html.escape(text[position:end]))
+    parts.append(" …" if end < len(text) else "")
+    return " ".join("".join(parts).split())
+
+
+def snippet_payload(doc: Dict[str, Any], query: Optional[str] = None) -> Dict[str, Any]:
+    """API representation of a hit: every field except the full chunk text, plus the snippet."""
+    payload = {
+        # NumPy scores are converted so the payload can be serialized as JSON
+        key: value.item() if hasattr(value, 'item') else value
+        for key, value in doc.items()
+        if key not in ('content', 'match_spans', 'chunk_row')
+    }
+    payload['snippet'] = render_snippet(doc, query)
+    return payload
@@ -0,0 +1,297 @@
+"""
+Query Autocomplete for Environmental Law RAG System
+Sorted prefix index over vocabulary terms, section titles, act names and past queries
+"""
+
+import re
+import sys
+import json
+import math
+import heapq
+import logging
+import argparse
+from bisect import bisect_left
+from collections import Counter
+from typing import List, Dict, Any, Optional, Iterable, Tuple
+from pathlib import Path
+
+from query_log import QueryLog, query_log_path
+
+# Setup logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUGGEST_FILENAME = "suggest_index.json"
+
+# Multipliers on each source's raw counts; an act or a question users actually
+# asked is a better completion than a term that merely occurs in many chunks
+KIND_WEIGHTS = {"term": 1.0, "section": 5.0, "act": 10.0, "query": 20.0}
+
+# Prefixes up to this length match too many entries to rank per request,
+# so their top suggestions are ranked once at load time
+CACHED_PREFIX_LENGTH = 2
+MAX_SUGGESTIONS = 10
+
+# Sorts after every character a suggestion can contain
+_PREFIX_END = "\uffff"
+
+# Numbered section headings as extracted from the acts: "21. Restrictions on use of certain industrial plants.—"
+_SECTION_HEADING = re.compile(r"(?m)^\s*\d+[A-Z]{0,2}\.\s+([A-Z][A-Za-z ,'()-]{3,100}?)\.\s*[—–-]")
+
+
+def normalize(text: str) -> str:
+    """Lowercase with single spaces; a trailing space is kept so 'air ' only completes whole words."""
+    normalized = " ".join(text.lower().split())
+    return normalized + " " if normalized and text[-1:].isspace() else normalized
+
+
+def act_title(source: str) -> str:
+    """Readable act name from a PDF file name: 'air_act-1981.pdf' -> 'air act 1981'."""
+    return normalize(re.sub(r"[_-]+", " ", Path(source).stem))
+
+
+def section_titles(texts: Iterable[str]) -> Counter:
+    """Occurrences of each numbered section heading in the chunk texts."""
+    titles = Counter()
+    for text in texts:
+        titles.update(normalize(title) for title in _SECTION_HEADING.findall(text))
+    return titles
+
+
+def vocabulary_counts(vectorizer, num_chunks: int) -> Counter:
+    """
+    Chunk frequency of every vocabulary term starting with a letter.
+
+    Frequencies are recovered from the smoothed IDF weights,
+    idf = ln((1 + n) / (1 + df)) + 1. Hashing vectorizers have no
+    vocabulary and contribute nothing.
+    """
+    vocabulary = getattr(vectorizer, 'vocabulary_', None)
+    idf = getattr(vectorizer, 'idf_', None)
+    if not vocabulary or idf is None:
+        return Counter()
+    counts = Counter()
+    for term, column in vocabulary.items():
+        if term[:1].isalpha():
+            counts[term] = max(1, round((1 + num_chunks) / math.exp(idf[column] - 1) - 1))
+    return counts
+
+
+class SuggestIndex:
+    """
+    Autocomplete over a sorted array of suggestions.
+
+    Suggestions are normalized strings kept in sorted order next to their
+    weights and kinds, so all completions of a prefix form one contiguous
+    range found with two binary searches. The range is ranked by weight with
+    a bounded heap; for the short prefixes whose ranges are large the top
+    suggestions are precomputed, which keeps every lookup well under a
+    millisecond.
+    """
+
+    def __init__(self, texts: List[str], weights: List[float], kinds: List[str],
+                 queries: Optional[Dict[str, float]] = None,
+                 logged: Optional[Dict[str, float]] = None):
+        self.texts = texts
+        self.weights = weights
+        self.kinds = kinds
+        # Question counts added with add-queries, carried over when the index is rebuilt,
+        # and those read from the query log, which are read afresh on every rebuild
+        if queries is None:
+            queries = {text: weight / KIND_WEIGHTS["query"]
+                       for text, weight, kind in zip(texts, weights, kinds) if kind == "query"}
+        self.queries = queries
+        self.logged = logged or {}
+        self._top: Dict[str, List[int]] = {}
+        for length in range(1, CACHED_PREFIX_LENGTH + 1):
+            for prefix in {text[:length] for text in texts if len(text) >= length}:
+                self._top[prefix] = self._rank(prefix, MAX_SUGGESTIONS)
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    @classmethod
+    def from_counts(cls, counts: Dict[str, Counter], logged: Optional[Dict[str, int]] = None) -> "SuggestIndex":
+        """
+        Build from raw counts per kind ('term', 'section', 'act', 'query').
+
+        A text found by several sources gets the sum of its weighted counts
+        and the kind that contributed most. Logged questions count as
+        queries but are not carried over to the next build.
+        """
+        queries = _normalized_counts(counts.get("query", {}))
+        logged = _normalized_counts(logged or {})
+        counts = dict(counts, query=Counter(queries) + Counter(logged))
+        weights: Dict[str, float] = {}
+        kinds: Dict[str, Tuple[float, str]] = {}
+        for kind, kind_counts in counts.items():
+            for text, count in kind_counts.items():
+                text = normalize(text).strip()
+                if not text or count <= 0:
+                    continue
+                weight = count * KIND_WEIGHTS[kind]
+                weights[text] = weights.get(text, 0.0) + weight
+                if weight > kinds.get(text, (0.0, ""))[0]:
+                    kinds[text] = (weight, kind)
+        texts = sorted(weights)
+        return cls(texts, [weights[text] for text in texts], [kinds[text][1] for text in texts], queries, logged)
+
+    @classmethod
+    def build(cls,
+              vectorizer=None,
+              metadata_store=None,
+              texts: Optional[Iterable[str]] = None,
+              queries: Optional[Dict[str, int]] = None,
+              logged: Optional[Dict[str, int]] = None) -> "SuggestIndex":
+        """
+        Build from an index's vocabulary, act names and section titles.
+
+        Args:
+            vectorizer: Fitted TF-IDF vectorizer whose vocabulary is suggested
+            metadata_store: ChunkMetadataStore naming the acts and their chunk counts
+            texts: Chunk texts scanned for section headings
+            queries: Past questions and how often they were asked, kept across rebuilds
+            logged: Questions from the query log and their counts
+        """
+        counts = {"term": Counter(), "section": Counter(), "act": Counter(), "query": Counter(queries or {})}
+        if metadata_store is not None:
+            if vectorizer is not None:
+                counts["term"] = vocabulary_counts(vectorizer, len(metadata_store))
+            for doc_id, chunks in Counter(metadata_store.doc_id.tolist()).items():
+                source = metadata_store.documents[doc_id].get('source')
+                if source:
+                    counts["act"][act_title(source)] += chunks
+        if texts is not None:
+            counts["section"] = section_titles(texts)
+        index = cls.from_counts(counts, logged)
+        logger.info(f"Built suggestion index with {len(index)} entries")
+        return index
+
+    def _rank(self, prefix: str, limit: int) -> List[int]:
+        start = bisect_left(self.texts, prefix)
+        end = bisect_left(self.texts, prefix + _PREFIX_END, start)
+        if end - start <= limit:
+            return sorted(range(start, end), key=lambda i: -self.weights[i])
+        return heapq.nlargest(limit, range(start, end), key=self.weights.__getitem__)
+
+    def suggest(self, prefix: str, limit: int = MAX_SUGGESTIONS) -> List[Dict[str, Any]]:
+        """Completions of a prefix, most frequent first."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        if len(prefix) <= CACHED_PREFIX_LENGTH and limit <= MAX_SUGGESTIONS:
+            ids = self._top.get(prefix, [])[:limit]
+        else:
+            ids = self._rank(prefix, limit)
+        return [{"text": self.texts[i], "kind": self.kinds[i], "weight": self.weights[i]} for i in ids]
+
+    def with_queries(self, queries: Dict[str, int]) -> "SuggestIndex":
+        """A copy with past questions added to the existing suggestions."""
+        counts = {kind: Counter() for kind in KIND_WEIGHTS}
+        for text, weight, kind in zip(self.texts, self.weights, self.kinds):
+            if kind != "query":
+                asked = self.queries.get(text, 0) + self.logged.get(text, 0)
+                counts[kind][text] += (weight - asked * KIND_WEIGHTS["query"]) / KIND_WEIGHTS[kind]
+        counts["query"].update(self.queries)
+        counts["query"].update(queries)
+        return self.from_counts(counts, self.logged)
+
+    def save(self, directory: Path):
+        with open(Path(directory) / SUGGEST_FILENAME, 'w', encoding='utf-8') as f:
+            json.dump({
+                "texts": self.texts,
+                "weights": self.weights,
+                "kinds": self.kinds,
+                "queries": self.queries,
+                "logged": self.logged
+            }, f)
+
+    @classmethod
+    def load(cls, directory: Path) -> Optional["SuggestIndex"]:
+        path = Path(directory) / SUGGEST_FILENAME
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data["texts"], data["weights"], data["kinds"], data.get("queries"), data.get("logged"))
+
+    @staticmethod
+    def remove(directory: Path):
+        """Delete saved suggestions, e.g. when the index they were drawn from is rebuilt."""
+        (Path(directory) / SUGGEST_FILENAME).unlink(missing_ok=True)
+
+
+def _normalized_counts(counts: Dict[str, float]) -> Dict[str, float]:
+    normalized: Dict[str, float] = {}
+    for text, count in counts.items():
+        text = normalize(text).strip()
+        if text and count > 0:
+            normalized[text] = normalized.get(text, 0) + count
+    return normalized
+
+
+def saved_queries(directory: Path) -> Dict[str, float]:
+    """Questions added with add-queries to the suggestions saved in a directory, kept when it is rebuilt."""
+    try:
+        saved = SuggestIndex.load(directory)
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"Ignoring unreadable suggestion index in {directory}: {e}")
+        return {}
+    return saved.queries if saved is not None else {}
+
+
+def logged_queries(directory: Path) -> Dict[str, int]:
+    """Questions in the query log of an index root (see query_log.py) and how often they were asked."""
+    path = query_log_path(directory)
+    if path is None or not path.exists():
+        return {}
+    return QueryLog(path).counts()
+
+
+def load_query_counts(path: Path) -> Counter:
+    """
+    Past questions from a file with one JSON string or {"question": ..., "count": n} object per line.
+    """
+    counts = Counter()
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if isinstance(record, str):
+                record = {"question": record}
+            counts[normalize(record["question"]).strip()] += int(record.get("count", 1))
+    return counts
+
+
+def main():
+    """Add past questions to a saved suggestion index or try prefixes against it."""
+    parser = argparse.ArgumentParser(description="Query autocomplete index")
+    parser.add_argument("--persist-directory", default="rag/chroma_db")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    add_parser = subparsers.add_parser("add-queries", help="Add popular past questions to the suggestions")
+    add_parser.add_argument("queries", type=Path, help="JSONL with questions and optional counts")
+
+    suggest_parser = subparsers.add_parser("suggest", help="Print the suggestions for prefixes")
+    suggest_parser.add_argument("prefixes", nargs="+")
+    suggest_parser.add_argument("--limit", type=int, default=MAX_SUGGESTIONS)
+
+    args = parser.parse_args()
+    index = SuggestIndex.load(args.persist_directory)
+    if index is None:
+        logger.error(f"No suggestion index in {args.persist_directory}; rebuild the index first")
+        sys.exit(1)
+
+    if args.command == "add-queries":
+        queries = load_query_counts(args.queries)
+        index = index.with_queries(queries)
+        index.save(args.persist_directory)
+        logger.info(f"Added {len(queries)} questions; {len(index)} suggestions saved")
+    else:
+        for prefix in args.prefixes:
+            print(json.dumps({"prefix": prefix, "suggestions": index.suggest(prefix, limit=args.limit)}))
+
+
+if __name__ == "__main__":
+    main()
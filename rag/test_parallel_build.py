@@ -0,0 +1,41 @@
+"""
+Tests for the parallel map-reduce TF-IDF build
+Run with: python -m pytest rag/test_parallel_build.py
+"""
+
+import sys
+import random
+from pathlib import Path
+
+import numpy as np
+
+# Add the rag directory to Python path
+sys.path.append(str(Path(__file__).parent))
+
+from parallel_build import compare_builds, limit_vocabulary
+from legal_tokenizer import tfidf_vectorizer_params
+
+
+def synthetic_texts(count=600, seed=0):
+    rng = random.Random(seed)
+    words = [f"term{i}" for i in range(400)] + "air water pollution board consent section penalty".split()
+    return [" ".join(rng.choice(words) for _ in range(rng.randint(50, 150))) for _ in range(count)]
+
+
+def test_matches_single_process_with_engine_params():
+    result = compare_builds(synthetic_texts(), tfidf_vectorizer_params(), workers=4)
+    assert result["matches"]
+    assert result["max_difference"] < 1e-12
+
+
+def test_matches_single_process_with_default_params():
+    params = dict(max_features=5000, stop_words='english', ngram_range=(1, 2), min_df=2, max_df=0.8)
+    assert compare_builds(synthetic_texts(), params, workers=3)["matches"]
+
+
+def test_limit_vocabulary_keeps_most_frequent_terms():
+    document_frequency = {"a": 3, "b": 2, "c": 1, "d": 3}
+    term_frequency = {"a": 9, "b": 2, "c": 1, "d": 5}
+    vocabulary, dfs = limit_vocabulary(document_frequency, term_frequency, 4, min_df=2, max_features=2)
+    assert vocabulary == {"a": 0, "d": 1}
+    assert np.array_equal(dfs, [3, 3])
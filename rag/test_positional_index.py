@@ -0,0 +1,69 @@
+"""
+Tests for the positional index behind phrase and NEAR/k queries
+Run with: python -m pytest rag/test_positional_index.py
+"""
+
+import sys
+from pathlib import Path
+
+# Add the rag directory to Python path
+sys.path.append(str(Path(__file__).parent))
+
+from positional_index import PositionalIndex
+
+TEXTS = [
+    "grant consent to establish a plant",
+    "establish the board",
+    "to be or not to be to go to",
+    "consent to operate",
+    "to to to",
+]
+
+
+def build_index():
+    return PositionalIndex.build(TEXTS)
+
+
+def doc_ids(results):
+    return [doc_id for doc_id, _, _ in results]
+
+
+def test_phrase_of_three_terms():
+    """Documents missing a later-probed term must be skipped, not raise KeyError."""
+    assert doc_ids(build_index().search('"consent to establish"')) == [0]
+
+
+def test_phrase_requires_adjacent_terms():
+    index = build_index()
+    assert doc_ids(index.search('"to establish"')) == [0]
+    assert index.search('"establish to"') == []
+
+
+def test_phrase_counts_every_occurrence():
+    results = build_index().search('"to be"')
+    assert doc_ids(results) == [2]
+    assert results[0][2] == 2
+
+
+def test_near_within_distance():
+    index = build_index()
+    assert doc_ids(index.search('consent NEAR/1 operate')) == [3]
+    assert doc_ids(index.search('"to be" NEAR/3 go')) == [2]
+    assert index.search('grant NEAR/1 plant') == []
+
+
+def test_missing_term():
+    index = build_index()
+    assert index.search('"consent to fly"') == []
+    assert index.search('consent NEAR/2 aircraft') == []
+
+
+def test_save_and_load(tmp_path):
+    build_index().save(tmp_path)
+    assert doc_ids(PositionalIndex.load(tmp_path).search('"consent to establish"')) == [0]
+
+
+def test_term_positions_include_short_inflections():
+    index = PositionalIndex.build(["Pollution and pollutions, not polluting.", "no match"])
+    assert index.term_positions(0, ["pollution", "and"]) == [(0, 0), (1, 1), (2, 0)]
+    assert index.term_positions(1, ["pollution"]) == []
@@ -0,0 +1,72 @@
+"""
+Tests for scatter-gather search over index shards
+Run with: python -m pytest rag/test_sharded_search.py
+"""
+
+import sys
+import random
+from pathlib import Path
+
+import pytest
+
+# Add the rag directory to Python path
+sys.path.append(str(Path(__file__).parent))
+
+from rag_improved import ImprovedEnvironmentalLawRAG
+
+SOURCES = ["air_act-1981.pdf", "water_act-1974.pdf", "environment_act-1986.pdf"]
+QUERIES = ["penalty for air pollution", "consent of the board", "water pollution section"]
+
+
+def synthetic_chunks(count=300, seed=0):
+    rng = random.Random(seed)
+    words = [f"term{i}" for i in range(200)] + "air water pollution board consent section penalty".split()
+    chunks = []
+    for i in range(count):
+        source = SOURCES[i % len(SOURCES)]
+        chunks.append({
+            'content': f"--- Page {i % 20 + 1} ---\n" + " ".join(rng.choice(words) for _ in range(rng.randint(30, 80))),
+            'metadata': {'source': source, 'document_type': 'act', 'chunk_id': f"{source}_chunk_{i}",
+                         'chunk_index': i}
+        })
+    return chunks
+
+
+@pytest.fixture(scope="module")
+def engines(tmp_path_factory):
+    directory = tmp_path_factory.mktemp("index")
+    builder = ImprovedEnvironmentalLawRAG(persist_directory=str(directory))
+    builder.create_vectorstore(synthetic_chunks())
+    builder.build_shards(3)
+
+    unsharded = ImprovedEnvironmentalLawRAG(persist_directory=str(directory))
+    assert unsharded.load_existing_vectorstore()
+    sharded = ImprovedEnvironmentalLawRAG(persist_directory=str(directory))
+    assert sharded.load_sharded_vectorstore(timeout=30)
+    yield unsharded, sharded
+    sharded.close()
+
+
+def ranking(results):
+    return [(doc['metadata']['chunk_id'], round(doc['similarity_score'], 5)) for doc in results]
+
+
+@pytest.mark.parametrize("filters", [None, {"source": "water_act-1974.pdf"}, {"page": (3, 5)}])
+def test_sharded_matches_unsharded_with_filters(engines, filters):
+    unsharded, sharded = engines
+    for query in QUERIES:
+        expected = unsharded.search_similar_documents(query, k=5, filters=filters)
+        results = sharded.search_similar_documents(query, k=5, filters=filters)
+        assert len(expected) == 5
+        assert ranking(results) == ranking(expected)
+        assert not results.partial
+
+
+def test_sharded_min_score_and_filters(engines):
+    unsharded, sharded = engines
+    filters = {"source": "air_act-1981.pdf"}
+    for query in QUERIES:
+        cutoff = unsharded.search_similar_documents(query, k=3, filters=filters)[-1]['similarity_score']
+        # Shards score in float32, so allow for rounding at the cutoff
+        results = sharded.search_similar_documents(query, k=10, filters=filters, min_score=cutoff - 1e-6)
+        assert ranking(results) == ranking(unsharded.search_similar_documents(query, k=3, filters=filters))
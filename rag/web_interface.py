@@ -3,29 +3,89 @@ Web Interface for Environmental Law RAG System
 A Flask-based web interface for querying the RAG system
 """
 
-from flask import Flask, render_template, request, jsonify
+from flask import Flask, render_template, request, jsonify, Response, stream_with_context
 import os
+import json
 import sys
+from contextlib import contextmanager
 from pathlib import Path
 
 # Add the rag directory to Python path
 sys.path.append(str(Path(__file__).parent))
 
 from rag import EnvironmentalLawRAG
+from reranker import reranker_from_env
+from semantic_cache import cache_settings_from_env
+from snippets import snippet_payload
+from index_snapshots import SnapshotManager, current_version
+from slow_query_log import slow_query_log_from_env
+from query_log import query_log_from_env, warmup_count_from_env, start_replay
 
 app = Flask(__name__)
 
 # Initialize RAG system
 rag_system = None
+# Serves versioned index snapshots with hot reload once one has been published
+snapshot_manager = None
+INDEX_ROOT = Path(os.environ.get('RAG_INDEX_ROOT', 'rag/chroma_db'))
+# Queries over RAG_SLOW_QUERY_MS, with stage timings, served at /api/debug/slow
+slow_query_log = slow_query_log_from_env()
+# Frequent questions weighted by recency, replayed after a restart to warm caches
+query_log = query_log_from_env(INDEX_ROOT)
+
+def load_rag_system(persist_directory=None):
+    """Create, load and configure a RAG system; None if there is no index"""
+    kwargs = {'persist_directory': str(persist_directory)} if persist_directory else {}
+    system = EnvironmentalLawRAG(**kwargs)
+    # Snapshots are immutable; derived files missing from one are rebuilt in memory only
+    if not system.load_existing_vectorstore(read_only=persist_directory is not None):
+        return None
+    system.setup_qa_chain()
+    # Optional second-stage re-ranking, configured through RAG_RERANKERS
+    system.reranker = reranker_from_env(encoder=getattr(system, 'embeddings', None))
+    # Semantic answer cache for paraphrased questions (RAG_ANSWER_CACHE_SIZE=0 disables)
+    cache_settings = cache_settings_from_env()
+    if cache_settings:
+        system.enable_answer_cache(**cache_settings)
+    return system
 
 def initialize_rag():
     """Initialize the RAG system"""
-    global rag_system
-    if rag_system is None:
-        rag_system = EnvironmentalLawRAG()
-        if not rag_system.load_existing_vectorstore():
-            return False
-    return True
+    global rag_system, snapshot_manager
+    if rag_system is None and snapshot_manager is None:
+        if current_version(INDEX_ROOT):
+            manager = SnapshotManager(
+                INDEX_ROOT,
+                loader=load_rag_system,
+                poll_interval=float(os.environ.get('RAG_SNAPSHOT_POLL_SECONDS', '5')),
+                warmup=lambda system: system.search_similar_documents("environmental protection", k=1)
+            )
+            if manager.load_current():
+                manager.start()
+                snapshot_manager = manager
+                return True
+        rag_system = load_rag_system()
+    return rag_system is not None or snapshot_manager is not None
+
+def warm_up():
+    """Load the index, then replay the most frequent logged questions in the background"""
+    if not initialize_rag() or query_log is None:
+        return
+    
+    def ask(question):
+        with acquire_rag() as rag:
+            rag.query(question)
+    
+    start_replay(query_log.top(warmup_count_from_env()), ask)
+
+@contextmanager
+def acquire_rag():
+    """Pin the RAG system for one request; a hot-swapped snapshot stays alive until released"""
+    if snapshot_manager is not None:
+        with snapshot_manager.acquire() as system:
+            yield system
+    else:
+        yield rag_system
 
 @app.route('/')
 def index():
@@ -48,27 +108,66 @@ def query_rag():
             return jsonify({'error': 'No question provided'}), 400
         
         # Query the RAG system
-        result = rag_system.query(question)
+        with acquire_rag() as rag, slow_query_log.trace(question, k=5, endpoint='query'):
+            result = rag.query(question)
         
         if 'error' in result:
             return jsonify({'error': result['error']}), 500
         
+        if query_log is not None:
+            query_log.record(question)
+        
         return jsonify({
             'question': result['question'],
             'answer': result['answer'],
             'sources': [
-                {
-                    'source': doc['source'],
-                    'content': doc['content'][:200] + '...' if len(doc['content']) > 200 else doc['content'],
-                    'metadata': doc['metadata']
-                }
+                snippet_payload(doc, question)
                 for doc in result['source_documents']
-            ]
+            ],
+            'citations': result.get('citations', [])
         })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/query/stream', methods=['POST'])
+def query_rag_stream():
+    """API endpoint streaming the answer as server-sent events (sources first, then tokens)"""
+    if not initialize_rag():
+        return jsonify({
+            'error': 'RAG system not initialized. Please run setup_rag.py first.'
+        }), 500
+    
+    data = request.get_json()
+    question = data.get('question', '').strip()
+    
+    if not question:
+        return jsonify({'error': 'No question provided'}), 400
+    
+    if query_log is not None:
+        query_log.record(question)
+    
+    def generate():
+        with acquire_rag() as rag:
+            yield from stream_events(rag, question)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+def stream_events(rag, question):
+    """Format stream_query() events as server-sent events"""
+    for event in rag.stream_query(question):
+        payload = event['data']
+        if event['event'] == 'sources':
+            payload = [
+                snippet_payload(doc, question)
+                for doc in payload
+            ]
+        yield f"event: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+
 @app.route('/api/search', methods=['POST'])
 def search_documents():
     """API endpoint for searching similar documents"""
@@ -81,16 +180,19 @@ def search_documents():
         data = request.get_json()
         query = data.get('query', '').strip()
         k = data.get('k', 5)
+        # MMR diversification strength: 0 = pure relevance, 1 = maximum novelty
+        diversity = min(max(float(data.get('diversity', 0.0)), 0.0), 1.0)
         
         if not query:
             return jsonify({'error': 'No search query provided'}), 400
         
         # Search for similar documents
-        results = rag_system.search_similar_documents(query, k=k)
+        with acquire_rag() as rag, slow_query_log.trace(query, k=k, endpoint='search'):
+            results = rag.search_similar_documents(query, k=k, diversity=diversity)
         
         return jsonify({
             'query': query,
-            'results': results
+            'results': [snippet_payload(doc, query) for doc in results]
         })
         
     except Exception as e:
@@ -105,12 +207,19 @@ def get_stats():
                 'error': 'RAG system not initialized. Please run setup_rag.py first.'
             }), 500
         
-        stats = rag_system.get_document_statistics()
+        with acquire_rag() as rag:
+            stats = rag.get_document_statistics()
         return jsonify(stats)
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/debug/slow')
+def get_slow_queries():
+    """API endpoint listing recent slow queries with per-stage timings"""
+    limit = request.args.get('limit', type=int)
+    return jsonify(slow_query_log.to_dict(limit))
+
 if __name__ == '__main__':
     # Create templates directory if it doesn't exist
     templates_dir = Path(__file__).parent / 'templates'
@@ -282,32 +391,70 @@ if __name__ == '__main__':
             btn.textContent = 'Asking...';
             results.innerHTML = '<div class="loading">Processing your question...</div>';
             
-            fetch('/api/query', {
+            let sourcesHtml = '';
+            let answerText = '';
+            
+            function render() {
+                results.innerHTML = '<div class="answer"><strong>Answer:</strong><br>' + answerText + '</div>' + sourcesHtml;
+            }
+            
+            function handleEvent(name, data) {
+                if (name === 'sources') {
+                    if (data.length > 0) {
+                        sourcesHtml = '<div class="sources"><strong>Sources:</strong>';
+                        data.forEach(source => {
+                            sourcesHtml += '<div class="source-item">' +
+                                '<div class="source-title">' + source.source + '</div>' +
+                                '<div>' + source.snippet + '</div>' +
+                                '</div>';
+                        });
+                        sourcesHtml += '</div>';
+                    }
+                    render();
+                } else if (name === 'token') {
+                    answerText += data;
+                    render();
+                } else if (name === 'error') {
+                    results.innerHTML = '<div class="error">Error: ' + data + '</div>';
+                }
+            }
+            
+            // Read the server-sent event stream: sources arrive first, then answer tokens
+            fetch('/api/query/stream', {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
                 body: JSON.stringify({ question: question })
             })
-            .then(response => response.json())
-            .then(data => {
-                if (data.error) {
-                    results.innerHTML = '<div class="error">Error: ' + data.error + '</div>';
-                } else {
-                    let html = '<div class="answer"><strong>Answer:</strong><br>' + data.answer + '</div>';
+            .then(async response => {
+                if (!response.ok) {
+                    const data = await response.json();
+                    throw new Error(data.error || response.statusText);
+                }
+                
+                const reader = response.body.getReader();
+                const decoder = new TextDecoder();
+                let buffer = '';
+                
+                while (true) {
+                    const { value, done } = await reader.read();
+                    if (done) break;
+                    buffer += decoder.decode(value, { stream: true });
                     
-                    if (data.sources && data.sources.length > 0) {
-                        html += '<div class="sources"><strong>Sources:</strong>';
-                        data.sources.forEach(source => {
-                            html += '<div class="source-item">' +
-                                '<div class="source-title">' + source.source + '</div>' +
-                                '<div>' + source.content + '</div>' +
-                                '</div>';
+                    let boundary;
+                    while ((boundary = buffer.indexOf('\\n\\n')) !== -1) {
+                        const message = buffer.slice(0, boundary);
+                        buffer = buffer.slice(boundary + 2);
+                        
+                        let name = 'message';
+                        let data = '';
+                        message.split('\\n').forEach(line => {
+                            if (line.startsWith('event: ')) name = line.slice(7);
+                            else if (line.startsWith('data: ')) data += line.slice(6);
                         });
-                        html += '</div>';
+                        handleEvent(name, JSON.parse(data));
                     }
-                    
-                    results.innerHTML = html;
                 }
             })
             .catch(error => {
@@ -350,7 +497,7 @@ if __name__ == '__main__':
                             html += '<div class="source-item">' +
                                 '<div class="source-title">' + (index + 1) + '. ' + result.source + 
                                 ' (Score: ' + result.similarity_score.toFixed(3) + ')</div>' +
-                                '<div>' + result.content + '</div>' +
+                                '<div>' + result.snippet + '</div>' +
                                 '</div>';
                         });
                     }
@@ -393,5 +540,9 @@ if __name__ == '__main__':
     print("Open your browser and go to: http://localhost:5000")
     print("Press Ctrl+C to stop the server")
     
+    # The debug reloader serves from a child process; warm that one, not the watcher
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        warm_up()
+    
     app.run(debug=True, host='0.0.0.0', port=5000)
 